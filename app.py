@@ -1,11 +1,105 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, Request, render_template, request, redirect, url_for, jsonify, abort, Response, stream_with_context, send_file, current_app
 import os
+import json
+import math
+import shutil
+import tempfile
+import uuid
+from functools import lru_cache
 from werkzeug.utils import secure_filename
-from validador_gabaritos import ValidadorProdutos
+from fila_validacao import FilaValidacao, CONCLUIDO, ERRO
+from validador_gabaritos import aquecer_validacao
+import tabela_ncm
+from cache_resultados import CacheResultados
+from pasta_uploads import PastaUploads
+from regras_validacao import listar_perfis
+from lote_validacao import extrair_zip, nome_unico, LoteInvalido
+from metricas import RegistroMetricas
 import glob
 from config import config
 
+# Cada arquivo do formulário fica em memória até UPLOAD_MEMORIA_MAX_BYTES; acima disso vai para um temporário
+class RequisicaoUpload(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=current_app.config['UPLOAD_MEMORIA_MAX_BYTES'])
+
 app = Flask(__name__)
+app.request_class = RequisicaoUpload
+
+# Métricas do processo web, expostas em /metrics (formato Prometheus). criar_app as compartilha entre os
+# workers do gunicorn pela pasta METRICAS_PASTA: qualquer worker responde com o total de todos
+metricas = RegistroMetricas()
+UPLOADS = metricas.contador('validador_uploads_total', "Envios recebidos (arquivo único ou lote)", ('tipo',))
+BYTES_PLANILHA = metricas.histograma('validador_planilha_bytes', "Tamanho das planilhas recebidas",
+                                     (64 * 1024, 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2, 200 * 1024 ** 2))
+JOBS = metricas.contador('validador_jobs_total', "Validações terminadas", ('status', 'cache'))
+LINHAS = metricas.contador('validador_linhas_total', "Linhas validadas (sem contar o cache)")
+ERROS = metricas.contador('validador_erros_total', "Erros de validação encontrados (sem contar o cache)")
+DURACAO = metricas.histograma('validador_validacao_segundos', "Duração de cada validação",
+                              (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+DURACAO_ETAPA = metricas.histograma('validador_etapa_segundos', "Duração de cada etapa da validação",
+                                    (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 30), ('etapa',))
+MEMORIA = metricas.histograma('validador_pico_memoria_bytes', "Pico de memória residente de cada validação",
+                              (128 * 1024 ** 2, 256 * 1024 ** 2, 512 * 1024 ** 2, 1024 ** 3, 2 * 1024 ** 3, 4 * 1024 ** 3))
+
+def registrar_job(job_id, resumo):
+    JOBS.inc(status=resumo['status'], cache='hit' if resumo['cache_hit'] else 'miss')
+    medidas = resumo['metricas']
+    if resumo['cache_hit'] or not medidas:
+        return
+    LINHAS.inc(resumo['linhas'])
+    ERROS.inc(resumo['erros'])
+    DURACAO.observar(medidas['segundos'])
+    if medidas['pico_memoria_mb']:
+        MEMORIA.observar(medidas['pico_memoria_mb'] * 1024 ** 2)
+    for etapa in medidas['etapas']:
+        DURACAO_ETAPA.observar(etapa['segundos'], etapa=etapa['etapa'])
+
+# Fila de validações em segundo plano (criada no primeiro upload)
+fila = None
+
+def obter_fila():
+    global fila
+    if fila is None:
+        cache = None
+        if app.config['CACHE_ENABLED']:
+            cache = CacheResultados(
+                app.config['CACHE_FOLDER'],
+                tamanho_maximo=app.config['CACHE_MAX_BYTES'],
+                ttl=app.config['CACHE_TTL_SECONDS'],
+            )
+        fila = FilaValidacao(
+            app.config['JOBS_FOLDER'],
+            max_workers=app.config['JOB_WORKERS'],
+            limite_streaming=app.config['LIMITE_STREAMING_BYTES'],
+            tamanho_bloco=app.config['TAMANHO_BLOCO_STREAMING'],
+            cache=cache,
+            gerar_corrigido=app.config['GERAR_PLANILHA_CORRIGIDA'],
+            pasta_cprofile=app.config['CPROFILE_PASTA'] if app.config['CPROFILE_ATIVO'] else None,
+            ao_concluir=registrar_job,
+            tamanho_maximo=app.config['JOBS_MAX_BYTES'],
+            idade_maxima=app.config['JOBS_TTL_SECONDS'],
+            idade_minima=app.config['JOBS_IDADE_MINIMA_SECONDS'],
+        )
+    return fila
+
+# Uploads guardados em disco (os grandes e os lotes), com cota e idade máxima
+uploads = None
+
+def obter_uploads():
+    global uploads
+    if uploads is None:
+        uploads = PastaUploads(
+            app.config['UPLOAD_FOLDER'],
+            tamanho_maximo=app.config['UPLOAD_MAX_BYTES'],
+            idade_maxima=app.config['UPLOAD_TTL_SECONDS'],
+            idade_minima=app.config['UPLOAD_IDADE_MINIMA_SECONDS'],
+        )
+    return uploads
+
+# Clientes de API (Accept: application/json) recebem JSON em vez de HTML
+def quer_json():
+    return request.accept_mimetypes.best == 'application/json'
 
 # Função para verificar se a extensão do arquivo é permitida
 def allowed_file(filename):
@@ -20,48 +114,294 @@ def index():
             return redirect(request.url)
         file = request.files['file']
         
+        # Vários arquivos ou um .zip no mesmo envio viram um lote
+        arquivos = [arquivo for arquivo in request.files.getlist('file') if arquivo.filename]
+        lote = len(arquivos) > 1 or file.filename.lower().endswith('.zip')
+        
         # Se o arquivo não tiver nome ou for inválido, retorna um erro
-        if file.filename == '' or not allowed_file(file.filename):
+        if file.filename == '' or not (lote or allowed_file(file.filename)):
             return redirect(request.url)
         
-        # Cria o diretório de uploads se não existir
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        # Salva o arquivo no diretório de uploads
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-
-        # Captura os logs durante a validação
-        logs = []
+        # Gabarito de regras escolhido (ou o padrão da configuração)
+        perfil = request.form.get('perfil') or app.config['PERFIL_PADRAO']
+        if perfil not in listar_perfis():
+            if quer_json():
+                return jsonify({'erro': f"Perfil de regras desconhecido: {perfil}", 'perfis': listar_perfis()}), 400
+            return redirect(request.url)
         
-        # Adiciona mensagens de log ao longo da execução
-        def log_message(message):
-            logs.append(message)
+        if lote:
+            return enviar_lote(arquivos, perfil)
         
-        try:
-            # Cria um objeto do ValidadorProdutos e executa a validação
-            validador = ValidadorProdutos(file_path, log_callback=log_message)
-            resultado = validador.executar_validacao_completa()
-            
-            # Verifica se o resultado é válido
-            if not resultado or 'resumo' not in resultado:
-                logs.append("❌ Erro: Não foi possível processar o arquivo")
-                resultado = None
-                
-        except Exception as e:
-            logs.append(f"❌ Erro durante o processamento: {str(e)}")
-            resultado = None
-
-        # Passa os logs para o template
-        return render_template('resultado.html', resultado=resultado, logs=logs)
-    
-    return render_template('index.html')
+        # O nome enviado só vale como nome de exibição; nunca vira caminho
+        filename = secure_filename(file.filename) or f"planilha.{file.filename.rsplit('.', 1)[1].lower()}"
+        tamanho = file.stream.seek(0, os.SEEK_END)
+        UPLOADS.inc(tipo='arquivo')
+        BYTES_PLANILHA.observar(tamanho)
+
+        # A validação roda em segundo plano; a resposta volta na hora com o id do job.
+        # Arquivo pequeno vai em memória para o worker; o grande é guardado pelo hash do conteúdo
+        if tamanho <= app.config['UPLOAD_MEMORIA_MAX_BYTES']:
+            file.stream.seek(0)
+            job_id = obter_fila().enviar(file.stream.read(), perfil, nome_arquivo=filename)
+        else:
+            file_path, sha256 = obter_uploads().guardar(file.stream, filename)
+            job_id = obter_fila().enviar(file_path, perfil, nome_arquivo=filename, sha256=sha256)
+        job = obter_fila().consultar(job_id)
+
+        if quer_json():
+            resposta = {
+                'job_id': job_id,
+                'status': job['status'],
+                'cache_hit': job['cache_hit'],
+                'status_url': url_for('status_job', job_id=job_id),
+                'resultado_url': url_for('resultado_job', job_id=job_id),
+            }
+            # Cache hit: o relatório já vai na própria resposta
+            if job['cache_hit']:
+                resposta['resultado'] = job['resultado']
+                return jsonify(resposta), 200
+            return jsonify(resposta), 202
+        return redirect(url_for('resultado', job_id=job_id))
+    
+    return render_template('index.html', perfis=listar_perfis(), perfil_padrao=app.config['PERFIL_PADRAO'])
+
+# Salva os arquivos do lote (extraindo os .zip) numa pasta própria e agenda um job por planilha
+def enviar_lote(arquivos, perfil):
+    lote_id = uuid.uuid4().hex
+    pasta = obter_uploads().pasta_lote(lote_id)
+    
+    caminhos = []
+    usados = set()
+    try:
+        for arquivo in arquivos:
+            nome = secure_filename(arquivo.filename)
+            if nome.lower().endswith('.zip'):
+                caminho_zip = os.path.join(pasta, nome_unico(nome, usados))
+                arquivo.save(caminho_zip)
+                caminhos.extend(extrair_zip(
+                    caminho_zip, pasta,
+                    max_arquivos=app.config['LOTE_MAX_ARQUIVOS'] - len(caminhos),
+                    max_bytes=app.config['LOTE_MAX_BYTES_EXTRAIDOS'],
+                    usados=usados,
+                ))
+                os.remove(caminho_zip)
+            elif allowed_file(nome):
+                caminho = os.path.join(pasta, nome_unico(nome, usados))
+                arquivo.save(caminho)
+                caminhos.append(caminho)
+        if not caminhos:
+            raise LoteInvalido("Nenhuma planilha (.csv, .xlsx, .xls) no envio")
+        if len(caminhos) > app.config['LOTE_MAX_ARQUIVOS']:
+            raise LoteInvalido(f"O lote tem {len(caminhos)} planilhas (máximo {app.config['LOTE_MAX_ARQUIVOS']})")
+    except LoteInvalido as e:
+        shutil.rmtree(pasta, ignore_errors=True)
+        if quer_json():
+            return jsonify({'erro': str(e)}), 400
+        return redirect(request.url)
+    
+    UPLOADS.inc(tipo='lote')
+    for caminho in caminhos:
+        BYTES_PLANILHA.observar(os.path.getsize(caminho))
+    obter_uploads().limpar()
+    obter_fila().enviar_lote(caminhos, perfil, lote_id=lote_id)
+    if quer_json():
+        lote = obter_fila().consultar_lote(lote_id)
+        lote['status_url'] = url_for('status_lote', lote_id=lote_id)
+        return jsonify(lote), 202
+    return redirect(url_for('resultado_lote', lote_id=lote_id))
 
 # Rota para exibir o resultado da validação
 @app.route('/resultado')
-def resultado():
-    return render_template('resultado.html')
+@app.route('/resultado/<job_id>')
+def resultado(job_id=None):
+    if job_id is None:
+        return render_template('resultado.html')
+    
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        abort(404)
+    
+    # Enquanto o job não termina, a página consulta o status e recarrega sozinha
+    if job['status'] not in (CONCLUIDO, ERRO):
+        return render_template('resultado.html', job=job)
+    return render_template('resultado.html', job=job, resultado=job['resultado'], logs=job['logs'],
+                           corrigido=obter_fila().arquivo_corrigido(job_id) is not None)
+
+# Resultado de um lote: resumo combinado e um link para o relatório de cada arquivo
+@app.route('/resultado/lote/<lote_id>')
+def resultado_lote(lote_id):
+    lote = obter_fila().consultar_lote(lote_id)
+    if lote is None:
+        abort(404)
+    return render_template('resultado_lote.html', lote=lote)
+
+# Status do lote (status e resumo de cada job, sem os relatórios completos)
+@app.route('/lotes/<lote_id>')
+def status_lote(lote_id):
+    lote = obter_fila().consultar_lote(lote_id)
+    if lote is None:
+        return jsonify({'erro': 'Lote não encontrado'}), 404
+    for job in lote['jobs']:
+        job['resultado_url'] = url_for('resultado_job', job_id=job['job_id'])
+    return jsonify(lote)
+
+# Status do job (sem o resultado, para consultas frequentes)
+@app.route('/jobs/<job_id>')
+def status_job(job_id):
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    
+    status = {chave: valor for chave, valor in job.items() if chave not in ('resultado', 'logs')}
+    if job['status'] in (CONCLUIDO, ERRO):
+        status['resultado_url'] = url_for('resultado_job', job_id=job_id)
+    if obter_fila().arquivo_corrigido(job_id) is not None:
+        status['corrigido_url'] = url_for('corrigido_job', job_id=job_id)
+    return jsonify(status)
+
+# Resultado completo do job (relatório + logs)
+@app.route('/jobs/<job_id>/resultado')
+def resultado_job(job_id):
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    if job['status'] not in (CONCLUIDO, ERRO):
+        return jsonify({'job_id': job_id, 'status': job['status']}), 202
+    return jsonify(job)
+
+# Download da planilha corrigida (valores padrão aplicados, NCM limpo)
+@app.route('/jobs/<job_id>/corrigido')
+def corrigido_job(job_id):
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    if job['status'] not in (CONCLUIDO, ERRO):
+        return jsonify({'job_id': job_id, 'status': job['status']}), 202
+    caminho = obter_fila().arquivo_corrigido(job_id)
+    if caminho is None:
+        return jsonify({'erro': 'Planilha corrigida indisponível para este job'}), 404
+    nome_base = os.path.splitext(job['arquivo'])[0]
+    return send_file(caminho, as_attachment=True,
+                     download_name=f"{nome_base}_corrigido{os.path.splitext(caminho)[1]}")
+
+# Índices de erros já lidos do disco (o de um job concluído não muda mais)
+@lru_cache(maxsize=8)
+def indice_job(job_id):
+    return obter_fila().carregar_indice(job_id)
+
+# Filtros aceitam parâmetro repetido ou separado por vírgula (?coluna=pNCM,pUN)
+def ler_filtro(nome):
+    valores = []
+    for valor in request.args.getlist(nome):
+        valores.extend(v.strip() for v in valor.split(',') if v.strip())
+    return set(valores)
+
+# Falhas individuais por linha, paginadas e filtráveis por coluna, regra e severidade
+@app.route('/jobs/<job_id>/erros')
+def erros_job(job_id):
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    if job['status'] not in (CONCLUIDO, ERRO):
+        return jsonify({'job_id': job_id, 'status': job['status']}), 202
+    indice = indice_job(job_id)
+    if indice is None:
+        return jsonify({'erro': 'Índice de erros indisponível para este job'}), 404
+    
+    pagina = request.args.get('pagina', 1, type=int)
+    por_pagina = request.args.get('por_pagina', app.config['API_POR_PAGINA'], type=int)
+    if pagina < 1 or por_pagina < 1 or por_pagina > app.config['API_MAX_POR_PAGINA']:
+        return jsonify({'erro': f"pagina >= 1 e por_pagina entre 1 e {app.config['API_MAX_POR_PAGINA']}"}), 400
+    
+    linhas, indices_regra, valores, regras = indice.falhas(
+        regras=ler_filtro('regra'), colunas=ler_filtro('coluna'), severidades=ler_filtro('severidade'))
+    total = len(linhas)
+    inicio = (pagina - 1) * por_pagina
+    fim = min(inicio + por_pagina, total)
+    
+    itens = []
+    for i in range(inicio, fim):
+        regra, coluna, severidade = regras[indices_regra[i]]
+        item = {'linha': int(linhas[i]), 'coluna': coluna, 'regra': regra, 'severidade': severidade}
+        if valores[i] is not None:
+            item['valor'] = str(valores[i])
+        itens.append(item)
+    
+    total_paginas = math.ceil(total / por_pagina)
+    argumentos = request.args.to_dict(flat=False)
+    argumentos.update({'por_pagina': por_pagina, 'pagina': pagina + 1})
+    return jsonify({
+        'job_id': job_id,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': total,
+        'total_paginas': total_paginas,
+        'proxima': url_for('erros_job', job_id=job_id, **argumentos) if pagina < total_paginas else None,
+        'itens': itens,
+    })
+
+# Todas as falhas de uma linha da planilha
+@app.route('/jobs/<job_id>/linhas/<int:linha>')
+def linha_job(job_id, linha):
+    job = obter_fila().consultar(job_id)
+    if job is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    if job['status'] not in (CONCLUIDO, ERRO):
+        return jsonify({'job_id': job_id, 'status': job['status']}), 202
+    indice = indice_job(job_id)
+    if indice is None:
+        return jsonify({'erro': 'Índice de erros indisponível para este job'}), 404
+    return jsonify({'job_id': job_id, 'linha': linha, 'falhas': indice.falhas_da_linha(linha)})
+
+# Logs e progresso do job em tempo real (Server-Sent Events)
+@app.route('/jobs/<job_id>/eventos')
+def eventos_job(job_id):
+    fila_jobs = obter_fila()
+    if fila_jobs.consultar(job_id) is None:
+        return jsonify({'erro': 'Job não encontrado'}), 404
+    
+    # Na reconexão o navegador envia o último id recebido; continua dali
+    ultimo_id = request.headers.get('Last-Event-ID', '0')
+    a_partir_de = int(ultimo_id) if ultimo_id.isdigit() else 0
+    
+    def gerar():
+        for numero, evento in fila_jobs.acompanhar(job_id, a_partir_de):
+            if evento is None:
+                yield ": ping\n\n"
+                continue
+            dados = json.dumps(evento, ensure_ascii=False)
+            yield f"id: {numero}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+    
+    return Response(stream_with_context(gerar()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx não deve segurar os eventos
+    })
+
+# Métricas para o Prometheus (envios, bytes, linhas, erros, durações)
+@app.route('/metrics')
+def metrics():
+    return Response(metricas.exportar(), content_type=RegistroMetricas.TIPO_CONTEUDO)
+
+# Tudo que o primeiro pedido de cada worker pagaria: imports do pandas/openpyxl, perfis, tabela NCM e templates
+def aquecer_app():
+    aquecer_validacao(listar_perfis())
+    if tabela_ncm.obter_tabela() is None:
+        print(f"⚠️  Tabela NCM não encontrada em {tabela_ncm.TABELA_NCM} - os códigos NCM não serão conferidos "
+              f"com a tabela oficial (gere com: python tabela_ncm.py importar <tabela do Siscomex>)", flush=True)
+    for nome in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nome)
+
+# App configurado para o ambiente (FLASK_ENV por padrão) e aquecido. É o que o gunicorn carrega,
+# no processo mestre antes do fork (gunicorn.conf.py); a fila e o pool só nascem em cada worker
+def criar_app(env=None):
+    env = env or os.environ.get('FLASK_ENV', 'development')
+    app.config.from_object(config.get(env, config['default']))
+    metricas.compartilhar(app.config['METRICAS_PASTA'])
+    if app.config['LIMITE_STREAMING_BYTES'] >= app.config['MAX_CONTENT_LENGTH']:
+        print(f"⚠️  LIMITE_STREAMING_BYTES ({app.config['LIMITE_STREAMING_BYTES']}) não é menor que MAX_CONTENT_LENGTH "
+              f"({app.config['MAX_CONTENT_LENGTH']}) - nenhum envio pelo app será validado em blocos", flush=True)
+    aquecer_app()
+    return app
 
 if __name__ == '__main__':
     # Obter ambiente da variável de ambiente ou usar development como padrão
@@ -69,7 +409,7 @@ if __name__ == '__main__':
     app_config = config.get(env, config['default'])
     
     # Configurar o Flask com as configurações do ambiente
-    app.config.from_object(app_config)
+    criar_app(env)
     
     print(f"🚀 Iniciando aplicação em modo: {env.upper()}")
     print(f"🌐 Acesso: http://{app_config.HOST}:{app_config.PORT}")
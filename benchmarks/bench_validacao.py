@@ -0,0 +1,288 @@
+"""
+Benchmarks da validação sobre catálogos sintéticos (ver gerar_catalogo).
+
+Para cada caso (linhas x formato x dialeto) mede:
+
+    <modo>.total        executar_validacao_completa / executar_validacao_streaming
+    <modo>.<etapa>      cada etapa do MedidorEtapas (carregar_arquivo, validar_pNCM...)
+    flask.upload        POST / até o job concluir, pelo test_client do app (sem cache)
+
+Cada medida é a mediana das repetições. Os catálogos ficam em
+benchmarks/dados/ e só são gerados na primeira vez. O resultado vai para
+benchmarks/resultados/<data>_<commit>.json, com o commit, as versões e a
+máquina, para comparar entre commits:
+
+    python benchmarks/bench_validacao.py executar --linhas 1000 100000 --formatos csv xlsx
+    python benchmarks/bench_validacao.py executar --linhas 1000000 --formatos csv --modos streaming --sem-flask
+    python benchmarks/bench_validacao.py comparar resultados/antes.json resultados/depois.json --tolerancia 10
+
+comparar sai com código 1 se alguma medida piorou mais que a tolerância.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PASTA_BENCH = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(PASTA_BENCH)
+sys.path.insert(0, RAIZ)
+
+from gerar_catalogo import DIALETOS, gerar_catalogo  # noqa: E402
+
+PASTA_DADOS = os.path.join(PASTA_BENCH, 'dados')
+PASTA_RESULTADOS = os.path.join(PASTA_BENCH, 'resultados')
+
+MODOS = ('completa', 'streaming')
+
+# Medidas abaixo disso (segundos) são ruído demais para acusar regressão
+MINIMO_COMPARACAO = 0.01
+
+
+def _commit():
+    try:
+        saida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True)
+        sujo = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+        return saida.stdout.strip() + ('-sujo' if sujo else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+def metadados(args):
+    import numpy
+    import pandas
+
+    return {
+        'commit': _commit(),
+        'data': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'argumentos': {chave: valor for chave, valor in vars(args).items() if chave != 'comando'},
+    }
+
+
+def catalogo(linhas, formato, dialeto, taxa_falhas, semente):
+    """Caminho do catálogo sintético do caso, gerado só se ainda não existir"""
+    sufixo = f"_{dialeto}" if formato == 'csv' else ''
+    caminho = os.path.join(PASTA_DADOS, f"catalogo_{linhas}{sufixo}_f{taxa_falhas:g}_s{semente}.{formato}")
+    if not os.path.exists(caminho):
+        print(f"📄 Gerando {os.path.basename(caminho)}...", file=sys.stderr)
+        gerar_catalogo(caminho, linhas, dialeto, taxa_falhas, semente)
+    return caminho
+
+
+def medir_validacao(caminho, modo, perfil, tamanho_bloco):
+    """Medidas de uma validação direta (sem Flask) no modo pedido"""
+    from validador_gabaritos import ValidadorProdutos
+
+    validador = ValidadorProdutos(caminho, perfil=perfil, relatorio_txt=False)
+    inicio = time.perf_counter()
+    if modo == 'streaming':
+        relatorio = validador.executar_validacao_streaming(tamanho_bloco)
+    else:
+        relatorio = validador.executar_validacao_completa()
+    total = time.perf_counter() - inicio
+
+    if not relatorio['resumo']['arquivo_lido']:
+        raise RuntimeError(f"Não foi possível ler {caminho}")
+    medidas = {f'{modo}.total': total}
+    for etapa in relatorio['metricas']['etapas']:
+        medidas[f"{modo}.{etapa['etapa']}"] = etapa['segundos']
+    extras = {
+        f'{modo}.pico_memoria_mb': relatorio['metricas']['pico_memoria_mb'],
+        f'{modo}.linhas_invalidas': relatorio['resumo']['linhas_invalidas'],
+    }
+    return medidas, extras
+
+
+class ClienteFlask:
+    """app.py com pastas temporárias e sem cache, para medir o upload de ponta a ponta"""
+
+    def __init__(self, perfil):
+        import app as modulo_app
+        from config import config
+
+        self.modulo = modulo_app
+        self.perfil = perfil
+        self.pasta = tempfile.mkdtemp(prefix='bench_validador_')
+        # Mesma configuração do app.py rodando no ambiente atual (FLASK_ENV)
+        modulo_app.app.config.from_object(config.get(os.environ.get('FLASK_ENV', 'development'), config['default']))
+        modulo_app.app.config.update(
+            TESTING=True,
+            UPLOAD_FOLDER=self.pasta,
+            JOBS_FOLDER=os.path.join(self.pasta, 'jobs'),
+            CACHE_ENABLED=False,
+            CPROFILE_ATIVO=False,
+        )
+        modulo_app.fila = None
+        self.cliente = modulo_app.app.test_client()
+
+    def enviar(self, caminho, intervalo=0.02):
+        """Segundos do POST até o job concluir (status consultado a cada intervalo)"""
+        inicio = time.perf_counter()
+        with open(caminho, 'rb') as f:
+            resposta = self.cliente.post('/', data={'file': (f, os.path.basename(caminho)), 'perfil': self.perfil},
+                                         headers={'Accept': 'application/json'}, content_type='multipart/form-data')
+        if resposta.status_code not in (200, 202):
+            raise RuntimeError(f"Upload recusado ({resposta.status_code}): {resposta.get_data(as_text=True)[:200]}")
+        job_id = resposta.get_json()['job_id']
+        while True:
+            status = self.cliente.get(f'/jobs/{job_id}').get_json()['status']
+            if status in (self.modulo.CONCLUIDO, self.modulo.ERRO):
+                break
+            time.sleep(intervalo)
+        segundos = time.perf_counter() - inicio
+        if status == self.modulo.ERRO:
+            raise RuntimeError(f"O job de {caminho} terminou com erro")
+        return segundos
+
+    def fechar(self):
+        if self.modulo.fila is not None:
+            self.modulo.fila.encerrar()
+            self.modulo.fila = None
+        shutil.rmtree(self.pasta, ignore_errors=True)
+
+
+def casos(args):
+    for linhas in args.linhas:
+        for formato in args.formatos:
+            for dialeto in (args.dialetos if formato == 'csv' else [None]):
+                yield linhas, formato, dialeto
+
+
+def executar(args):
+    from regras_validacao import obter_plano
+    from tabela_ncm import obter_tabela
+
+    # Perfil e tabela NCM carregados antes da primeira medida, como nos workers
+    obter_plano(args.perfil)
+    obter_tabela()
+
+    flask = None if args.sem_flask else ClienteFlask(args.perfil)
+    resultado = {'metadados': metadados(args), 'casos': []}
+    try:
+        if flask is not None:
+            flask.enviar(catalogo(1000, 'csv', 'cp1252', args.taxa_falhas, args.semente))  # sobe o pool de processos
+        for linhas, formato, dialeto in casos(args):
+            caminho = catalogo(linhas, formato, dialeto or 'cp1252', args.taxa_falhas, args.semente)
+            nome = f"{formato}-{dialeto}-{linhas}" if dialeto else f"{formato}-{linhas}"
+            print(f"⏱️  {nome}...", file=sys.stderr)
+
+            repeticoes = []
+            extras = {}
+            for _ in range(args.repeticoes):
+                medidas = {}
+                for modo in args.modos:
+                    medidas_modo, extras_modo = medir_validacao(caminho, modo, args.perfil, args.tamanho_bloco)
+                    medidas.update(medidas_modo)
+                    extras.update(extras_modo)
+                if flask is not None:
+                    medidas['flask.upload'] = flask.enviar(caminho)
+                repeticoes.append(medidas)
+
+            chaves = dict.fromkeys(chave for medidas in repeticoes for chave in medidas)
+            caso = {
+                'caso': nome,
+                'linhas': linhas,
+                'formato': formato,
+                'dialeto': dialeto,
+                'bytes': os.path.getsize(caminho),
+                'medidas': {chave: round(statistics.median(medidas[chave] for medidas in repeticoes if chave in medidas), 4)
+                            for chave in chaves},
+                **extras,
+            }
+            resultado['casos'].append(caso)
+            totais = [f"{chave.split('.')[0]} {segundos:.3f}s" for chave, segundos in caso['medidas'].items()
+                      if chave.endswith('.total') or chave == 'flask.upload']
+            print(f"   {' / '.join(totais)}", file=sys.stderr)
+    finally:
+        if flask is not None:
+            flask.fechar()
+
+    destino = args.saida or os.path.join(
+        PASTA_RESULTADOS, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{resultado['metadados']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"💾 Resultados salvos em: {destino}")
+    return 0
+
+
+def comparar(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.novo, encoding='utf-8') as f:
+        novo = json.load(f)
+
+    print(f"Base: {base['metadados']['commit']} ({base['metadados']['data']})")
+    print(f"Novo: {novo['metadados']['commit']} ({novo['metadados']['data']})")
+    casos_base = {caso['caso']: caso for caso in base['casos']}
+    regressoes = 0
+    for caso in novo['casos']:
+        anterior = casos_base.get(caso['caso'])
+        if anterior is None:
+            continue
+        print(f"\n{caso['caso']}")
+        for chave, segundos in caso['medidas'].items():
+            antes = anterior['medidas'].get(chave)
+            if antes is None or max(antes, segundos) < args.minimo:
+                continue
+            variacao = (segundos - antes) / antes * 100 if antes > 0 else 0.0
+            marca = ''
+            if antes >= args.minimo and variacao > args.tolerancia:
+                marca = '  ⚠️  regressão'
+                regressoes += 1
+            elif antes >= args.minimo and variacao < -args.tolerancia:
+                marca = '  ✅'
+            print(f"  {chave:<45} {antes:>10.4f}s {segundos:>10.4f}s {variacao:>+8.1f}%{marca}")
+
+    print(f"\n{regressoes} medida(s) piorou(aram) mais de {args.tolerancia:g}%")
+    return 1 if regressoes else 0
+
+
+def main(argv=None):
+    from regras_validacao import PERFIL_PADRAO
+    from validador_gabaritos import TAMANHO_BLOCO_PADRAO
+
+    parser = argparse.ArgumentParser(description="Benchmarks da validação de catálogos")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    p_executar = comandos.add_parser('executar', help="Mede os casos e salva os resultados em JSON")
+    p_executar.add_argument('--linhas', type=int, nargs='+', default=[1000, 10_000, 100_000],
+                            help="Tamanhos dos catálogos (padrão: 1000 10000 100000; vai até 1000000)")
+    p_executar.add_argument('--formatos', nargs='+', choices=['csv', 'xlsx'], default=['csv', 'xlsx'])
+    p_executar.add_argument('--dialetos', nargs='+', choices=sorted(DIALETOS), default=sorted(DIALETOS),
+                            help="Dialetos dos CSV (cp1252 com ';' ou utf8 com ',')")
+    p_executar.add_argument('--modos', nargs='+', choices=MODOS, default=list(MODOS))
+    p_executar.add_argument('--taxa-falhas', type=float, default=0.02, help="Fração das linhas com cada tipo de falha")
+    p_executar.add_argument('--semente', type=int, default=42)
+    p_executar.add_argument('--repeticoes', type=int, default=3, help="Repetições de cada caso (vale a mediana)")
+    p_executar.add_argument('--perfil', default=os.environ.get('PERFIL_PADRAO', PERFIL_PADRAO))
+    p_executar.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO_PADRAO, help="Linhas por bloco no modo streaming")
+    p_executar.add_argument('--sem-flask', action='store_true', help="Não mede o upload pelo app")
+    p_executar.add_argument('--saida', help="Arquivo JSON (padrão: benchmarks/resultados/<data>_<commit>.json)")
+
+    p_comparar = comandos.add_parser('comparar', help="Compara dois resultados salvos")
+    p_comparar.add_argument('base', help="Resultado de referência (JSON)")
+    p_comparar.add_argument('novo', help="Resultado a comparar (JSON)")
+    p_comparar.add_argument('--tolerancia', type=float, default=10.0, help="Piora aceita, em %% (padrão: 10)")
+    p_comparar.add_argument('--minimo', type=float, default=MINIMO_COMPARACAO,
+                            help="Medidas abaixo disso (segundos) não são listadas nem contam como regressão")
+
+    args = parser.parse_args(argv)
+    return executar(args) if args.comando == 'executar' else comparar(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Gerador de catálogos sintéticos no formato do Castelli_v1_08.2025.csv, para
+os benchmarks.
+
+As 31 colunas saem com o mesmo cabeçalho (primeira coluna sem nome) e
+valores plausíveis: fornecedores de revestimento, referências únicas, EAN-13
+válidos ou 'SEM GTIN', NCMs de cerâmica, CST 0/2, decimais com vírgula no
+dialeto cp1252. Uma fração das linhas (taxa_falhas, sorteada para cada tipo
+de falha) recebe os problemas que aparecem nos arquivos reais:
+
+    ncm     NCM 'BATATA'
+    vazio   uma célula em branco numa coluna qualquer
+    cst     pOrigem CST fora do domínio ('5', 'X', '1,5')
+    gtin    código de barras com o dígito verificador errado
+
+A geração é feita em blocos com numpy (1M de linhas em CSV leva uns 20 s) e é
+determinística para a mesma semente.
+
+    python benchmarks/gerar_catalogo.py catalogo.csv --linhas 100000 --taxa-falhas 0.05
+    python benchmarks/gerar_catalogo.py catalogo.csv --dialeto utf8
+    python benchmarks/gerar_catalogo.py catalogo.xlsx --linhas 10000
+"""
+import argparse
+import os
+import sys
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cabeçalho do Castelli_v1_08.2025.csv, na mesma ordem
+COLUNAS = [
+    '', 'pCodigo', 'pFornecedor', 'pReferencia', 'pCodigoBarras', 'pDescrição', 'pDescrição Reduzida',
+    'pTamanho', 'pColeção', 'pLinha', 'pSegmento', 'pGrupo', 'pFamilia', 'pSubFamilia', 'pNCM',
+    'pOrigem CST', 'pUN', 'pMultiplo', 'pM²/Pallet', 'pQUANTIDADE NA EMBALAGEM', 'pPeso', 'pCusto',
+    'pPercST', 'pPercIPI', 'pPrecoVenda', 'pExige Conferencia', 'pMarkup', 'pFrete', 'pCodigoSA',
+    'pDesconto', 'pEmpresa',
+]
+
+# Dialetos de CSV: encoding, separador e separador decimal
+DIALETOS = {
+    'cp1252': ('cp1252', ';', ','),
+    'utf8': ('utf-8', ',', '.'),
+}
+
+FALHAS = ('ncm', 'vazio', 'cst', 'gtin')
+
+TAMANHO_BLOCO = 100_000
+
+FORNECEDORES = np.array(['Castelli', 'Portobello', 'Eliane', 'Biancogres', 'Incepa', 'Cecrisa', 'Delta', 'Embramaco'])
+LINHAS_PRODUTO = np.array(['San Giusto', 'Lisboa', 'Madeira Nobre', 'Brodick', 'Di Cavalli', 'Marmo Bianco',
+                           'Cimento Urbano', 'Pietra Grigia', 'Terracota', 'Calacata', 'Jequitibá', 'Ardósia'])
+ACABAMENTOS = np.array(['Plus Granilha', 'Out Granilha', 'Acetinado', 'Polido', 'Natural', 'Retificado', 'HD'])
+FORMATOS = np.array(['30x120', '20x122', '60x60', '90x90', '45x45', '60x120', '26x106'])
+NCMS = np.array(['69072100', '69072200', '69072300', '69074000'])
+CST_INVALIDOS = np.array(['5', 'X', '1,5'])
+
+
+def _digito_ean13(bases):
+    """Dígito verificador de bases de 12 dígitos (array de int64)"""
+    soma = np.zeros(len(bases), dtype=np.int64)
+    resto = bases.copy()
+    for posicao in range(12):  # da direita para a esquerda: pesos 3, 1, 3, 1...
+        soma += (resto % 10) * (3 if posicao % 2 == 0 else 1)
+        resto //= 10
+    return (10 - soma % 10) % 10
+
+
+def gerar_bloco(inicio, linhas, taxa_falhas=0.02, semente=42):
+    """DataFrame com as linhas inicio..inicio+linhas do catálogo (o mesmo para a mesma semente)"""
+    rng = np.random.default_rng([semente, inicio])
+    indice = np.arange(inicio + 1, inicio + linhas + 1)
+
+    codigo = np.where(rng.random(linhas) < 0.3, -1, 100000 + indice)
+    referencia = 70000 + indice  # única no arquivo todo
+    bases = 789_000_000_000 + (indice * 7919) % 1_000_000_000
+    gtin = (bases * 10 + _digito_ean13(bases)).astype(str).astype(object)
+    gtin[rng.random(linhas) < 0.5] = 'SEM GTIN'
+
+    linha_produto = LINHAS_PRODUTO[rng.integers(len(LINHAS_PRODUTO), size=linhas)]
+    descricao = np.char.add(np.char.add(np.char.add(linha_produto, ' '),
+                                        np.char.add(ACABAMENTOS[rng.integers(len(ACABAMENTOS), size=linhas)], ' ')),
+                            FORMATOS[rng.integers(len(FORMATOS), size=linhas)])
+    reduzida = pd.Series(linha_produto).str.split(' ', n=1).str[0].to_numpy()
+
+    multiplo = np.round(rng.uniform(1.0, 2.6, size=linhas), 2)
+    quantidade = rng.integers(2, 10, size=linhas)
+    custo = np.round(rng.uniform(20, 150, size=linhas), 1)
+
+    df = pd.DataFrame({
+        '': indice,
+        'pCodigo': codigo,
+        'pFornecedor': FORNECEDORES[rng.integers(len(FORNECEDORES), size=linhas)],
+        'pReferencia': referencia,
+        'pCodigoBarras': gtin,
+        'pDescrição': descricao,
+        'pDescrição Reduzida': reduzida,
+        'pTamanho': -1, 'pColeção': -1, 'pLinha': -1, 'pSegmento': -1,
+        'pGrupo': -1, 'pFamilia': -1, 'pSubFamilia': -1,
+        'pNCM': NCMS[rng.integers(len(NCMS), size=linhas)].astype(object),
+        'pOrigem CST': np.where(rng.random(linhas) < 0.8, '0', '2').astype(object),
+        'pUN': np.where(rng.random(linhas) < 0.9, 'M2', 'PC'),
+        'pMultiplo': multiplo,
+        'pM²/Pallet': np.round(multiplo * rng.integers(24, 48, size=linhas), 2),
+        'pQUANTIDADE NA EMBALAGEM': quantidade,
+        'pPeso': np.round(multiplo * rng.uniform(18, 24, size=linhas)).astype(np.int64),
+        'pCusto': custo,
+        'pPercST': -1, 'pPercIPI': -1,
+        'pPrecoVenda': np.round(custo * rng.uniform(1.3, 1.9, size=linhas), 2),
+        'pExige Conferencia': 'N',
+        'pMarkup': -1, 'pFrete': -1, 'pCodigoSA': -1, 'pDesconto': -1,
+        'pEmpresa': 101,
+    }, columns=COLUNAS)
+
+    if taxa_falhas > 0:
+        _aplicar_falhas(df, rng, taxa_falhas)
+    return df
+
+
+def _aplicar_falhas(df, rng, taxa_falhas):
+    """Sorteia as linhas de cada tipo de falha (independentes entre si) e as aplica no DataFrame"""
+    linhas = len(df)
+    sorteio = {falha: np.flatnonzero(rng.random(linhas) < taxa_falhas) for falha in FALHAS}
+
+    df.loc[df.index[sorteio['ncm']], 'pNCM'] = 'BATATA'
+    df.loc[df.index[sorteio['cst']], 'pOrigem CST'] = CST_INVALIDOS[rng.integers(len(CST_INVALIDOS), size=len(sorteio['cst']))]
+
+    gtins = sorteio['gtin']
+    if len(gtins):
+        bases = 789_000_000_000 + rng.integers(0, 1_000_000_000, size=len(gtins))
+        errados = (_digito_ean13(bases) + rng.integers(1, 10, size=len(gtins))) % 10
+        df.loc[df.index[gtins], 'pCodigoBarras'] = (bases * 10 + errados).astype(str)
+
+    # Célula em branco numa coluna sorteada (menos a primeira, sem nome); inteiros viram Int64
+    vazias = sorteio['vazio']
+    colunas = rng.integers(1, len(COLUNAS), size=len(vazias))
+    for coluna in np.unique(colunas):
+        nome = COLUNAS[coluna]
+        if df[nome].dtype.kind in 'iu':
+            df[nome] = df[nome].astype('Int64')  # inteiro com lacunas: continua saindo sem ',0'
+        df.loc[df.index[vazias[colunas == coluna]], nome] = np.nan
+
+
+def gerar_catalogo(destino, linhas, dialeto='cp1252', taxa_falhas=0.02, semente=42, tamanho_bloco=TAMANHO_BLOCO):
+    """Grava o catálogo em destino (.csv no dialeto pedido, ou .xlsx); devolve o caminho"""
+    from planilha_corrigida import EscritorPlanilha
+
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    encoding, sep, decimal = DIALETOS[dialeto]
+    csv = os.path.splitext(destino)[1].lower() == '.csv'
+    temporario = f"{destino}.{os.getpid()}.tmp{os.path.splitext(destino)[1]}"
+    escritor = None if csv else EscritorPlanilha(temporario)
+    try:
+        with open(temporario, 'w', encoding=encoding, newline='') if csv else nullcontext() as arquivo:
+            for inicio in range(0, linhas, tamanho_bloco):
+                bloco = gerar_bloco(inicio, min(tamanho_bloco, linhas - inicio), taxa_falhas, semente)
+                if csv:
+                    bloco.to_csv(arquivo, sep=sep, decimal=decimal, index=False, header=inicio == 0)
+                else:
+                    escritor.escrever(bloco)
+        if escritor is not None:
+            escritor.fechar()
+    except BaseException:
+        if escritor is not None:
+            escritor.descartar()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, destino)
+    return destino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um catálogo sintético no formato do Castelli_v1_08.2025.csv")
+    parser.add_argument('destino', help="Arquivo .csv ou .xlsx a gerar")
+    parser.add_argument('--linhas', type=int, default=10_000, help="Quantidade de produtos (padrão: 10000)")
+    parser.add_argument('--dialeto', choices=sorted(DIALETOS), default='cp1252',
+                        help="CSV: cp1252 com ';' e vírgula decimal, ou utf8 com ',' e ponto decimal")
+    parser.add_argument('--taxa-falhas', type=float, default=0.02,
+                        help="Fração das linhas com cada tipo de falha (NCM, vazio, CST, GTIN; padrão: 0.02)")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if os.path.splitext(args.destino)[1].lower() not in ('.csv', '.xlsx'):
+        parser.error("o destino deve ser .csv ou .xlsx")
+    gerar_catalogo(args.destino, args.linhas, args.dialeto, args.taxa_falhas, args.semente)
+    print(f"📄 {args.linhas} linhas gravadas em {args.destino} ({os.path.getsize(args.destino) / 1024 ** 2:.1f} MB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
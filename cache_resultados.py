@@ -0,0 +1,144 @@
+"""
+Cache em disco dos relatórios de validação.
+
+A chave é o hash SHA-256 do conteúdo do arquivo (mais a extensão, a
+versão do código de validação, do perfil de regras e da tabela NCM), então reenviar a mesma planilha - com qualquer nome -
+devolve o relatório já calculado sem validar de novo.
+
+Cada entrada é um JSON em `pasta/<chave>.json`, mais os anexos que houver:
+o índice de erros por linha (`<chave>.indice.npz`) e a planilha corrigida
+(`<chave>.corrigido` - a extensão já faz parte da chave). O mtime do JSON
+marca quando a entrada foi criada (TTL) e o atime marca o último acesso (LRU).
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from validador_gabaritos import VERSAO_REGRAS
+from tabela_ncm import obter_tabela
+
+TAMANHO_LEITURA = 1024 * 1024
+
+# Arquivos guardados junto com o JSON de cada entrada (sufixo do nome)
+ANEXOS = ('indice.npz', 'corrigido')
+
+
+def hash_arquivo(caminho):
+    """SHA-256 do conteúdo do arquivo, lido em pedaços de 1 MB"""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for pedaco in iter(lambda: f.read(TAMANHO_LEITURA), b''):
+            sha.update(pedaco)
+    return sha.hexdigest()
+
+
+class CacheResultados:
+    """Cache de relatórios com expiração (TTL) e limite de tamanho (LRU)"""
+
+    def __init__(self, pasta, tamanho_maximo=200 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def chave(self, caminho_arquivo, plano, sha256=None):
+        """
+        Chave do arquivo: conteúdo + extensão + versão do código, do perfil de regras e da tabela NCM.
+        Com o sha256 do conteúdo já calculado, o arquivo não é relido (caminho_arquivo pode ser só o nome).
+        """
+        _, ext = os.path.splitext(caminho_arquivo)
+        tabela = obter_tabela()
+        ncm = tabela.versao if tabela is not None else 'semncm'
+        sha256 = sha256 or hash_arquivo(caminho_arquivo)
+        return f"{sha256}-{ext.lower().lstrip('.')}-v{VERSAO_REGRAS}-{plano.nome}-{plano.versao}-{ncm}"
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, f"{chave}.json")
+
+    def _caminho_anexo(self, chave, anexo):
+        return os.path.join(self.pasta, f"{chave}.{anexo}")
+
+    def _remover(self, caminho):
+        """Remove a entrada (JSON e anexos); ignora o que outro processo já removeu"""
+        base = caminho[:-len('.json')]
+        for arquivo in [caminho] + [f"{base}.{anexo}" for anexo in ANEXOS]:
+            try:
+                os.remove(arquivo)
+            except FileNotFoundError:
+                pass
+
+    def obter(self, chave):
+        """Relatório guardado para a chave, ou None (ausente ou expirado)"""
+        caminho = self._caminho(chave)
+        try:
+            criado_em = os.stat(caminho).st_mtime
+            if time.time() - criado_em > self.ttl:
+                self._remover(caminho)
+                return None
+            with open(caminho, encoding='utf-8') as f:
+                resultado = json.load(f)
+            # Marca o acesso (atime) sem mexer na data de criação (mtime)
+            os.utime(caminho, (time.time(), criado_em))
+            return resultado
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _copiar_anexo(self, chave, anexo, destino):
+        try:
+            shutil.copyfile(self._caminho_anexo(chave, anexo), destino)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def copiar_indice(self, chave, destino):
+        """Copia o índice de erros da entrada para destino; False se não houver"""
+        return self._copiar_anexo(chave, 'indice.npz', destino)
+
+    def copiar_corrigido(self, chave, destino):
+        """Copia a planilha corrigida da entrada para destino; False se não houver"""
+        return self._copiar_anexo(chave, 'corrigido', destino)
+
+    def guardar(self, chave, resultado, arquivo_indice=None, arquivo_corrigido=None):
+        caminho = self._caminho(chave)
+        # Os anexos vão antes do JSON: uma entrada visível sempre tem os anexos completos
+        for anexo, origem in (('indice.npz', arquivo_indice), ('corrigido', arquivo_corrigido)):
+            if origem is not None and os.path.exists(origem):
+                temporario = f"{self._caminho_anexo(chave, anexo)}.{os.getpid()}.tmp"
+                shutil.copyfile(origem, temporario)
+                os.replace(temporario, self._caminho_anexo(chave, anexo))
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        self.limpar()
+
+    def limpar(self):
+        """Remove entradas expiradas e, se passar do limite, as menos acessadas"""
+        agora = time.time()
+        entradas = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith('.json'):
+                continue
+            caminho = os.path.join(self.pasta, nome)
+            try:
+                info = os.stat(caminho)
+                if agora - info.st_mtime > self.ttl:
+                    self._remover(caminho)
+                    continue
+                tamanho = info.st_size
+                for anexo in ANEXOS:
+                    arquivo = f"{caminho[:-len('.json')]}.{anexo}"
+                    if os.path.exists(arquivo):
+                        tamanho += os.path.getsize(arquivo)
+            except FileNotFoundError:
+                continue  # removida por outro processo
+            entradas.append((info.st_atime, tamanho, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.tamanho_maximo:
+                break
+            self._remover(caminho)
+            total -= tamanho
@@ -0,0 +1,160 @@
+"""
+Linha de comando para pipelines (ETL noturno): valida arquivos e escreve os
+relatórios em JSON ou NDJSON na saída padrão.
+
+    python cli_validacao.py planilha.csv
+    python cli_validacao.py "entrada/*.xlsx" entrada/outros/ --formato ndjson --sem-relatorio-txt
+    python cli_validacao.py castelli_v2.csv --anterior castelli_v1.impressao.npz --salvar-impressao castelli_v2.impressao.npz
+
+Códigos de saída:
+    0  nenhum erro de validação (ou até --max-erros)
+    1  mais erros de validação que --max-erros
+    2  algum arquivo não pôde ser lido, ou nenhum arquivo encontrado
+
+Mensagens de andamento vão para a saída de erro (com -v), nunca para a
+saída padrão. Se quem lê a saída padrão fecha o pipe antes do fim, o resto
+da saída é descartado sem erro e o código de saída não muda. O pandas só é importado depois de ler os argumentos, e o
+leitor de Excel (openpyxl ou xlrd) só quando aparece um arquivo daquele tipo.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+SAIDA_OK = 0
+SAIDA_COM_ERROS = 1
+SAIDA_FALHA = 2
+
+
+def expandir_entradas(entradas, recursivo=False):
+    """Arquivos, pastas e padrões glob -> lista de caminhos sem repetição, na ordem dada"""
+    from lote_validacao import EXTENSOES_PLANILHA, listar_planilhas
+
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            caminhos.extend(listar_planilhas(entrada, recursivo))
+        elif glob.has_magic(entrada):
+            caminhos.extend(sorted(caminho for caminho in glob.glob(entrada, recursive=True)
+                                   if os.path.splitext(caminho)[1].lower() in EXTENSOES_PLANILHA))
+        else:
+            caminhos.append(entrada)  # inexistente vira falha no relatório, não some em silêncio
+    return list(dict.fromkeys(caminhos))
+
+
+def _registro(caminho, resultado, sem_logs):
+    """Linha de saída de um arquivo"""
+    if resultado is not None and sem_logs:
+        resultado = {chave: valor for chave, valor in resultado.items() if chave != 'logs'}
+    return {
+        'caminho': caminho,
+        'status': 'concluido' if resultado is not None else 'erro',
+        'relatorio': resultado,
+    }
+
+
+def _escrever(texto):
+    """
+    Escreve na saída padrão. Se quem lê fechou o pipe (ex.: `| head -1`),
+    retorna False e aponta a saída para /dev/null, para o Python não
+    reclamar de novo ao descarregar o buffer na saída.
+    """
+    try:
+        sys.stdout.write(texto)
+        sys.stdout.flush()
+        return True
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Valida planilhas de produtos e escreve os relatórios em JSON na saída padrão")
+    parser.add_argument('entradas', nargs='+', help="Arquivos, pastas ou padrões glob (ex.: 'entrada/*.csv')")
+    parser.add_argument('--formato', choices=['json', 'ndjson'], default='json',
+                        help="json: um documento com resumo e relatórios; ndjson: uma linha por arquivo, conforme terminam")
+    parser.add_argument('--perfil', default=os.environ.get('PERFIL_PADRAO', 'produtos'), help="Perfil de regras (regras/<perfil>.json)")
+    parser.add_argument('--max-erros', type=int, default=0, help="Erros de validação tolerados antes de sair com código 1")
+    parser.add_argument('--sem-relatorio-txt', action='store_true', help="Não grava relatorio_produtos_*.txt no diretório atual")
+    parser.add_argument('--sem-logs', action='store_true', help="Omite a lista de logs dos relatórios")
+    parser.add_argument('--workers', type=int, default=None, help="Processos em paralelo para vários arquivos (padrão: um por núcleo)")
+    parser.add_argument('--recursivo', action='store_true', help="Inclui subpastas das pastas informadas")
+    parser.add_argument('--limite-streaming', type=int, default=int(os.environ.get('LIMITE_STREAMING_BYTES', 50 * 1024 * 1024)),
+                        help="Arquivos maiores que isso (bytes) são lidos em blocos")
+    parser.add_argument('--anterior', help="Impressão (.npz) ou planilha da versão anterior: só as linhas alteradas são validadas (um arquivo só)")
+    parser.add_argument('--salvar-impressao', help="Grava a impressão desta versão (.npz) para a próxima comparação (um arquivo só)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Mostra o andamento na saída de erro")
+    args = parser.parse_args(argv)
+
+    def aviso(mensagem):
+        if args.verbose:
+            print(mensagem, file=sys.stderr)
+
+    caminhos = expandir_entradas(args.entradas, args.recursivo)
+    if not caminhos:
+        print("❌ Nenhuma planilha encontrada", file=sys.stderr)
+        return SAIDA_FALHA
+    if (args.anterior or args.salvar_impressao) and len(caminhos) > 1:
+        print("❌ --anterior e --salvar-impressao valem para um arquivo só", file=sys.stderr)
+        return SAIDA_FALHA
+
+    # Só agora: importar o validador carrega o pandas
+    from regras_validacao import obter_plano, PerfilInvalido
+    from lote_validacao import validar_arquivo, validar_lote, item_lote, resumir_lote
+    from validador_gabaritos import TAMANHO_BLOCO_PADRAO
+
+    try:
+        obter_plano(args.perfil)
+    except PerfilInvalido as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return SAIDA_FALHA
+
+    tamanho_bloco = int(os.environ.get('TAMANHO_BLOCO_STREAMING', TAMANHO_BLOCO_PADRAO))
+    relatorio_txt = not args.sem_relatorio_txt
+    registros = [None] * len(caminhos)
+    saida = {'aberta': True}
+
+    def emitir(i, resultado):
+        registros[i] = _registro(caminhos[i], resultado, args.sem_logs)
+        if args.formato == 'ndjson' and saida['aberta']:
+            saida['aberta'] = _escrever(json.dumps(registros[i], ensure_ascii=False) + '\n')
+            if not saida['aberta']:
+                aviso("⚠️  Saída padrão fechada - os próximos relatórios não serão escritos")
+
+    if len(caminhos) == 1:
+        # Um arquivo só: roda no próprio processo, sem abrir o pool
+        try:
+            resultado = validar_arquivo(caminhos[0], args.perfil, args.limite_streaming, tamanho_bloco, relatorio_txt,
+                                        args.anterior, args.salvar_impressao)
+        except Exception as e:
+            aviso(f"❌ {caminhos[0]}: {e}")
+            resultado = None
+        emitir(0, resultado)
+    else:
+        posicoes = {caminho: i for i, caminho in enumerate(caminhos)}
+
+        def ao_concluir(item, resultado):
+            i = posicoes[item['caminho']]
+            aviso(f"{'✅' if item.get('valido') else '❌'} {caminhos[i]}: {item.get('erros', '-')} erros")
+            emitir(i, resultado if item['status'] == 'concluido' else None)
+
+        validar_lote(caminhos, args.perfil, args.workers, args.limite_streaming, tamanho_bloco,
+                     ao_concluir=ao_concluir, relatorio_txt=relatorio_txt)
+
+    itens = [item_lote(registro['caminho'], registro['status'], registro['relatorio']) for registro in registros]
+    resumo = resumir_lote(itens)
+    if args.formato == 'json':
+        _escrever(json.dumps({'resumo': resumo, 'arquivos': registros}, ensure_ascii=False, indent=2) + '\n')
+
+    aviso(f"📊 {resumo['arquivos']} arquivos, {resumo['total_erros']} erros, {resumo['falhas']} falhas")
+    if resumo['falhas']:
+        return SAIDA_FALHA
+    if resumo['total_erros'] > args.max_erros:
+        return SAIDA_COM_ERROS
+    return SAIDA_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
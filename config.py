@@ -12,9 +12,69 @@ else:
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-validador-2024'
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
-    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+    # Maior envio aceito; fica bem acima de LIMITE_STREAMING_BYTES para os arquivos grandes chegarem ao modo
+    # streaming (o corpo passa de UPLOAD_MEMORIA_MAX_BYTES para um temporário em disco)
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
     ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
     
+    # Uploads até o limite ficam só em memória; os maiores vão para UPLOAD_FOLDER com o hash do conteúdo
+    # como nome, removidos depois de UPLOAD_TTL_SECONDS ou quando a pasta passar de UPLOAD_MAX_BYTES
+    # (nunca antes de UPLOAD_IDADE_MINIMA_SECONDS, enquanto ainda podem estar na fila)
+    UPLOAD_MEMORIA_MAX_BYTES = int(os.environ.get('UPLOAD_MEMORIA_MAX_BYTES', 8 * 1024 * 1024))
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 1024 * 1024 * 1024))
+    UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL_SECONDS', 24 * 3600))
+    UPLOAD_IDADE_MINIMA_SECONDS = int(os.environ.get('UPLOAD_IDADE_MINIMA_SECONDS', 3600))
+    
+    # Arquivos maiores que o limite são validados em blocos (modo streaming)
+    LIMITE_STREAMING_BYTES = int(os.environ.get('LIMITE_STREAMING_BYTES', 50 * 1024 * 1024))
+    TAMANHO_BLOCO_STREAMING = int(os.environ.get('TAMANHO_BLOCO_STREAMING', 50000))
+    
+    # Servidor WSGI (gunicorn -c gunicorn.conf.py): processos e threads de cada um. O app é
+    # carregado e aquecido uma vez no processo mestre (preload) e os workers nascem prontos
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+    GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+    
+    # Fila de validação em segundo plano. Cada processo do gunicorn tem o seu pool: os núcleos
+    # são divididos entre eles
+    JOBS_FOLDER = os.environ.get('JOBS_FOLDER', os.path.join(UPLOAD_FOLDER, 'jobs'))
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, (os.cpu_count() or 1) // GUNICORN_WORKERS)))
+    
+    # Estado, eventos, índice e planilha corrigida de cada job são removidos depois de JOBS_TTL_SECONDS
+    # ou, se JOBS_FOLDER passar de JOBS_MAX_BYTES, os dos jobs terminados mais antigos (nunca antes de
+    # JOBS_IDADE_MINIMA_SECONDS, enquanto o resultado ainda pode estar sendo consultado)
+    JOBS_MAX_BYTES = int(os.environ.get('JOBS_MAX_BYTES', 1024 * 1024 * 1024))
+    JOBS_TTL_SECONDS = int(os.environ.get('JOBS_TTL_SECONDS', 24 * 3600))
+    JOBS_IDADE_MINIMA_SECONDS = int(os.environ.get('JOBS_IDADE_MINIMA_SECONDS', 3600))
+    
+    # Cada job grava também a planilha corrigida, para download (/jobs/<id>/corrigido)
+    GERAR_PLANILHA_CORRIGIDA = os.environ.get('GERAR_PLANILHA_CORRIGIDA', 'True').lower() == 'true'
+    
+    # cProfile de cada validação (<job_id>.prof na pasta, para abrir com pstats/snakeviz); só para diagnóstico
+    CPROFILE_ATIVO = os.environ.get('CPROFILE_ATIVO', 'False').lower() == 'true'
+    CPROFILE_PASTA = os.environ.get('CPROFILE_PASTA', os.path.join(UPLOAD_FOLDER, 'cprofile'))
+    
+    # Lotes (vários arquivos ou um .zip no mesmo envio)
+    LOTE_MAX_ARQUIVOS = int(os.environ.get('LOTE_MAX_ARQUIVOS', 200))
+    LOTE_MAX_BYTES_EXTRAIDOS = int(os.environ.get('LOTE_MAX_BYTES_EXTRAIDOS', 500 * 1024 * 1024))
+    
+    # Cache de relatórios por hash do conteúdo do arquivo
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'True').lower() == 'true'
+    CACHE_FOLDER = os.environ.get('CACHE_FOLDER', os.path.join(UPLOAD_FOLDER, 'cache'))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    
+    # Perfil de regras usado quando o upload não escolhe um (regras/<perfil>.json)
+    PERFIL_PADRAO = os.environ.get('PERFIL_PADRAO', 'produtos')
+    
+    # Paginação da API de erros por linha
+    API_POR_PAGINA = int(os.environ.get('API_POR_PAGINA', 100))
+    API_MAX_POR_PAGINA = int(os.environ.get('API_MAX_POR_PAGINA', 5000))
+    
+    # Cada processo web grava suas métricas nesta pasta e /metrics soma as de todos (vários workers do
+    # gunicorn); é esvaziada quando o app sobe
+    METRICAS_PASTA = os.environ.get('METRICAS_PASTA', os.path.join(UPLOAD_FOLDER, 'metricas'))
+    
     # Configurações de logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
@@ -40,6 +100,10 @@ class StagingConfig(Config):
     LOG_LEVEL = 'INFO'
     SESSION_COOKIE_SECURE = True
     
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 2))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, (os.cpu_count() or 1) // GUNICORN_WORKERS)))
+    
     # Validações específicas para staging
     @classmethod
     def validate_config(cls):
@@ -54,6 +118,11 @@ class ProductionConfig(Config):
     LOG_LEVEL = 'WARNING'
     SESSION_COOKIE_SECURE = True
     
+    # Os pedidos web são leves (a validação roda no pool); mais processos só para usar mais núcleos
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', min(os.cpu_count() or 1, 4)))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, (os.cpu_count() or 1) // GUNICORN_WORKERS)))
+    
     # Configurações específicas de produção
     SENTRY_DSN = os.environ.get('SENTRY_DSN')
     
@@ -0,0 +1,466 @@
+"""
+Fila local de validações em segundo plano.
+
+Cada upload vira um job executado em um ProcessPoolExecutor, fora da
+requisição HTTP. O estado de cada job fica num arquivo JSON em disco
+(pasta_jobs/<job_id>.json), escrito pelo próprio processo que executa a
+validação - assim qualquer worker web consegue consultar o status, sem
+precisar de broker externo.
+
+Durante a execução, cada log e cada mudança de etapa é anexada como uma
+linha JSON em pasta_jobs/<job_id>.eventos, que o endpoint SSE acompanha.
+
+Com gerar_corrigido, cada job grava também a planilha corrigida em
+pasta_jobs/<job_id>.corrigido.<csv|xlsx>, disponível para download. Com
+pasta_cprofile, grava o cProfile da validação em pasta_cprofile/<job_id>.prof.
+
+ao_concluir(job_id, resumo) é chamado no processo que enviou o job quando
+ele termina (ou já nasce concluído pelo cache), com status, linhas, erros e
+as métricas da validação - é de onde saem os números de /metrics.
+
+O arquivo de um job pode ser um caminho ou o próprio conteúdo (bytes, com o
+nome original à parte): uploads pequenos vão da memória do processo web para
+o worker do pool sem passar pelo disco.
+
+Um lote (vários arquivos enviados juntos) é só uma lista de jobs, gravada
+em pasta_jobs/<lote_id>.lote.json; os jobs do lote rodam em paralelo no
+mesmo pool.
+
+Os arquivos de um job (estado, eventos, índice e planilha corrigida) e os
+de lote compartilham o id no início do nome. limpar() os remove juntos com
+a mesma regra da PastaUploads: passou da idade máxima, ou a pasta passou da
+cota e o job é dos mais antigos. Jobs pendentes ou em execução só saem pela
+idade máxima. enviar() chama limpar() no máximo uma vez por
+intervalo_limpeza segundos.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from validador_gabaritos import ValidadorProdutos, IndiceErros, TAMANHO_BLOCO_PADRAO, aquecer_processo
+from regras_validacao import obter_plano, PERFIL_PADRAO
+from lote_validacao import item_lote, resumir_lote
+from planilha_corrigida import extensao_corrigida
+from metricas import executar_com_cprofile
+from pasta_uploads import expirados
+
+# Status possíveis de um job
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+_ID_VALIDO = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _caminho_estado(pasta_jobs, job_id):
+    return os.path.join(pasta_jobs, f"{job_id}.json")
+
+
+def _gravar_estado(pasta_jobs, job_id, estado):
+    """Grava o estado do job de forma atômica (nunca há JSON pela metade)"""
+    caminho = _caminho_estado(pasta_jobs, job_id)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def _caminho_lote(pasta_jobs, lote_id):
+    return os.path.join(pasta_jobs, f"{lote_id}.lote.json")
+
+
+def _caminho_eventos(pasta_jobs, job_id):
+    return os.path.join(pasta_jobs, f"{job_id}.eventos")
+
+
+def caminho_indice(pasta_jobs, job_id):
+    """Arquivo com o índice de erros por linha do job (IndiceErros.salvar)"""
+    return os.path.join(pasta_jobs, f"{job_id}.indice.npz")
+
+
+def caminho_corrigido(pasta_jobs, job_id, arquivo):
+    """Planilha corrigida do job (mesmo formato do arquivo enviado; Excel sai em .xlsx)"""
+    return os.path.join(pasta_jobs, f"{job_id}.corrigido{extensao_corrigida(arquivo)}")
+
+
+def _resumo_job(estado):
+    """O que o processo web precisa saber de um job terminado, sem o relatório inteiro"""
+    resultado = estado.get('resultado') or {}
+    return {
+        'status': estado['status'],
+        'cache_hit': estado.get('cache_hit', False),
+        'linhas': resultado.get('resumo', {}).get('total_linhas', 0),
+        'erros': len(resultado.get('erros', [])),
+        'metricas': resultado.get('metricas'),
+    }
+
+
+class _RegistroEventos:
+    """Anexa logs e progresso do job ao arquivo de eventos (uma linha JSON por evento)"""
+
+    def __init__(self, caminho):
+        self.logs = []
+        self._arquivo = open(caminho, 'a', encoding='utf-8')
+
+    def _gravar(self, evento):
+        self._arquivo.write(json.dumps(evento, ensure_ascii=False) + '\n')
+        self._arquivo.flush()
+
+    def log(self, mensagem):
+        self.logs.append(mensagem)
+        self._gravar({'tipo': 'log', 'mensagem': mensagem})
+
+    def progresso(self, etapa, percentual):
+        self._gravar({'tipo': 'progresso', 'etapa': etapa, 'percentual': percentual})
+
+    def fechar(self, status):
+        self._gravar({'tipo': 'fim', 'status': status})
+        self._arquivo.close()
+
+
+def _executar_job(pasta_jobs, job_id, arquivo, limite_streaming, tamanho_bloco,
+                  perfil=PERFIL_PADRAO, cache=None, chave_cache=None, gerar_corrigido=False, pasta_cprofile=None,
+                  nome_arquivo=None):
+    """Roda a validação completa no processo do pool, grava o resultado e devolve _resumo_job"""
+    nome_arquivo = nome_arquivo or os.path.basename(arquivo)
+    estado = {
+        'job_id': job_id,
+        'arquivo': nome_arquivo,
+        'perfil': perfil,
+        'cache_hit': False,
+        'status': EXECUTANDO,
+        'inicio': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    _gravar_estado(pasta_jobs, job_id, estado)
+
+    eventos = _RegistroEventos(_caminho_eventos(pasta_jobs, job_id))
+    logs = eventos.logs
+    corrigido = caminho_corrigido(pasta_jobs, job_id, nome_arquivo) if gerar_corrigido else None
+    try:
+        validador = ValidadorProdutos(arquivo, log_callback=eventos.log,
+                                      progresso_callback=eventos.progresso, perfil=perfil,
+                                      arquivo_corrigido=corrigido, nome_arquivo=nome_arquivo)
+        tamanho = len(arquivo) if isinstance(arquivo, bytes) else os.path.getsize(arquivo)
+        if tamanho > limite_streaming:
+            executar, argumentos = validador.executar_validacao_streaming, (tamanho_bloco,)
+        else:
+            executar, argumentos = validador.executar_validacao_completa, ()
+        if pasta_cprofile:
+            destino = os.path.join(pasta_cprofile, f"{job_id}.prof")
+            resultado = executar_com_cprofile(destino, executar, *argumentos)
+            eventos.log(f"🔬 cProfile da validação salvo em: {destino}")
+        else:
+            resultado = executar(*argumentos)
+
+        if not resultado or 'resumo' not in resultado or not resultado['resumo']['arquivo_lido']:
+            eventos.log("❌ Erro: Não foi possível processar o arquivo")
+            resultado = None
+        else:
+            validador.indice.salvar(caminho_indice(pasta_jobs, job_id))
+    except Exception as e:
+        eventos.log(f"❌ Erro durante o processamento: {str(e)}")
+        resultado = None
+
+    estado.update({
+        'status': CONCLUIDO if resultado is not None else ERRO,
+        'fim': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'resultado': resultado,
+        'logs': logs,
+    })
+    _gravar_estado(pasta_jobs, job_id, estado)
+    if cache is not None and resultado is not None:
+        cache.guardar(chave_cache, resultado, caminho_indice(pasta_jobs, job_id), corrigido)
+    # O evento de fim vai depois do estado: quem o recebe já encontra o resultado gravado
+    eventos.fechar(estado['status'])
+    return _resumo_job(estado)
+
+
+class FilaValidacao:
+    """Envia validações para um pool de processos e consulta o estado dos jobs"""
+
+    def __init__(self, pasta_jobs, max_workers=None,
+                 limite_streaming=50 * 1024 * 1024, tamanho_bloco=TAMANHO_BLOCO_PADRAO, cache=None,
+                 gerar_corrigido=False, pasta_cprofile=None, ao_concluir=None,
+                 tamanho_maximo=1024 * 1024 * 1024, idade_maxima=24 * 3600, idade_minima=3600,
+                 intervalo_limpeza=60):
+        self.pasta_jobs = pasta_jobs
+        self.cache = cache
+        self.gerar_corrigido = gerar_corrigido
+        self.pasta_cprofile = pasta_cprofile
+        self.ao_concluir = ao_concluir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.limite_streaming = limite_streaming
+        self.tamanho_bloco = tamanho_bloco
+        self.tamanho_maximo = tamanho_maximo
+        self.idade_maxima = idade_maxima
+        self.idade_minima = idade_minima
+        self.intervalo_limpeza = intervalo_limpeza
+        self._ultima_limpeza = None
+        self._pool = None
+        os.makedirs(self.pasta_jobs, exist_ok=True)
+
+    @property
+    def pool(self):
+        # Criado sob demanda: só o processo que recebe uploads abre os workers.
+        # Cada worker carrega perfil e tabela NCM uma vez e os reaproveita em todos os jobs
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=aquecer_processo)
+        return self._pool
+
+    def enviar(self, arquivo, perfil=PERFIL_PADRAO, nome_arquivo=None, sha256=None):
+        """
+        Agenda a validação do arquivo com as regras do perfil e retorna o id do
+        job imediatamente. Se o mesmo conteúdo já foi validado com a mesma versão
+        do perfil (cache), o job já nasce concluído.
+        arquivo é um caminho ou o conteúdo (bytes); nome_arquivo é o nome original
+        (obrigatório com bytes) e sha256, o hash do conteúdo se já foi calculado.
+        """
+        self._limpar_periodicamente()
+        job_id = uuid.uuid4().hex
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        nome_arquivo = nome_arquivo or os.path.basename(arquivo)
+        estado = {
+            'job_id': job_id,
+            'arquivo': nome_arquivo,
+            'perfil': perfil,
+            'status': PENDENTE,
+            'criado_em': agora,
+            'cache_hit': False,
+        }
+        
+        chave_cache = None
+        if self.cache is not None:
+            if isinstance(arquivo, bytes):
+                sha256 = sha256 or hashlib.sha256(arquivo).hexdigest()
+                chave_cache = self.cache.chave(nome_arquivo, obter_plano(perfil), sha256)
+            else:
+                chave_cache = self.cache.chave(arquivo, obter_plano(perfil), sha256)
+            resultado = self.cache.obter(chave_cache)
+            if resultado is not None:
+                resultado['resumo']['arquivo'] = estado['arquivo']
+                self.cache.copiar_indice(chave_cache, caminho_indice(self.pasta_jobs, job_id))
+                if self.gerar_corrigido:
+                    self.cache.copiar_corrigido(chave_cache, caminho_corrigido(self.pasta_jobs, job_id, nome_arquivo))
+                estado.update({
+                    'status': CONCLUIDO,
+                    'cache_hit': True,
+                    'fim': agora,
+                    'resultado': resultado,
+                    'logs': resultado.get('logs', []),
+                })
+                _gravar_estado(self.pasta_jobs, job_id, estado)
+                if self.ao_concluir:
+                    self.ao_concluir(job_id, _resumo_job(estado))
+                return job_id
+        
+        _gravar_estado(self.pasta_jobs, job_id, estado)
+        futuro = self.pool.submit(_executar_job, self.pasta_jobs, job_id, arquivo,
+                                  self.limite_streaming, self.tamanho_bloco, perfil, self.cache, chave_cache,
+                                  self.gerar_corrigido, self.pasta_cprofile, nome_arquivo)
+        futuro.add_done_callback(lambda f: self._concluir(job_id, f))
+        return job_id
+
+    def _limpar_periodicamente(self):
+        agora = time.monotonic()
+        if self._ultima_limpeza is None or agora - self._ultima_limpeza >= self.intervalo_limpeza:
+            self._ultima_limpeza = agora
+            self.limpar()
+
+    def _arquivos_por_id(self):
+        """{id: (mtime mais recente, tamanho total, caminhos)} dos arquivos de jobs e lotes"""
+        grupos = {}
+        for nome in os.listdir(self.pasta_jobs):
+            identificador = nome[:32]
+            if nome[32:33] != '.' or not _ID_VALIDO.match(identificador):
+                continue
+            caminho = os.path.join(self.pasta_jobs, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue  # removido por outro processo
+            mtime, tamanho, caminhos = grupos.get(identificador, (0, 0, []))
+            grupos[identificador] = (max(mtime, info.st_mtime), tamanho + info.st_size, caminhos + [caminho])
+        return grupos
+
+    def limpar(self):
+        """Remove os arquivos dos jobs expirados e, se a pasta passar da cota, os dos jobs mais antigos"""
+        agora = time.time()
+        grupos = self._arquivos_por_id()
+        entradas = [(agora - mtime, tamanho, identificador) for identificador, (mtime, tamanho, _) in grupos.items()]
+        tamanho_maximo = self.tamanho_maximo
+        if sum(tamanho for _, tamanho, _ in entradas) > tamanho_maximo:
+            # Pela cota só saem jobs terminados: os em andamento ocupam a cota, mas ficam
+            em_andamento = {identificador for idade, _, identificador in entradas
+                            if self.idade_minima <= idade <= self.idade_maxima
+                            and (self.consultar(identificador) or {}).get('status') in (PENDENTE, EXECUTANDO)}
+            tamanho_maximo -= sum(tamanho for _, tamanho, identificador in entradas if identificador in em_andamento)
+            entradas = [entrada for entrada in entradas if entrada[2] not in em_andamento]
+        for identificador in expirados(entradas, tamanho_maximo, self.idade_maxima, self.idade_minima):
+            for caminho in grupos[identificador][2]:
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+
+    def enviar_lote(self, arquivos, perfil=PERFIL_PADRAO, lote_id=None):
+        """Agenda um job por arquivo (todos em paralelo) e retorna o id do lote"""
+        lote_id = lote_id or uuid.uuid4().hex
+        lote = {
+            'lote_id': lote_id,
+            'perfil': perfil,
+            'criado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'jobs': [self.enviar(arquivo, perfil) for arquivo in arquivos],
+        }
+        caminho = _caminho_lote(self.pasta_jobs, lote_id)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(lote, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        return lote_id
+
+    def consultar_lote(self, lote_id):
+        """Estado do lote com o status de cada job e o resumo combinado, ou None"""
+        if not _ID_VALIDO.match(lote_id or ''):
+            return None
+        try:
+            with open(_caminho_lote(self.pasta_jobs, lote_id), encoding='utf-8') as f:
+                lote = json.load(f)
+        except FileNotFoundError:
+            return None
+        
+        jobs = []
+        for job_id in lote['jobs']:
+            estado = self.consultar(job_id) or {'job_id': job_id, 'arquivo': '?', 'status': ERRO}
+            item = item_lote(estado['arquivo'], estado['status'], estado.get('resultado'))
+            item['job_id'] = job_id
+            item['cache_hit'] = estado.get('cache_hit', False)
+            jobs.append(item)
+        
+        terminados = sum(1 for item in jobs if item['status'] in (CONCLUIDO, ERRO))
+        lote.update({
+            'status': CONCLUIDO if terminados == len(jobs) else EXECUTANDO,
+            'terminados': terminados,
+            'jobs': jobs,
+            'resumo': resumir_lote(jobs),
+        })
+        return lote
+
+    def _concluir(self, job_id, futuro):
+        """Job terminado no pool: registra a falha do processo, se houve, e avisa ao_concluir"""
+        if futuro.cancelled():
+            return
+        if futuro.exception() is not None:
+            self._registrar_falha(job_id, futuro)
+            resumo = {'status': ERRO, 'cache_hit': False, 'linhas': 0, 'erros': 0, 'metricas': None}
+        else:
+            resumo = futuro.result()
+        if self.ao_concluir:
+            self.ao_concluir(job_id, resumo)
+
+    def _registrar_falha(self, job_id, futuro):
+        """Se o processo do pool morreu sem gravar o resultado, marca o job como erro"""
+        estado = self.consultar(job_id) or {'job_id': job_id}
+        estado.update({
+            'status': ERRO,
+            'fim': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'resultado': None,
+            'logs': estado.get('logs', []) + [f"❌ Erro durante o processamento: {futuro.exception()}"],
+        })
+        _gravar_estado(self.pasta_jobs, job_id, estado)
+        with open(_caminho_eventos(self.pasta_jobs, job_id), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'tipo': 'fim', 'status': ERRO}) + '\n')
+
+    def carregar_indice(self, job_id):
+        """IndiceErros do job concluído, ou None se o job não existir ou não tiver índice"""
+        if not _ID_VALIDO.match(job_id or ''):
+            return None
+        caminho = caminho_indice(self.pasta_jobs, job_id)
+        if not os.path.exists(caminho):
+            return None
+        return IndiceErros.carregar(caminho)
+
+    def arquivo_corrigido(self, job_id):
+        """Caminho da planilha corrigida do job concluído, ou None se não houver"""
+        estado = self.consultar(job_id)
+        if estado is None or estado['status'] != CONCLUIDO:
+            return None
+        caminho = caminho_corrigido(self.pasta_jobs, job_id, estado['arquivo'])
+        return caminho if os.path.exists(caminho) else None
+
+    def consultar(self, job_id):
+        """Estado atual do job (dict) ou None se o id não existir"""
+        if not _ID_VALIDO.match(job_id or ''):
+            return None
+        try:
+            with open(_caminho_estado(self.pasta_jobs, job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def acompanhar(self, job_id, a_partir_de=0, intervalo=0.25, pulsacao=15):
+        """
+        Gera (numero, evento) conforme o job grava seus eventos, a partir do
+        evento a_partir_de, até o evento de fim. Gera (None, None) a cada
+        `pulsacao` segundos sem novidade, para manter a conexão viva. Termina
+        assim que o job terminou e todos os eventos foram lidos, mesmo que
+        a_partir_de já esteja no fim (reconexão com Last-Event-ID).
+        """
+        caminho = _caminho_eventos(self.pasta_jobs, job_id)
+        numero = 0
+        pendente = ''
+        ultimo_envio = time.monotonic()
+        arquivo = None
+        terminado = False
+        try:
+            while True:
+                if arquivo is None and os.path.exists(caminho):
+                    arquivo = open(caminho, encoding='utf-8')
+                
+                novidade = False
+                if arquivo is not None:
+                    for trecho in iter(arquivo.readline, ''):
+                        pendente += trecho
+                        if not pendente.endswith('\n'):
+                            break  # linha ainda sendo escrita
+                        evento = json.loads(pendente)
+                        pendente = ''
+                        numero += 1
+                        if numero > a_partir_de:
+                            novidade = True
+                            yield numero, evento
+                        if evento['tipo'] == 'fim':
+                            return
+                
+                if novidade:
+                    ultimo_envio = time.monotonic()
+                    continue
+                if terminado:
+                    # Terminou e o arquivo (se existe) foi lido até o fim sem evento de fim
+                    if numero + 1 > a_partir_de:
+                        yield numero + 1, {'tipo': 'fim', 'status': estado['status']}
+                    return
+                estado = self.consultar(job_id)
+                if estado is None:
+                    return
+                if estado['status'] in (CONCLUIDO, ERRO):
+                    # O estado é gravado antes do evento de fim: lê o arquivo mais uma vez antes de encerrar
+                    terminado = True
+                    continue
+                if time.monotonic() - ultimo_envio >= pulsacao:
+                    ultimo_envio = time.monotonic()
+                    yield None, None
+                time.sleep(intervalo)
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+
+    def encerrar(self, aguardar=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=aguardar)
+            self._pool = None
@@ -0,0 +1,29 @@
+"""
+Configuração do gunicorn para staging e produção:
+
+    FLASK_ENV=production gunicorn -c gunicorn.conf.py
+
+Processos, threads e timeout vêm da classe do ambiente em config.py
+(GUNICORN_*). Com preload_app, criar_app roda uma vez no processo mestre,
+antes do fork: os workers já nascem com pandas, openpyxl, os perfis de
+regras, a tabela NCM e os templates carregados (páginas compartilhadas por
+copy-on-write), e o primeiro pedido de cada um custa o mesmo que os outros.
+As métricas de cada worker vão para METRICAS_PASTA e /metrics, em qualquer
+um deles, soma as de todos.
+"""
+import os
+
+from config import config as _configuracoes  # 'config' é uma opção do gunicorn
+
+_ambiente = _configuracoes.get(os.environ.get('FLASK_ENV', 'development'), _configuracoes['default'])
+
+wsgi_app = 'app:criar_app()'
+preload_app = True
+bind = f"{_ambiente.HOST}:{_ambiente.PORT}"
+workers = _ambiente.GUNICORN_WORKERS
+# Threads: cada conexão de /jobs/<id>/eventos (SSE) fica presa a uma até o job terminar
+worker_class = 'gthread'
+threads = _ambiente.GUNICORN_THREADS
+timeout = _ambiente.GUNICORN_TIMEOUT
+accesslog = '-'
+loglevel = _ambiente.LOG_LEVEL.lower()
@@ -0,0 +1,141 @@
+"""
+Leitura tipada das planilhas, pelo esquema do perfil.
+
+Sem tipos, o pandas deixa toda coluna com texto como object: um str do
+Python por célula. O perfil diz o que esperar de cada coluna:
+
+    "categoricas": ["pFornecedor", "pUN", ...]   poucos valores distintos -> category
+    "textos": ["pDescricao", "pNCM", ...]        texto -> string[pyarrow]
+
+category guarda um código de 1 byte por linha e cada valor distinto uma vez
+só; string[pyarrow] guarda os textos num buffer contínuo do Arrow. O pyarrow
+está no requirements.txt e com ele o CSV inteiro é lido pelo leitor do Arrow
+(multithread); sem ele, o texto é lido como str (object) pelo leitor C do
+pandas. A leitura em blocos usa sempre o leitor C (o do Arrow não lê em
+blocos), com os mesmos tipos.
+
+No CSV todas as colunas têm o tipo fixado antes da leitura: as categóricas
+como category e as demais como texto. Nada é inferido, nem na planilha
+inteira nem bloco a bloco - '007', '1.000' e '0.0' chegam às regras como
+estão no arquivo, e a validação em blocos vê os mesmos valores que a completa
+(inferindo por bloco, '0' e '0.0' virariam o mesmo número só nos blocos sem
+texto). '01012100' e '0012345678905' não perdem o zero à esquerda; as regras
+numéricas convertem os textos. No Excel as células já têm tipo: as colunas
+ficam object com os valores das células e "textos" só vira string[pyarrow]
+quando a coluna é toda texto. materializar devolve a coluna como object.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+CATEGORIA = 'category'
+TEXTO = 'string[pyarrow]'
+
+
+def tipos_leitura(plano, colunas):
+    """Coluna do CSV -> dtype da leitura: category nas categóricas, texto nas demais (string[pyarrow], ou str sem o pyarrow)"""
+    resolvedor = plano.resolver(colunas)
+    tipos = dict.fromkeys(colunas, TEXTO if pyarrow is not None else str)
+    for coluna in plano.colunas_categoricas:
+        real = resolvedor.real(coluna)
+        if real is not None:
+            tipos[real] = CATEGORIA
+    return tipos
+
+
+def _por_codigos(valores, codigos):
+    """valores[codigos], com NaN onde o código for -1 (inteiros viram float, como numa coluna com vazios)"""
+    valores = np.asarray(valores)
+    if (codigos < 0).any():
+        valores = valores.astype(np.float64 if valores.dtype.kind in 'iuf' or not len(valores) else object)
+        valores = np.append(valores, np.nan)  # o código -1 pega o último
+    return valores[codigos]
+
+
+def materializar(serie):
+    """A coluna como a leitura sem tipos a daria: category e string viram object (ou números, se as categorias forem)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        valores = _por_codigos(serie.cat.categories.to_numpy(), serie.cat.codes.to_numpy())
+    elif isinstance(serie.dtype, pd.StringDtype):
+        valores = serie.to_numpy(dtype=object, na_value=np.nan)
+    else:
+        return serie
+    return pd.Series(valores, index=serie.index, name=serie.name)
+
+
+def tipar(df, plano):
+    """Tipos do perfil num DataFrame já lido (Excel): category e, com pyarrow, string nas colunas de texto"""
+    resolvedor = plano.resolver(df.columns)
+    categoricas = {resolvedor.real(coluna) for coluna in plano.colunas_categoricas} - {None}
+    for real in categoricas:
+        df[real] = df[real].astype(CATEGORIA)
+    if pyarrow is None:
+        return df
+    for coluna in plano.colunas_texto:
+        real = resolvedor.real(coluna)
+        if real is not None and real not in categoricas and pd.api.types.infer_dtype(df[real], skipna=True) == 'string':
+            df[real] = df[real].astype(TEXTO)  # só textos: números do Excel continuam números
+    return df
+
+
+def _do_inicio(fonte):
+    """Caminho, ou arquivo aberto de volta ao início (o mesmo arquivo é lido mais de uma vez)"""
+    if hasattr(fonte, 'seek'):
+        fonte.seek(0)
+    return fonte
+
+
+def colunas_csv(fonte, sep, encoding):
+    """Cabeçalho do CSV (caminho ou arquivo binário) com os nomes que o pandas dá (colunas sem nome viram 'Unnamed: N')"""
+    return pd.read_csv(_do_inicio(fonte), sep=sep, encoding=encoding, nrows=0).columns
+
+
+def _ler_csv_arrow(fonte, sep, encoding, colunas, tipos):
+    """
+    CSV inteiro pelo leitor do Arrow, tudo como texto (string[pyarrow]) e as
+    categóricas como category.
+    None se o Arrow recusar o arquivo (linhas com colunas a mais, bytes
+    inválidos no encoding...) - aí vale o leitor C.
+    """
+    from pyarrow import csv as pa_csv
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    try:
+        tabela = pa_csv.read_csv(
+            _do_inicio(fonte),
+            read_options=pa_csv.ReadOptions(column_names=list(colunas), skip_rows=1, encoding=encoding),
+            parse_options=pa_csv.ParseOptions(delimiter=sep),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={coluna: pyarrow.string() for coluna in colunas},
+                null_values=sorted(STR_NA_VALUES | {''}),  # os mesmos valores vazios do pandas
+                strings_can_be_null=True,
+            ),
+        )
+    except (pyarrow.ArrowInvalid, UnicodeError):
+        return None
+    df = tabela.to_pandas(types_mapper={pyarrow.string(): pd.StringDtype('pyarrow')}.get)
+    for coluna in df.columns:
+        if tipos.get(coluna) == CATEGORIA:
+            df[coluna] = df[coluna].astype(CATEGORIA)
+    return df
+
+
+def ler_csv(fonte, sep, encoding, plano):
+    """CSV inteiro (caminho ou arquivo binário) com os tipos do perfil (Arrow se houver pyarrow, senão o leitor C)"""
+    colunas = colunas_csv(fonte, sep, encoding)
+    tipos = tipos_leitura(plano, colunas)
+    df = None
+    if pyarrow is not None and colunas.is_unique:
+        df = _ler_csv_arrow(fonte, sep, encoding, colunas, tipos)
+    if df is None:
+        df = pd.read_csv(_do_inicio(fonte), sep=sep, encoding=encoding, dtype=tipos)
+    return df
+
+
+def ler_csv_em_blocos(arquivo, sep, encoding, tipos, tamanho_bloco):
+    """Blocos de um CSV (arquivo aberto) com os tipos do perfil, pelo leitor C"""
+    yield from pd.read_csv(arquivo, sep=sep, encoding=encoding, chunksize=tamanho_bloco, dtype=tipos)
@@ -0,0 +1,219 @@
+"""
+Validação de vários arquivos de uma vez (lote).
+
+Um lote pode vir de vários uploads, de um .zip ou de uma pasta (linha de
+comando). Os arquivos são distribuídos num ProcessPoolExecutor com um
+processo por núcleo, então o lote leva mais ou menos o tempo do arquivo
+mais lento, não a soma de todos. Cada arquivo gera o seu relatório normal
+e resumir_lote junta tudo num resumo único.
+
+Uso pela linha de comando:
+
+    python lote_validacao.py <pasta> [--perfil produtos] [--workers 8] [--saida resumo.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from validador_gabaritos import ValidadorProdutos, TAMANHO_BLOCO_PADRAO, aquecer_processo
+from regras_validacao import PERFIL_PADRAO
+
+EXTENSOES_PLANILHA = ('.csv', '.xlsx', '.xls')
+
+# Limites de um .zip enviado como lote (protege contra zip bombs)
+MAX_ARQUIVOS_LOTE = 200
+MAX_BYTES_EXTRAIDOS = 500 * 1024 * 1024
+
+
+class LoteInvalido(ValueError):
+    """Zip corrompido, vazio ou acima dos limites do lote"""
+
+
+def nome_unico(nome, usados):
+    """Nome ainda não usado no lote: 'a.csv', 'a_2.csv', 'a_3.csv'..."""
+    base, ext = os.path.splitext(nome)
+    candidato, n = nome, 1
+    while candidato.lower() in usados:
+        n += 1
+        candidato = f"{base}_{n}{ext}"
+    usados.add(candidato.lower())
+    return candidato
+
+
+def extrair_zip(caminho_zip, destino, max_arquivos=MAX_ARQUIVOS_LOTE, max_bytes=MAX_BYTES_EXTRAIDOS, usados=None):
+    """
+    Extrai só as planilhas do zip para destino (sem subpastas) e retorna os caminhos.
+    Nomes vindos do zip nunca são usados como caminho: só o nome base, deduplicado
+    contra usados (nomes já ocupados em destino).
+    """
+    from werkzeug.utils import secure_filename
+
+    try:
+        zf = zipfile.ZipFile(caminho_zip)
+    except zipfile.BadZipFile:
+        raise LoteInvalido("Arquivo .zip inválido ou corrompido")
+
+    with zf:
+        membros = [m for m in zf.infolist()
+                   if not m.is_dir() and os.path.splitext(m.filename)[1].lower() in EXTENSOES_PLANILHA
+                   and not os.path.basename(m.filename).startswith(('.', '~$'))]
+        if not membros:
+            raise LoteInvalido("O .zip não contém planilhas (.csv, .xlsx, .xls)")
+        if len(membros) > max_arquivos:
+            raise LoteInvalido(f"O .zip tem {len(membros)} planilhas (máximo {max_arquivos})")
+        if sum(m.file_size for m in membros) > max_bytes:
+            raise LoteInvalido(f"O conteúdo do .zip passa de {max_bytes // (1024 * 1024)} MB")
+
+        os.makedirs(destino, exist_ok=True)
+        usados = set() if usados is None else usados
+        caminhos = []
+        for membro in membros:
+            nome = secure_filename(os.path.basename(membro.filename)) or f"planilha{os.path.splitext(membro.filename)[1].lower()}"
+            caminho = os.path.join(destino, nome_unico(nome, usados))
+            with zf.open(membro) as origem, open(caminho, 'wb') as saida:
+                shutil.copyfileobj(origem, saida)
+            caminhos.append(caminho)
+    return caminhos
+
+
+def listar_planilhas(pasta, recursivo=False):
+    """Planilhas da pasta (e subpastas, se recursivo), em ordem alfabética"""
+    caminhos = []
+    for raiz, subpastas, arquivos in os.walk(pasta):
+        subpastas.sort()
+        caminhos.extend(os.path.join(raiz, nome) for nome in sorted(arquivos)
+                        if os.path.splitext(nome)[1].lower() in EXTENSOES_PLANILHA and not nome.startswith(('.', '~$')))
+        if not recursivo:
+            break
+    return caminhos
+
+
+def item_lote(arquivo, status, resultado):
+    """Linha do resumo de um arquivo do lote"""
+    item = {'arquivo': arquivo, 'status': status}
+    if resultado and 'resumo' in resultado:
+        resumo = resultado['resumo']
+        item.update({
+            'total_linhas': resumo['total_linhas'],
+            'linhas_invalidas': resumo['linhas_invalidas'],
+            'percentual_validas': resumo['percentual_validas'],
+            'erros': len(resultado['erros']),
+            'avisos': len(resultado['warnings']),
+            'valido': not resultado['erros'],
+        })
+    return item
+
+
+def resumir_lote(itens):
+    """Resumo combinado dos itens do lote (ver item_lote)"""
+    concluidos = [item for item in itens if 'total_linhas' in item]
+    total_linhas = sum(item['total_linhas'] for item in concluidos)
+    linhas_invalidas = sum(item['linhas_invalidas'] for item in concluidos)
+    return {
+        'arquivos': len(itens),
+        'concluidos': len(concluidos),
+        'falhas': sum(1 for item in itens if item['status'] == 'erro'),
+        'validos': sum(1 for item in concluidos if item['valido']),
+        'com_problemas': sum(1 for item in concluidos if not item['valido']),
+        'total_linhas': total_linhas,
+        'linhas_validas': total_linhas - linhas_invalidas,
+        'linhas_invalidas': linhas_invalidas,
+        'percentual_validas': round(((total_linhas - linhas_invalidas) / total_linhas) * 100, 2) if total_linhas > 0 else 0,
+        'total_erros': sum(item['erros'] for item in concluidos),
+        'total_avisos': sum(item['avisos'] for item in concluidos),
+    }
+
+
+def validar_arquivo(caminho, perfil=PERFIL_PADRAO, limite_streaming=50 * 1024 * 1024, tamanho_bloco=TAMANHO_BLOCO_PADRAO,
+                    relatorio_txt=True, anterior=None, salvar_impressao=None):
+    """
+    Valida um arquivo (no processo do pool) e retorna o relatório, ou None se falhar.
+    anterior: impressão ou planilha da versão anterior (validação incremental);
+    salvar_impressao: .npz onde gravar a impressão desta versão.
+    """
+    validador = ValidadorProdutos(caminho, perfil=perfil, relatorio_txt=relatorio_txt, anterior=anterior,
+                                  gerar_impressao=salvar_impressao is not None)
+    if os.path.getsize(caminho) > limite_streaming:
+        resultado = validador.executar_validacao_streaming(tamanho_bloco)
+    else:
+        resultado = validador.executar_validacao_completa()
+    if not resultado or 'resumo' not in resultado or not resultado['resumo']['arquivo_lido']:
+        return None
+    if salvar_impressao is not None and validador.impressao is not None:
+        validador.impressao.salvar(salvar_impressao)
+    return resultado
+
+
+def validar_lote(caminhos, perfil=PERFIL_PADRAO, max_workers=None, limite_streaming=50 * 1024 * 1024,
+                 tamanho_bloco=TAMANHO_BLOCO_PADRAO, ao_concluir=None, relatorio_txt=True):
+    """
+    Valida todos os arquivos em paralelo. Retorna (itens, resultados, resumo),
+    com itens e resultados na ordem de caminhos. ao_concluir(item, resultado)
+    é chamado conforme cada arquivo termina.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(caminhos), 1))
+    resultados = [None] * len(caminhos)
+    itens = [None] * len(caminhos)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=aquecer_processo, initargs=(perfil,)) as pool:
+        futuros = {pool.submit(validar_arquivo, caminho, perfil, limite_streaming, tamanho_bloco, relatorio_txt): i
+                   for i, caminho in enumerate(caminhos)}
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+            except Exception as e:
+                resultados[i] = {'erro': str(e)}
+            ok = resultados[i] is not None and 'resumo' in resultados[i]
+            itens[i] = item_lote(os.path.basename(caminhos[i]), 'concluido' if ok else 'erro', resultados[i])
+            itens[i]['caminho'] = caminhos[i]
+            if ao_concluir:
+                ao_concluir(itens[i], resultados[i])
+    return itens, resultados, resumir_lote(itens)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida todas as planilhas de uma pasta em paralelo")
+    parser.add_argument('pasta', help="Pasta com os arquivos .csv/.xlsx/.xls")
+    parser.add_argument('--perfil', default=os.environ.get('PERFIL_PADRAO', PERFIL_PADRAO), help="Perfil de regras (regras/<perfil>.json)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos em paralelo (padrão: um por núcleo)")
+    parser.add_argument('--recursivo', action='store_true', help="Inclui as subpastas")
+    parser.add_argument('--saida', help="Grava o resumo combinado e os relatórios em JSON neste arquivo")
+    args = parser.parse_args(argv)
+
+    caminhos = listar_planilhas(args.pasta, args.recursivo)
+    if not caminhos:
+        print(f"❌ Nenhuma planilha encontrada em {args.pasta}")
+        return 2
+
+    print(f"📦 Validando {len(caminhos)} arquivos com o perfil '{args.perfil}'...")
+    inicio = time.perf_counter()
+
+    def ao_concluir(item, resultado):
+        if item['status'] != 'concluido':
+            print(f"❌ {item['arquivo']}: falha ao processar")
+        else:
+            icone = '✅' if item['valido'] else '⚠️ '
+            print(f"{icone} {item['arquivo']}: {item['total_linhas']} linhas, {item['erros']} erros, {item['avisos']} avisos")
+
+    itens, resultados, resumo = validar_lote(caminhos, args.perfil, args.workers, ao_concluir=ao_concluir)
+
+    print("="*80)
+    print(f"📊 {resumo['arquivos']} arquivos em {time.perf_counter() - inicio:.1f}s - "
+          f"✅ {resumo['validos']} válidos, ⚠️  {resumo['com_problemas']} com problemas, ❌ {resumo['falhas']} falhas")
+    print(f"📊 Linhas: {resumo['total_linhas']} ({resumo['percentual_validas']}% válidas)")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'resumo': resumo, 'arquivos': itens, 'resultados': resultados}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resumo do lote salvo em: {args.saida}")
+
+    return 0 if resumo['falhas'] == 0 and resumo['com_problemas'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+Instrumentação da validação e métricas no formato do Prometheus.
+
+MedidorEtapas mede cada etapa de uma validação (carregar o arquivo,
+verificar a estrutura, cada coluna do plano...): tempo, linhas por segundo e
+pico de memória residente (RSS). No Linux o pico é zerado no início de cada
+etapa (/proc/self/clear_refs), então ele é o da própria etapa; nos outros
+sistemas é o pico do processo até ali. O resumo vai no relatório ('metricas')
+e no relatório em texto.
+
+RegistroMetricas guarda contadores e histogramas do processo web e os
+exporta no formato de texto do Prometheus (/metrics), sem depender do
+prometheus_client. Com uma pasta compartilhada (compartilhar), os números de
+todos os workers do gunicorn são somados em cada /metrics.
+"""
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+
+# Intervalo mínimo (segundos) entre duas gravações das métricas do processo na pasta compartilhada
+INTERVALO_GRAVACAO = 1.0
+
+
+def pico_memoria():
+    """Pico de memória residente do processo em bytes (VmHWM), ou None se não der para medir"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024  # macOS informa em bytes, Linux em KB
+
+
+def zerar_pico_memoria():
+    """Zera o pico de memória do processo (Linux 4.0+); sem efeito onde não houver suporte"""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+class MedidorEtapas:
+    """Tempo, linhas e pico de memória de cada etapa; etapas repetidas (blocos) se somam"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}  # nome -> {'segundos', 'linhas', 'pico_memoria'}, na ordem em que aparecem
+
+    @contextmanager
+    def etapa(self, nome, linhas=0):
+        """Mede o bloco with; a medida (dict) é devolvida para somar linhas conhecidas só no fim"""
+        medida = self.etapas.setdefault(nome, {'segundos': 0.0, 'linhas': 0, 'pico_memoria': 0})
+        medida['linhas'] += linhas
+        zerar_pico_memoria()
+        inicio = time.perf_counter()
+        try:
+            yield medida
+        finally:
+            medida['segundos'] += time.perf_counter() - inicio
+            medida['pico_memoria'] = max(medida['pico_memoria'], pico_memoria() or 0)
+
+    def resumo(self, total_linhas):
+        """Métricas da validação até agora, para o relatório"""
+        segundos = time.perf_counter() - self.inicio
+        etapas = []
+        for nome, medida in self.etapas.items():
+            etapa = {
+                'etapa': nome,
+                'segundos': round(medida['segundos'], 4),
+                'linhas': medida['linhas'],
+                'linhas_por_segundo': round(medida['linhas'] / medida['segundos']) if medida['segundos'] > 0 and medida['linhas'] else None,
+                'pico_memoria_mb': round(medida['pico_memoria'] / MB, 1) if medida['pico_memoria'] else None,
+            }
+            etapas.append(etapa)
+        picos = [medida['pico_memoria'] for medida in self.etapas.values() if medida['pico_memoria']]
+        return {
+            'segundos': round(segundos, 4),
+            'linhas': total_linhas,
+            'linhas_por_segundo': round(total_linhas / segundos) if segundos > 0 and total_linhas else None,
+            'pico_memoria_mb': round(max(picos) / MB, 1) if picos else None,
+            'etapas': etapas,
+        }
+
+
+def executar_com_cprofile(destino, funcao, *args, **kwargs):
+    """Executa funcao sob o cProfile e grava as estatísticas (pstats) em destino"""
+    import cProfile
+
+    perfilador = cProfile.Profile()
+    try:
+        return perfilador.runcall(funcao, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        perfilador.dump_stats(destino)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=()):
+    pares = list(zip(nomes, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Contador (só cresce), opcionalmente com rótulos"""
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=(), trava=None, ao_mudar=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._trava = trava or threading.Lock()
+        self._ao_mudar = ao_mudar
+        self._valores = {}
+
+    def inc(self, valor=1, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self._trava:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+            if self._ao_mudar:
+                self._ao_mudar()
+
+    def estado(self):
+        """Valores do processo em forma de JSON (chamar com a trava)"""
+        return [[list(chave), valor] for chave, valor in self._valores.items()]
+
+    def zerar(self):
+        self._valores = {}
+
+    def amostras(self, estados=None):
+        """Linhas do Prometheus com a soma dos estados (de cada processo); sem estados, as deste processo"""
+        if estados is None:
+            with self._trava:
+                estados = [self.estado()]
+        valores = {}
+        for estado in estados:
+            for chave, valor in estado:
+                valores[tuple(chave)] = valores.get(tuple(chave), 0) + valor
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+                for chave, valor in sorted(valores.items())]
+
+
+class Histograma:
+    """Histograma com limites fixos (buckets cumulativos, soma e contagem)"""
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, limites, rotulos=(), trava=None, ao_mudar=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.limites = tuple(sorted(limites)) + (math.inf,)
+        self.rotulos = tuple(rotulos)
+        self._trava = trava or threading.Lock()
+        self._ao_mudar = ao_mudar
+        self._series = {}  # rótulos -> [contagens por limite, soma, total]
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(str(rotulos[nome]) for nome in self.rotulos)
+        with self._trava:
+            serie = self._series.setdefault(chave, [[0] * len(self.limites), 0.0, 0])
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+            if self._ao_mudar:
+                self._ao_mudar()
+
+    def estado(self):
+        """Séries do processo em forma de JSON (chamar com a trava)"""
+        return [[list(chave), list(contagens), soma, total] for chave, (contagens, soma, total) in self._series.items()]
+
+    def zerar(self):
+        self._series = {}
+
+    def amostras(self, estados=None):
+        """Linhas do Prometheus com a soma dos estados (de cada processo); sem estados, as deste processo"""
+        if estados is None:
+            with self._trava:
+                estados = [self.estado()]
+        series = {}
+        for estado in estados:
+            for chave, contagens, soma, total in estado:
+                serie = series.setdefault(tuple(chave), [[0] * len(self.limites), 0.0, 0])
+                serie[0] = [a + b for a, b in zip(serie[0], contagens)]
+                serie[1] += soma
+                serie[2] += total
+        linhas = []
+        for chave, (contagens, soma, total) in sorted(series.items()):
+            for limite, contagem in zip(self.limites, contagens):
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, [('le', _numero(limite))])} {contagem}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+
+class RegistroMetricas:
+    """
+    Métricas exportadas no formato de texto do Prometheus (versão 0.0.4).
+
+    Sem pasta, cada processo exporta só os próprios números. Com
+    compartilhar(pasta), cada processo grava seus valores em
+    pasta/<pid>-<id>.json e exportar() soma os arquivos de todos: com vários
+    workers do gunicorn, /metrics dá o mesmo total em qualquer um deles, e os
+    contadores não caem quando o pedido cai em outro worker. O arquivo de um
+    worker que morreu fica (os contadores não diminuem); compartilhar() apaga
+    os de uma execução anterior.
+
+    Uma mudança só marca o registro como alterado: o arquivo é regravado no
+    máximo uma vez a cada intervalo_gravacao segundos (um timer grava o que
+    ficou pendente), em cada /metrics atendido pelo processo e na saída do
+    processo. Os números dos outros workers chegam com até intervalo_gravacao
+    de atraso.
+    """
+    TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, intervalo_gravacao=INTERVALO_GRAVACAO):
+        self._trava = threading.Lock()
+        self._metricas = []
+        self.pasta = None
+        self.intervalo_gravacao = intervalo_gravacao
+        self._arquivo = None
+        self._alterado = False
+        self._ultima_gravacao = None
+        self._timer = None
+        if hasattr(os, 'register_at_fork'):
+            # Um worker nasce com uma cópia do registro do mestre: começa do zero, com o próprio arquivo
+            os.register_at_fork(after_in_child=self._apos_fork)
+        atexit.register(self.descarregar)
+
+    def contador(self, nome, ajuda, rotulos=()):
+        metrica = Contador(nome, ajuda, rotulos, self._trava, self._mudou)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome, ajuda, limites, rotulos=()):
+        metrica = Histograma(nome, ajuda, limites, rotulos, self._trava, self._mudou)
+        self._metricas.append(metrica)
+        return metrica
+
+    def compartilhar(self, pasta):
+        """Soma as métricas de todos os processos que usam a pasta; apaga os arquivos de execuções anteriores"""
+        os.makedirs(pasta, exist_ok=True)
+        for nome in os.listdir(pasta):
+            if nome.endswith('.json'):
+                try:
+                    os.remove(os.path.join(pasta, nome))
+                except FileNotFoundError:
+                    pass
+        self.pasta = pasta
+        self._arquivo = None
+        self._ultima_gravacao = None
+
+    def _apos_fork(self):
+        self._trava = threading.Lock()
+        for metrica in self._metricas:
+            metrica._trava = self._trava
+            metrica.zerar()
+        self._arquivo = None
+        self._alterado = False
+        self._ultima_gravacao = None
+        self._timer = None  # o timer do mestre não existe no worker
+
+    def _estado(self):
+        return {metrica.nome: metrica.estado() for metrica in self._metricas}
+
+    def _mudou(self):
+        """Chamado com a trava a cada inc/observar: grava já ou deixa para o timer"""
+        if self.pasta is None:
+            return
+        self._alterado = True
+        agora = time.monotonic()
+        if self._ultima_gravacao is None or agora - self._ultima_gravacao >= self.intervalo_gravacao:
+            self._gravar()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.intervalo_gravacao - (agora - self._ultima_gravacao), self._ao_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _ao_timer(self):
+        with self._trava:
+            self._timer = None
+            self._descarregar()
+
+    def _descarregar(self):
+        """Grava se houver mudança ainda não gravada (chamado com a trava)"""
+        if self._alterado and self.pasta is not None:
+            self._gravar()
+
+    def descarregar(self):
+        """Grava agora as mudanças pendentes (na saída do processo, por exemplo)"""
+        with self._trava:
+            self._descarregar()
+
+    def _gravar(self):
+        """Grava os valores do processo na pasta compartilhada (chamado com a trava)"""
+        if self._arquivo is None:
+            self._arquivo = os.path.join(self.pasta, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        temporario = f"{self._arquivo}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self._estado(), f)
+        os.replace(temporario, self._arquivo)
+        self._alterado = False
+        self._ultima_gravacao = time.monotonic()
+
+    def _estados(self):
+        """Valores de cada processo: os deste, da memória, e os dos outros, da pasta compartilhada"""
+        with self._trava:
+            self._descarregar()  # quem raspa este worker deixa o arquivo dele em dia para os outros
+            estados = [self._estado()]
+            proprio = self._arquivo
+        if self.pasta is None:
+            return estados
+        for nome in os.listdir(self.pasta):
+            caminho = os.path.join(self.pasta, nome)
+            if not nome.endswith('.json') or caminho == proprio:
+                continue
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    estados.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue  # apagado ou sendo trocado por outro processo
+        return estados
+
+    def exportar(self):
+        estados = self._estados()
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.amostras([estado.get(metrica.nome, []) for estado in estados]))
+        return '\n'.join(linhas) + '\n'
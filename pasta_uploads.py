@@ -0,0 +1,135 @@
+"""
+Planilhas enviadas que precisam ficar em disco, com cota e idade máxima.
+
+Uploads até o limite em memória (UPLOAD_MEMORIA_MAX_BYTES) vão da memória
+direto para a validação e nunca chegam aqui. Os maiores são guardados como
+`pasta/<sha256>.<ext>`: o nome vem do conteúdo, nunca do usuário, então dois
+envios de `produtos.xlsx` ao mesmo tempo não se sobrescrevem e o mesmo
+conteúdo é guardado uma vez só. Os lotes ficam em `pasta/lotes/<lote_id>/`.
+
+limpar() remove o que passou da idade máxima e, se a pasta passar da cota,
+o que foi enviado há mais tempo. O que é mais novo que a idade mínima nunca
+é removido: ainda pode estar na fila de validação. O mtime marca o último
+envio (reenviar o mesmo conteúdo o atualiza).
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+
+TAMANHO_LEITURA = 1024 * 1024
+
+_NOME_GUARDADO = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+_LOTE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _tamanho_pasta(caminho):
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def expirados(entradas, tamanho_maximo, idade_maxima, idade_minima):
+    """
+    O que remover de uma pasta com cota e idade máxima. entradas são
+    (idade em segundos, tamanho em bytes, item); retorna os itens que passaram
+    da idade máxima e, enquanto o restante passar de tamanho_maximo, os mais
+    antigos. Nada mais novo que idade_minima é retornado.
+    """
+    remover = []
+    restantes = []
+    for idade, tamanho, item in entradas:
+        if idade > max(idade_maxima, idade_minima):
+            remover.append(item)
+        else:
+            restantes.append((idade, tamanho, item))
+
+    total = sum(tamanho for _, tamanho, _ in restantes)
+    for idade, tamanho, item in sorted(restantes, key=lambda entrada: entrada[0], reverse=True):
+        if total <= tamanho_maximo or idade < idade_minima:
+            break
+        remover.append(item)
+        total -= tamanho
+    return remover
+
+
+class PastaUploads:
+    """Uploads guardados pelo hash do conteúdo, com limite de tamanho e expiração"""
+
+    def __init__(self, pasta, tamanho_maximo=1024 * 1024 * 1024, idade_maxima=24 * 3600, idade_minima=3600):
+        self.pasta = pasta
+        self.pasta_lotes = os.path.join(pasta, 'lotes')
+        self.tamanho_maximo = tamanho_maximo
+        self.idade_maxima = idade_maxima
+        self.idade_minima = idade_minima
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def guardar(self, origem, nome):
+        """
+        Copia o arquivo aberto origem (desde o início) para pasta/<sha256>.<ext>,
+        calculando o hash na mesma leitura. Retorna (caminho, sha256).
+        """
+        _, ext = os.path.splitext(nome)
+        temporario = os.path.join(self.pasta, f".{uuid.uuid4().hex}.tmp")
+        sha = hashlib.sha256()
+        origem.seek(0)
+        try:
+            with open(temporario, 'wb') as destino:
+                for pedaco in iter(lambda: origem.read(TAMANHO_LEITURA), b''):
+                    sha.update(pedaco)
+                    destino.write(pedaco)
+            sha256 = sha.hexdigest()
+            caminho = os.path.join(self.pasta, f"{sha256}{ext.lower()}")
+            # Mesmo conteúdo já guardado: o rename só troca um arquivo pelo seu igual
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        self.limpar()
+        return caminho, sha256
+
+    def pasta_lote(self, lote_id):
+        """Pasta (criada) para os arquivos do lote"""
+        pasta = os.path.join(self.pasta_lotes, lote_id)
+        os.makedirs(pasta, exist_ok=True)
+        return pasta
+
+    def _entradas(self):
+        """(caminho, é pasta) de cada upload guardado: arquivos pelo hash e pastas de lote"""
+        entradas = [(os.path.join(self.pasta, nome), False)
+                    for nome in os.listdir(self.pasta) if _NOME_GUARDADO.match(nome)]
+        if os.path.isdir(self.pasta_lotes):
+            entradas += [(os.path.join(self.pasta_lotes, nome), True)
+                         for nome in os.listdir(self.pasta_lotes) if _LOTE.match(nome)]
+        return entradas
+
+    def _remover(self, caminho, pasta):
+        if pasta:
+            shutil.rmtree(caminho, ignore_errors=True)
+        else:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def limpar(self):
+        """Remove uploads expirados e, se passar da cota, os enviados há mais tempo"""
+        agora = time.time()
+        entradas = []
+        for caminho, pasta in self._entradas():
+            try:
+                idade = agora - os.stat(caminho).st_mtime
+                tamanho = _tamanho_pasta(caminho) if pasta else os.path.getsize(caminho)
+            except FileNotFoundError:
+                continue  # removido por outro processo
+            entradas.append((idade, tamanho, (caminho, pasta)))
+        for caminho, pasta in expirados(entradas, self.tamanho_maximo, self.idade_maxima, self.idade_minima):
+            self._remover(caminho, pasta)
@@ -0,0 +1,69 @@
+"""
+Gravação da planilha corrigida (valores padrão aplicados, NCM limpo, nomes
+de coluna esperados), bloco a bloco.
+
+CSV sai com o mesmo separador e encoding do arquivo enviado, para o sistema
+que importa a planilha não perceber diferença; Excel (.xlsx ou .xls) sai
+sempre em .xlsx, gravado com o openpyxl em modo write-only, que despeja as
+linhas em disco conforme chegam. Nos dois casos só o bloco atual fica em
+memória.
+"""
+import os
+
+
+def extensao_corrigida(arquivo):
+    """Extensão da planilha corrigida: .csv para CSV, .xlsx para qualquer Excel"""
+    return '.csv' if os.path.splitext(arquivo)[1].lower() == '.csv' else '.xlsx'
+
+
+class EscritorPlanilha:
+    """Anexa blocos (DataFrames com as mesmas colunas) a um .csv ou .xlsx"""
+
+    def __init__(self, caminho, sep=';', encoding='utf-8'):
+        self.caminho = caminho
+        self.sep = sep
+        self.encoding = encoding  # o arquivo é aberto uma vez: BOM (utf-8-sig, utf-16) só no início
+        self.formato = extensao_corrigida(caminho)
+        self.linhas = 0
+        self._arquivo = None
+        self._livro = None
+        self._planilha = None
+
+    def escrever(self, df):
+        if self.formato == '.csv':
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho, 'w', encoding=self.encoding, errors='replace', newline='')
+                df.to_csv(self._arquivo, sep=self.sep, index=False)
+            else:
+                df.to_csv(self._arquivo, sep=self.sep, index=False, header=False)
+        else:
+            if self._livro is None:
+                from openpyxl import Workbook
+                self._livro = Workbook(write_only=True)
+                self._planilha = self._livro.create_sheet()
+                self._planilha.append([str(coluna) for coluna in df.columns])
+            # NaN vira célula vazia; o restante vai como está (números continuam números)
+            valores = df.astype(object).where(df.notna(), None)
+            for linha in valores.itertuples(index=False, name=None):
+                self._planilha.append(linha)
+        self.linhas += len(df)
+
+    def fechar(self):
+        """Conclui o arquivo (no .xlsx é aqui que o livro é gravado)"""
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        if self._livro is not None:
+            self._livro.save(self.caminho)
+            self._livro = None
+
+    def descartar(self):
+        """Fecha e apaga um arquivo que ficou pela metade"""
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        self._livro = None
+        try:
+            os.remove(self.caminho)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,288 @@
+"""
+Perfis declarativos de validação (um JSON por gabarito de fornecedor).
+
+Cada perfil em regras/<nome>.json descreve as colunas esperadas e as regras
+que se aplicam a elas:
+
+    {
+        "nome": "produtos",
+        "colunas": ["pIndice", "pCodigo", ...],
+        "obrigatorias": "todas" | ["pCodigo", ...],
+        "valores_padrao": {"pCodigoBarras": "SEM GTIN", ...},
+        "numericos": ["pTamanho", ...],
+        "dominios": {"pOrigem CST": ["0", "2"]},
+        "ncm": ["pNCM"],
+        "unicos": {"pCodigo": ["-1"], "pCodigoBarras": ["SEM GTIN"]},
+        "gtin": {"pCodigoBarras": ["SEM GTIN"]},
+        "categoricas": ["pFornecedor", "pUN", ...],
+        "textos": ["pDescricao", ...],
+        "comparacao": {"chave": ["pCodigo", "pReferencia"], "precos": ["pPreçoVenda"], "ignorar": ["pIndice"]},
+        "consistencia": {
+            "mesmo_valor": {"pReferencia": ["pPreçoVenda"]},
+            "proporcoes": {"pM²/Pallet": {"fatores": ["pMúltiplo"], "multiplo_inteiro": true}},
+            "precos_minimos": {"pPreçoVenda": {"custo": "pCusto", "markup": "pMarkup"}},
+            "atipicos": {"pPreçoVenda": ["pFornecedor", "pLinha"]}
+        }
+    }
+
+Em "unicos" e "gtin", a lista de cada coluna traz os valores de preenchimento
+(ex.: 'SEM GTIN') que não contam como chave repetida nem são conferidos.
+
+"categoricas" (poucos valores distintos) e "textos" (texto livre) são só
+tipos de leitura - category e string[pyarrow] gastam menos memória que
+object (ver leitura_tipada); não são regras. As colunas de "ncm", "unicos",
+"gtin" e a chave de "comparacao" também são lidas como texto: o zero à
+esquerda faz parte do código.
+
+"comparacao" serve à validação incremental (versoes_catalogo): as colunas que
+identificam um produto entre versões do catálogo, as de preço (variações vão
+para o relatório) e as que mudam sem o produto mudar (ex.: o número da linha).
+
+"consistencia" são as regras entre colunas e entre linhas, todas sobre
+valores numéricos (zero, negativos e vazios contam como não informados):
+linhas com a mesma chave devem ter o mesmo valor nas colunas listadas; a
+coluna de "proporcoes" deve ser o produto dos fatores (ou um múltiplo
+inteiro dele, com multiplo_inteiro); o preço não pode ficar abaixo de
+custo x (1 + markup) - markup em fração, ou em % com "markup_percentual": true;
+e os valores muito fora do grupo (mesmos valores nas colunas de agrupamento)
+são apontados como atípicos.
+
+Um perfil pode declarar "herda": "<outro perfil>" e sobrescrever só as
+chaves que mudam. O perfil é compilado uma vez num PlanoValidacao, que
+agrupa as regras por coluna (cada coluna é percorrida uma única vez) e
+fica em cache enquanto o arquivo não mudar.
+
+Os nomes de coluna são comparados normalizados (sem acentos, espaços,
+pontuação e maiúsculas): o cabeçalho de cada arquivo é resolvido uma vez
+num ResolvedorColunas, que diz qual coluna real atende cada coluna do perfil.
+"""
+import difflib
+import functools
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+PASTA_REGRAS = os.environ.get('PASTA_REGRAS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regras'))
+PERFIL_PADRAO = 'produtos'
+
+# Ordem em que as operações de uma coluna são executadas no passe único.
+# 'ncm' fica por último porque a validação de NCM limpa as células inválidas.
+OPERACOES = ['vazio', 'dominio', 'numerico', 'unico', 'gtin', 'ncm']
+
+# Similaridade mínima (0 a 1, entre nomes normalizados) para aceitar uma coluna com nome aproximado
+SIMILARIDADE_MINIMA_COLUNA = 0.85
+
+_planos = {}  # nome -> (assinatura dos arquivos, PlanoValidacao)
+
+
+@functools.lru_cache(maxsize=4096)
+def normalizar_nome_coluna(nome):
+    """Nome sem acentos e caracteres especiais, em minúsculas ('pPreçoVenda' -> 'pprecovenda')"""
+    nfkd = unicodedata.normalize('NFKD', str(nome))
+    sem_acentos = ''.join(c for c in nfkd if not unicodedata.combining(c))
+    return re.sub(r'[^a-zA-Z0-9]', '', sem_acentos).lower()
+
+
+class ResolvedorColunas:
+    """
+    Casa as colunas de um cabeçalho com as colunas esperadas do perfil.
+
+    Ordem de preferência: nome idêntico, nome normalizado idêntico e, por
+    último, o nome normalizado mais parecido (difflib) acima de
+    SIMILARIDADE_MINIMA_COLUNA. Cada coluna do arquivo atende no máximo uma
+    coluna esperada.
+    """
+
+    def __init__(self, esperadas, normalizadas, colunas):
+        self.mapa = {}          # coluna esperada -> coluna real do arquivo
+        self.aproximadas = []   # (esperada, real, similaridade) casadas por semelhança
+        livres = list(colunas)
+        normalizadas_livres = {}
+        for coluna in livres:
+            normalizadas_livres.setdefault(normalizar_nome_coluna(coluna), coluna)
+
+        pendentes = []
+        for esperada, normalizada in zip(esperadas, normalizadas):
+            if esperada in livres:
+                real = esperada
+            elif normalizada in normalizadas_livres:
+                real = normalizadas_livres[normalizada]
+            else:
+                pendentes.append((esperada, normalizada))
+                continue
+            self.mapa[esperada] = real
+            livres.remove(real)
+            normalizadas_livres.pop(normalizar_nome_coluna(real), None)
+
+        # Nomes aproximados: os pares mais parecidos são casados primeiro
+        candidatos = []
+        for esperada, normalizada in pendentes:
+            for coluna in livres:
+                similaridade = difflib.SequenceMatcher(None, normalizada, normalizar_nome_coluna(coluna)).ratio()
+                if similaridade >= SIMILARIDADE_MINIMA_COLUNA:
+                    candidatos.append((similaridade, esperada, coluna))
+        for similaridade, esperada, coluna in sorted(candidatos, key=lambda c: -c[0]):
+            if esperada in self.mapa or coluna not in livres:
+                continue
+            self.mapa[esperada] = coluna
+            self.aproximadas.append((esperada, coluna, round(similaridade, 2)))
+            livres.remove(coluna)
+
+        self.faltando = [esperada for esperada in esperadas if esperada not in self.mapa]
+        self.extras = livres
+
+    def real(self, esperada):
+        """Coluna do arquivo que atende a coluna esperada, ou None"""
+        return self.mapa.get(esperada)
+
+    def renomeadas(self):
+        """Colunas esperadas cujo nome no arquivo é diferente: [(real, esperada)]"""
+        return [(real, esperada) for esperada, real in self.mapa.items() if real != esperada]
+
+
+class PerfilInvalido(ValueError):
+    """Perfil de regras inexistente ou mal formado"""
+
+
+class PlanoValidacao:
+    """Perfil compilado: listas de regras e o plano de operações por coluna"""
+
+    def __init__(self, nome, definicao, versao):
+        self.nome = nome
+        self.descricao = definicao.get('descricao', '')
+        self.versao = versao
+
+        self.colunas_esperadas = list(definicao['colunas'])
+        obrigatorias = definicao.get('obrigatorias', 'todas')
+        self.colunas_obrigatorias = self.colunas_esperadas if obrigatorias == 'todas' else list(obrigatorias)
+        self.campos_padrao = dict(definicao.get('valores_padrao', {}))
+        self.campos_numericos = list(definicao.get('numericos', []))
+        self.dominios = {coluna: [str(v) for v in valores] for coluna, valores in definicao.get('dominios', {}).items()}
+        self.colunas_ncm = list(definicao.get('ncm', []))
+        self.unicos = {coluna: [str(v) for v in ignorar] for coluna, ignorar in definicao.get('unicos', {}).items()}
+        self.colunas_gtin = {coluna: [str(v) for v in ignorar] for coluna, ignorar in definicao.get('gtin', {}).items()}
+        self.colunas_categoricas = list(definicao.get('categoricas', []))
+        comparacao = definicao.get('comparacao', {})
+        self.chave_produto = list(comparacao.get('chave', []))
+        # Códigos e chaves são lidos como texto mesmo sem estar em "textos": '007' não vira 7
+        self.colunas_texto = list(dict.fromkeys(list(definicao.get('textos', [])) + self.colunas_ncm
+                                                + list(self.unicos) + list(self.colunas_gtin)
+                                                + self.chave_produto))
+        self.colunas_preco = list(comparacao.get('precos', []))
+        self.ignorar_na_comparacao = list(comparacao.get('ignorar', []))
+        consistencia = definicao.get('consistencia', {})
+        self.mesmo_valor = {chave: list(colunas) for chave, colunas in consistencia.get('mesmo_valor', {}).items()}
+        self.proporcoes = {coluna: {'fatores': list(regra['fatores']), 'multiplo_inteiro': bool(regra.get('multiplo_inteiro'))}
+                           for coluna, regra in consistencia.get('proporcoes', {}).items()}
+        self.precos_minimos = {coluna: {'custo': regra['custo'], 'markup': regra.get('markup'),
+                                        'markup_percentual': bool(regra.get('markup_percentual'))}
+                               for coluna, regra in consistencia.get('precos_minimos', {}).items()}
+        self.atipicos = {coluna: list(grupos) for coluna, grupos in consistencia.get('atipicos', {}).items()}
+        colunas_consistencia = (
+            [coluna for chave, colunas in self.mesmo_valor.items() for coluna in [chave] + colunas]
+            + [coluna for resultado, regra in self.proporcoes.items() for coluna in [resultado] + regra['fatores']]
+            + [coluna for preco, regra in self.precos_minimos.items()
+               for coluna in (preco, regra['custo'], regra['markup']) if coluna]
+            + [coluna for valor, grupos in self.atipicos.items() for coluna in [valor] + grupos])
+        self.colunas_consistencia = list(dict.fromkeys(colunas_consistencia))
+        self.tem_consistencia = bool(colunas_consistencia)
+
+        # Nomes normalizados uma vez só, na compilação; os resolvedores ficam em cache por cabeçalho
+        todas = list(dict.fromkeys(self.colunas_esperadas + self.colunas_obrigatorias + list(self.campos_padrao)
+                                   + self.campos_numericos + list(self.dominios) + self.colunas_ncm
+                                   + list(self.unicos) + list(self.colunas_gtin)
+                                   + self.colunas_categoricas + self.colunas_texto
+                                   + self.chave_produto + self.colunas_preco + colunas_consistencia))
+        self.colunas_conhecidas = todas
+        self.colunas_normalizadas = [normalizar_nome_coluna(coluna) for coluna in todas]
+        self._resolvedores = {}
+
+        # Plano: coluna -> operações, na ordem de OPERACOES
+        operacoes = {}
+        for coluna in list(self.colunas_obrigatorias) + list(self.campos_padrao):
+            operacoes.setdefault(coluna, set()).add('vazio')
+        for coluna in self.dominios:
+            operacoes.setdefault(coluna, set()).add('dominio')
+        for coluna in self.campos_numericos:
+            operacoes.setdefault(coluna, set()).add('numerico')
+        for coluna in self.colunas_ncm:
+            operacoes.setdefault(coluna, set()).add('ncm')
+        for coluna in self.unicos:
+            operacoes.setdefault(coluna, set()).add('unico')
+        for coluna in self.colunas_gtin:
+            operacoes.setdefault(coluna, set()).add('gtin')
+        self.operacoes = {coluna: [op for op in OPERACOES if op in ops] for coluna, ops in operacoes.items()}
+
+    def resolver(self, colunas):
+        """ResolvedorColunas do cabeçalho, calculado uma vez por cabeçalho distinto"""
+        chave = tuple(colunas)
+        resolvedor = self._resolvedores.get(chave)
+        if resolvedor is None:
+            if len(self._resolvedores) >= 256:
+                self._resolvedores.clear()
+            resolvedor = self._resolvedores[chave] = ResolvedorColunas(self.colunas_conhecidas, self.colunas_normalizadas, chave)
+        return resolvedor
+
+    def __repr__(self):
+        return f"PlanoValidacao({self.nome!r}, {len(self.operacoes)} colunas, versao={self.versao})"
+
+
+def _caminho_perfil(nome):
+    if not nome or os.sep in nome or (os.altsep and os.altsep in nome) or nome.startswith('.'):
+        raise PerfilInvalido(f"Nome de perfil inválido: {nome!r}")
+    return os.path.join(PASTA_REGRAS, f"{nome}.json")
+
+
+def _ler_definicao(nome, visitados=()):
+    """Lê o perfil resolvendo "herda"; retorna (definição, arquivos usados)"""
+    if nome in visitados:
+        raise PerfilInvalido(f"Herança circular entre perfis: {' -> '.join(visitados + (nome,))}")
+    caminho = _caminho_perfil(nome)
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            definicao = json.load(f)
+    except FileNotFoundError:
+        raise PerfilInvalido(f"Perfil de regras não encontrado: {nome}")
+    except json.JSONDecodeError as e:
+        raise PerfilInvalido(f"Perfil {nome} com JSON inválido: {e}")
+
+    arquivos = [caminho]
+    if 'herda' in definicao:
+        base, arquivos_base = _ler_definicao(definicao['herda'], visitados + (nome,))
+        base.update({chave: valor for chave, valor in definicao.items() if chave != 'herda'})
+        definicao = base
+        arquivos = arquivos_base + arquivos
+    if 'colunas' not in definicao:
+        raise PerfilInvalido(f"Perfil {nome} não define 'colunas'")
+    return definicao, arquivos
+
+
+def _assinatura(arquivos):
+    return tuple((caminho, os.stat(caminho).st_mtime_ns) for caminho in arquivos)
+
+
+def obter_plano(nome=PERFIL_PADRAO):
+    """PlanoValidacao do perfil, compilado uma vez e reaproveitado enquanto os arquivos não mudarem"""
+    em_cache = _planos.get(nome)
+    if em_cache is not None:
+        assinatura, plano = em_cache
+        try:
+            if _assinatura([caminho for caminho, _ in assinatura]) == assinatura:
+                return plano
+        except FileNotFoundError:
+            pass
+
+    definicao, arquivos = _ler_definicao(nome)
+    conteudo = json.dumps(definicao, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    plano = PlanoValidacao(nome, definicao, hashlib.sha256(conteudo).hexdigest()[:12])
+    _planos[nome] = (_assinatura(arquivos), plano)
+    return plano
+
+
+def listar_perfis():
+    """Nomes dos perfis disponíveis em PASTA_REGRAS"""
+    if not os.path.isdir(PASTA_REGRAS):
+        return []
+    return sorted(nome[:-len('.json')] for nome in os.listdir(PASTA_REGRAS) if nome.endswith('.json'))
@@ -0,0 +1,163 @@
+"""
+Tabela oficial de NCM (Nomenclatura Comum do Mercosul) para conferir os
+códigos das planilhas.
+
+A tabela fica num arquivo local - CSV `codigo;descricao` ou SQLite com a
+tabela `ncm(codigo, descricao)` - em TABELA_NCM (padrão dados/ncm.csv). Ela é
+lida uma vez por processo (obter_tabela) e reaproveitada por todas as
+validações daquele processo; os workers da fila a carregam ao iniciar.
+
+Para gerar o arquivo a partir da tabela publicada pela Receita/Siscomex
+(download em JSON ou CSV):
+
+    python tabela_ncm.py importar Tabela_NCM_Vigente.json [--destino dados/ncm.csv]
+
+O repositório traz dados/ncm.csv já importado (inclusive na imagem Docker,
+que pode trocá-lo pela versão publicada com ARG NCM_URL); para atualizar,
+importe a tabela vigente e faça commit do arquivo. Sem a tabela a conferência
+fica desativada: o app avisa ao iniciar e o relatório traz um aviso.
+"""
+import argparse
+import bisect
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+TABELA_NCM = os.environ.get('TABELA_NCM', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'ncm.csv'))
+TAMANHO_NCM = 8
+
+_tabelas = {}  # caminho -> (mtime, TabelaNCM)
+
+
+def so_digitos(codigo):
+    """'0101.21.00' -> '01012100'"""
+    return ''.join(c for c in str(codigo) if c.isdigit())
+
+
+class TabelaNCM:
+    """Índice em memória: conjunto dos códigos de 8 dígitos, lista ordenada para prefixos e descrições"""
+
+    def __init__(self, registros, versao=''):
+        self.versao = versao  # identifica o conteúdo carregado (entra na chave do cache de relatórios)
+        self.descricoes = {}
+        for codigo, descricao in registros:
+            codigo = so_digitos(codigo)
+            if codigo:
+                self.descricoes[codigo] = descricao
+        # Só os códigos completos (8 dígitos) são NCM válidos; capítulos e posições servem de descrição
+        self.ordenados = sorted(codigo for codigo in self.descricoes if len(codigo) == TAMANHO_NCM)
+        self.codigos = frozenset(self.ordenados)
+        # Índice com a tabela hash montada uma vez: existem() só consulta, bloco após bloco
+        self._indice = pd.Index(self.ordenados, dtype=object)
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def __contains__(self, codigo):
+        return codigo in self.codigos
+
+    def existem(self, codigos):
+        """Máscara booleana: quais códigos (Series/array de textos de 8 dígitos) estão na tabela"""
+        return self._indice.get_indexer(pd.Index(codigos, dtype=object)) >= 0
+
+    def _com_prefixo(self, prefixo):
+        inicio = bisect.bisect_left(self.ordenados, prefixo)
+        fim = bisect.bisect_left(self.ordenados, prefixo + '\x7f')
+        return self.ordenados[inicio:fim]
+
+    def sugerir(self, codigo, limite=3):
+        """Códigos válidos mais próximos: zeros à esquerda perdidos ou mesmo capítulo/posição/subposição"""
+        codigo = so_digitos(codigo)
+        if not codigo:
+            return []
+        if len(codigo) < TAMANHO_NCM and codigo.zfill(TAMANHO_NCM) in self.codigos:
+            return [codigo.zfill(TAMANHO_NCM)]  # Excel costuma apagar o zero dos capítulos 01 a 09
+        for tamanho in range(min(len(codigo), TAMANHO_NCM) - 1, 1, -1):
+            candidatos = self._com_prefixo(codigo[:tamanho])
+            if candidatos:
+                alvo = int(codigo[:TAMANHO_NCM].ljust(TAMANHO_NCM, '0'))
+                return sorted(candidatos, key=lambda c: abs(int(c) - alvo))[:limite]
+        return []
+
+    def descricao(self, codigo):
+        return self.descricoes.get(so_digitos(codigo))
+
+
+def _ler_registros(caminho):
+    """(código, descrição) do arquivo da tabela, conforme a extensão"""
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext in ('.sqlite', '.sqlite3', '.db'):
+        conexao = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        try:
+            return conexao.execute("SELECT codigo, descricao FROM ncm").fetchall()
+        finally:
+            conexao.close()
+    with open(caminho, encoding='utf-8-sig', newline='') as f:
+        leitor = csv.reader(f, delimiter=';')
+        next(leitor, None)  # cabeçalho
+        return [(linha[0], linha[1] if len(linha) > 1 else '') for linha in leitor if linha]
+
+
+def obter_tabela(caminho=None):
+    """
+    TabelaNCM do arquivo, carregada uma vez por processo (recarrega se o arquivo
+    mudar). Retorna None se não houver tabela - a conferência fica desativada.
+    """
+    caminho = caminho or TABELA_NCM
+    try:
+        mtime = os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    em_cache = _tabelas.get(caminho)
+    if em_cache is not None and em_cache[0] == mtime:
+        return em_cache[1]
+    tabela = TabelaNCM(_ler_registros(caminho), versao=f"ncm{mtime}")
+    _tabelas[caminho] = (mtime, tabela)
+    return tabela
+
+
+def importar(origem, destino):
+    """Converte a tabela publicada (JSON do Siscomex ou CSV) para o CSV codigo;descricao"""
+    registros = []
+    if origem.lower().endswith('.json'):
+        with open(origem, encoding='utf-8-sig') as f:
+            dados = json.load(f)
+        itens = dados.get('Nomenclaturas', dados) if isinstance(dados, dict) else dados
+        for item in itens:
+            registros.append((item.get('Codigo') or item.get('codigo'), item.get('Descricao') or item.get('descricao') or ''))
+    else:
+        with open(origem, encoding='utf-8-sig', newline='') as f:
+            amostra = f.read(4096)
+            f.seek(0)
+            leitor = csv.reader(f, csv.Sniffer().sniff(amostra, delimiters=';,\t'))
+            next(leitor, None)
+            registros.extend((linha[0], linha[1] if len(linha) > 1 else '') for linha in leitor if linha)
+
+    registros = [(so_digitos(codigo), ' '.join(str(descricao).split())) for codigo, descricao in registros if so_digitos(codigo)]
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f, delimiter=';')
+        escritor.writerow(['codigo', 'descricao'])
+        escritor.writerows(sorted(registros))
+    return sum(1 for codigo, _ in registros if len(codigo) == TAMANHO_NCM)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tabela NCM local usada na validação")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    cmd = sub.add_parser('importar', help="Converte a tabela oficial (JSON/CSV) para o formato local")
+    cmd.add_argument('origem')
+    cmd.add_argument('--destino', default=TABELA_NCM)
+    args = parser.parse_args(argv)
+
+    total = importar(args.origem, args.destino)
+    print(f"✅ {total} códigos NCM gravados em {args.destino}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Fixtures dos testes: planilhas pequenas montadas a partir do
+Castelli_v1_08.2025.csv e uma tabela NCM mínima.
+"""
+import os
+import sys
+from concurrent.futures import Future
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+CASTELLI = os.path.join(RAIZ, 'Castelli_v1_08.2025.csv')
+
+# Códigos da tabela NCM dos testes (os do Castelli e um do capítulo 01, com zero à esquerda)
+CODIGOS_NCM = ['01012100', '69072100', '69072200', '69072300', '69074000']
+
+
+class PoolSincrono:
+    """No lugar do ProcessPoolExecutor da fila: executa o job no próprio processo do teste"""
+
+    def submit(self, funcao, *argumentos):
+        futuro = Future()
+        futuro.set_result(funcao(*argumentos))
+        return futuro
+
+
+@pytest.fixture(autouse=True)
+def pasta_temporaria(tmp_path, monkeypatch):
+    """Cada teste roda numa pasta própria: relatórios e planilhas corrigidas não sujam o repositório"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def sem_tabela_ncm(tmp_path, monkeypatch):
+    """Sem a tabela NCM do repositório: só os testes com a fixture tabela_ncm conferem códigos"""
+    import tabela_ncm
+
+    monkeypatch.setattr(tabela_ncm, 'TABELA_NCM', str(tmp_path / 'sem_tabela_ncm.csv'))
+
+
+@pytest.fixture(params=['arrow', 'leitor_c'])
+def leitor(request, monkeypatch):
+    """Roda o teste com o leitor do Arrow e com o leitor C do pandas (sem pyarrow)"""
+    import leitura_tipada
+
+    if request.param == 'arrow':
+        pytest.importorskip('pyarrow')
+    else:
+        monkeypatch.setattr(leitura_tipada, 'pyarrow', None)
+    return request.param
+
+
+@pytest.fixture
+def castelli():
+    """As 145 linhas do Castelli como texto, para montar variações"""
+    return pd.read_csv(CASTELLI, sep=';', encoding='cp1252', dtype=str, keep_default_na=False)
+
+
+@pytest.fixture
+def gravar_csv(tmp_path):
+    """gravar_csv(df, nome) grava o DataFrame como o Castelli (cp1252, ';') e devolve o caminho"""
+    def gravar(df, nome='produtos.csv'):
+        caminho = str(tmp_path / nome)
+        df.to_csv(caminho, sep=';', index=False, encoding='cp1252')
+        return caminho
+    return gravar
+
+
+@pytest.fixture
+def tabela_ncm(sem_tabela_ncm, tmp_path, monkeypatch):
+    """Tabela NCM local com CODIGOS_NCM, usada por todos os validadores criados no teste"""
+    import tabela_ncm
+
+    caminho = tmp_path / 'ncm.csv'
+    caminho.write_text('codigo;descricao\n' + ''.join(f'{codigo};NCM {codigo}\n' for codigo in CODIGOS_NCM),
+                       encoding='utf-8')
+    monkeypatch.setattr(tabela_ncm, 'TABELA_NCM', str(caminho))
+    return tabela_ncm.obter_tabela()
+
+
+@pytest.fixture(params=['completa', 'streaming'])
+def validar(request):
+    """validar(caminho, **kwargs) roda o ValidadorProdutos na validação completa e na por blocos"""
+    from validador_gabaritos import ValidadorProdutos
+
+    def executar(caminho, tamanho_bloco=7, **kwargs):
+        validador = ValidadorProdutos(caminho, relatorio_txt=False, **kwargs)
+        if request.param == 'completa':
+            validador.executar_validacao_completa()
+        else:
+            validador.executar_validacao_streaming(tamanho_bloco)
+        return validador
+    return executar
+
+
+@pytest.fixture
+def app_teste(monkeypatch):
+    """O app de criar_app(), com pastas na pasta do teste e a fila executando os jobs no próprio processo"""
+    import app as modulo_app
+    from fila_validacao import FilaValidacao
+
+    monkeypatch.setattr(modulo_app, 'fila', None)
+    monkeypatch.setattr(modulo_app, 'uploads', None)
+    monkeypatch.setattr(modulo_app.metricas, 'pasta', None)  # criar_app aponta para a pasta deste teste
+    monkeypatch.setattr(FilaValidacao, 'pool', property(lambda fila: PoolSincrono()))
+    aplicacao = modulo_app.criar_app('development')
+    aplicacao.config['CACHE_ENABLED'] = False
+    yield aplicacao
+    modulo_app.indice_job.cache_clear()
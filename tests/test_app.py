@@ -0,0 +1,74 @@
+import io
+import os
+
+import pytest
+
+from config import config
+
+
+def _enviar(cliente, conteudo, nome='produtos.csv'):
+    return cliente.post('/', data={'file': (io.BytesIO(conteudo), nome)}, content_type='multipart/form-data',
+                        headers={'Accept': 'application/json'})
+
+
+@pytest.mark.parametrize('ambiente', sorted(config))
+def test_envio_maximo_acima_do_limite_de_streaming(ambiente):
+    assert config[ambiente].MAX_CONTENT_LENGTH > config[ambiente].LIMITE_STREAMING_BYTES
+
+
+def test_arquivo_acima_do_limite_e_validado_em_blocos(app_teste, castelli, gravar_csv):
+    with open(gravar_csv(castelli), 'rb') as f:
+        conteudo = f.read()
+    app_teste.config['LIMITE_STREAMING_BYTES'] = len(conteudo) - 1
+    app_teste.config['UPLOAD_MEMORIA_MAX_BYTES'] = 1024  # vai para o disco, como os arquivos grandes
+    app_teste.config['TAMANHO_BLOCO_STREAMING'] = 50
+
+    resposta = _enviar(app_teste.test_client(), conteudo)
+    assert resposta.status_code == 202
+    job = app_teste.test_client().get(resposta.get_json()['status_url'], headers={'Accept': 'application/json'})
+    job = job.get_json()
+    assert job['status'] == 'concluido'
+    resultado = app_teste.test_client().get(f"/jobs/{job['job_id']}/resultado").get_json()
+    assert resultado['resultado']['resumo']['total_linhas'] == len(castelli)
+    assert any('em blocos de 50 linhas' in log for log in resultado['logs'])
+
+
+def test_arquivo_abaixo_do_limite_e_validado_inteiro(app_teste, castelli, gravar_csv):
+    with open(gravar_csv(castelli), 'rb') as f:
+        conteudo = f.read()
+    resposta = _enviar(app_teste.test_client(), conteudo)
+    resultado = app_teste.test_client().get(f"/jobs/{resposta.get_json()['job_id']}/resultado").get_json()
+    assert not any('em blocos de' in log for log in resultado['logs'])
+
+
+def test_envio_acima_do_maximo_e_recusado(app_teste):
+    app_teste.config['MAX_CONTENT_LENGTH'] = 1024
+    assert _enviar(app_teste.test_client(), b'x' * 2048).status_code == 413
+
+
+def test_criar_app_com_a_configuracao_padrao(monkeypatch, castelli, gravar_csv, tmp_path):
+    import app as modulo_app
+    from conftest import PoolSincrono
+    from fila_validacao import FilaValidacao
+
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    monkeypatch.setattr(modulo_app, 'fila', None)
+    monkeypatch.setattr(modulo_app, 'uploads', None)
+    monkeypatch.setattr(modulo_app.metricas, 'pasta', None)
+    monkeypatch.setattr(FilaValidacao, 'pool', property(lambda fila: PoolSincrono()))
+    aplicacao = modulo_app.criar_app()
+    cliente = aplicacao.test_client()
+
+    assert aplicacao.config['PERFIL_PADRAO'] in modulo_app.listar_perfis()
+    assert cliente.get('/').status_code == 200
+    with open(gravar_csv(castelli), 'rb') as f:
+        resposta = _enviar(cliente, f.read())
+    assert resposta.status_code in (200, 202)
+    assert cliente.get(resposta.get_json()['status_url']).get_json()['status'] == 'concluido'
+
+    metricas = cliente.get('/metrics')
+    assert metricas.status_code == 200
+    assert metricas.content_type.startswith('text/plain; version=0.0.4')
+    assert 'validador_uploads_total{tipo="arquivo"}' in metricas.get_data(as_text=True)
+    # A raspagem deixa o arquivo deste processo em dia na pasta compartilhada
+    assert any(nome.endswith('.json') for nome in os.listdir(aplicacao.config['METRICAS_PASTA']))
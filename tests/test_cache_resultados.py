@@ -0,0 +1,95 @@
+import os
+import time
+
+from cache_resultados import CacheResultados
+from conftest import PoolSincrono
+from fila_validacao import CONCLUIDO, FilaValidacao, caminho_indice
+
+DIA = 24 * 3600
+
+
+def _entrada(cache, chave, tamanho=100, criada_ha=0, acessada_ha=0):
+    """Entrada com JSON de ~tamanho bytes, criada (mtime) e acessada (atime) há tantos segundos"""
+    cache.guardar(chave, {'resumo': {}, 'dados': 'x' * tamanho})
+    agora = time.time()
+    os.utime(cache._caminho(chave), (agora - acessada_ha, agora - criada_ha))
+
+
+def test_entrada_expirada_pelo_mtime(tmp_path):
+    cache = CacheResultados(str(tmp_path), ttl=DIA)
+    _entrada(cache, 'velha', criada_ha=DIA + 60, acessada_ha=0)  # acessada agora, mas criada antes do TTL
+    _entrada(cache, 'nova', criada_ha=DIA - 60)
+
+    assert cache.obter('velha') is None
+    assert not os.path.exists(cache._caminho('velha'))
+    assert cache.obter('nova') is not None
+
+
+def test_obter_marca_o_acesso_sem_mudar_a_criacao(tmp_path):
+    cache = CacheResultados(str(tmp_path))
+    _entrada(cache, 'a', criada_ha=3600, acessada_ha=3600)
+    criada = os.stat(cache._caminho('a')).st_mtime
+
+    cache.obter('a')
+    info = os.stat(cache._caminho('a'))
+    assert info.st_mtime == criada
+    assert time.time() - info.st_atime < 60
+
+
+def test_limite_de_tamanho_remove_as_menos_acessadas(tmp_path):
+    cache = CacheResultados(str(tmp_path), tamanho_maximo=10 ** 6)
+    for chave, acessada_ha in (('antiga', 300), ('media', 200), ('recente', 100)):
+        _entrada(cache, chave, tamanho=1000, acessada_ha=acessada_ha)
+        with open(cache._caminho_anexo(chave, 'indice.npz'), 'wb') as f:
+            f.write(b'i' * 1000)  # os anexos contam no tamanho
+    tamanho_entrada = os.path.getsize(cache._caminho('antiga')) + 1000
+
+    cache.tamanho_maximo = 2 * tamanho_entrada
+    cache.limpar()
+    assert sorted(nome for nome in os.listdir(tmp_path)) == [
+        'media.indice.npz', 'media.json', 'recente.indice.npz', 'recente.json']
+
+    cache.obter('media')  # passa a ser a mais recente
+    cache.tamanho_maximo = tamanho_entrada
+    cache.limpar()
+    assert sorted(nome for nome in os.listdir(tmp_path)) == ['media.indice.npz', 'media.json']
+
+
+def test_limite_de_tamanho_ao_guardar(tmp_path):
+    cache = CacheResultados(str(tmp_path), tamanho_maximo=2500)
+    for i in range(5):
+        _entrada(cache, f'e{i}', tamanho=1000, acessada_ha=100 - i)
+    assert sorted(os.listdir(tmp_path)) == ['e3.json', 'e4.json']
+
+
+class _PoolContador(PoolSincrono):
+    def __init__(self):
+        self.validacoes = 0
+
+    def submit(self, funcao, *argumentos):
+        self.validacoes += 1
+        return super().submit(funcao, *argumentos)
+
+
+def test_cache_hit_devolve_o_relatorio_sem_validar_de_novo(tmp_path, castelli, gravar_csv):
+    fila = FilaValidacao(str(tmp_path / 'jobs'), cache=CacheResultados(str(tmp_path / 'cache')))
+    fila._pool = _PoolContador()
+    caminho = gravar_csv(castelli)
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+
+    primeiro = fila.consultar(fila.enviar(caminho))
+    segundo_id = fila.enviar(conteudo, nome_arquivo='outro_nome.csv')  # mesmo conteúdo, outro nome
+    segundo = fila.consultar(segundo_id)
+
+    assert fila._pool.validacoes == 1
+    assert (primeiro['cache_hit'], segundo['cache_hit']) == (False, True)
+    assert segundo['status'] == CONCLUIDO
+    assert segundo['resultado']['resumo']['arquivo'] == 'outro_nome.csv'
+    primeiro['resultado']['resumo']['arquivo'] = 'outro_nome.csv'
+    assert segundo['resultado'] == primeiro['resultado']
+    assert os.path.exists(caminho_indice(fila.pasta_jobs, segundo_id))
+
+    castelli.loc[0, 'pNCM'] = '69072100'  # conteúdo diferente: valida de novo
+    fila.enviar(gravar_csv(castelli, 'alterado.csv'))
+    assert fila._pool.validacoes == 2
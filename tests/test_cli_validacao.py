@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import RAIZ
+
+CLI = os.path.join(RAIZ, 'cli_validacao.py')
+
+
+@pytest.fixture
+def executar(tmp_path):
+    """Roda o cli_validacao.py num processo à parte, sem a tabela NCM do repositório"""
+    ambiente = dict(os.environ, TABELA_NCM=str(tmp_path / 'sem_tabela_ncm.csv'), PYTHONIOENCODING='utf-8')
+
+    def executar(*argumentos, **kwargs):
+        return subprocess.run([sys.executable, CLI, '--sem-relatorio-txt', *argumentos], cwd=str(tmp_path),
+                              env=ambiente, capture_output=True, text=True, encoding='utf-8', timeout=300, **kwargs)
+    executar.ambiente = ambiente
+    return executar
+
+
+@pytest.fixture
+def limpo(castelli, gravar_csv):
+    return gravar_csv(castelli.assign(pNCM='69072100'), 'limpo.csv')
+
+
+@pytest.fixture
+def com_erros(castelli, gravar_csv):
+    return gravar_csv(castelli, 'com_erros.csv')  # pNCM 'BATATA' em todas as linhas: 1 erro
+
+
+def test_arquivo_sem_erros_sai_com_0(executar, limpo):
+    saida = executar(limpo)
+    assert saida.returncode == 0, saida.stderr
+    documento = json.loads(saida.stdout)
+    assert documento['resumo']['total_erros'] == 0
+    assert documento['arquivos'][0]['caminho'] == limpo
+    assert documento['arquivos'][0]['relatorio']['resumo']['total_linhas'] == 145
+
+
+def test_erros_de_validacao_e_max_erros(executar, com_erros):
+    assert executar(com_erros).returncode == 1
+    assert executar(com_erros, '--max-erros', '1').returncode == 0
+
+
+def test_arquivo_ilegivel_sai_com_2(executar, limpo, tmp_path):
+    (tmp_path / 'quebrado.xlsx').write_bytes(b'nao e xlsx')
+    saida = executar(str(tmp_path / 'quebrado.xlsx'))
+    assert saida.returncode == 2
+    assert json.loads(saida.stdout)['arquivos'][0] == {
+        'caminho': str(tmp_path / 'quebrado.xlsx'), 'status': 'erro', 'relatorio': None}
+
+    assert executar(limpo, str(tmp_path / 'inexistente.csv')).returncode == 2
+    assert executar(str(tmp_path / 'nada' / '*.csv')).returncode == 2
+
+
+def test_ndjson_uma_linha_por_arquivo(executar, limpo, com_erros):
+    saida = executar(limpo, com_erros, '--formato', 'ndjson', '--sem-logs', '--workers', '2')
+    assert saida.returncode == 1
+    registros = [json.loads(linha) for linha in saida.stdout.splitlines()]
+    assert sorted(registro['caminho'] for registro in registros) == sorted([limpo, com_erros])
+    assert all(registro['status'] == 'concluido' and 'logs' not in registro['relatorio'] for registro in registros)
+
+
+def test_pipe_fechado_nao_quebra_a_saida(executar, limpo, com_erros):
+    processo = subprocess.Popen([sys.executable, CLI, '--sem-relatorio-txt', '--formato', 'ndjson', '-v',
+                                 limpo, com_erros], cwd=os.path.dirname(limpo), env=executar.ambiente,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    processo.stdout.close()  # quem lê desistiu antes do primeiro relatório (como `| head -0`)
+    _, erros = processo.communicate(timeout=300)
+    erros = erros.decode('utf-8')
+
+    assert processo.returncode == 1, erros
+    assert 'BrokenPipeError' not in erros and 'Exception ignored' not in erros
+    assert erros.count('Saída padrão fechada') == 1
@@ -0,0 +1,99 @@
+import json
+import shutil
+
+import pytest
+
+import regras_validacao
+from regras_validacao import PASTA_REGRAS
+
+from test_validador_gabaritos import linhas_com_falha
+
+
+@pytest.fixture
+def catalogo(castelli):
+    """Castelli com as colunas das regras de consistência preenchidas e coerentes"""
+    castelli['pPrecoVenda'] = [f'{100 + i % 10},00' for i in range(len(castelli))]
+    castelli['pCusto'] = '50'
+    castelli['pMarkup'] = '-1'
+    castelli['pMultiplo'] = '2,27'
+    castelli['pM²/Pallet'] = '72,64'  # 32 x 2,27
+    return castelli
+
+
+def test_sem_inconsistencias(validar, catalogo, gravar_csv):
+    validador = validar(gravar_csv(catalogo))
+    for regra, coluna in (('valor_divergente', 'pPreçoVenda'), ('proporcao_invalida', 'pM²/Pallet'),
+                          ('preco_abaixo_minimo', 'pPreçoVenda'), ('valor_atipico', 'pPreçoVenda')):
+        assert linhas_com_falha(validador, regra, coluna) == [], regra
+
+
+def test_mesmo_preco_por_referencia(validar, catalogo, gravar_csv):
+    catalogo.loc[[0, 1, 20], 'pReferencia'] = 'R1'
+    catalogo.loc[[0, 1, 20], 'pPrecoVenda'] = ['100', '100', '120']
+    catalogo.loc[[2, 3, 30], 'pReferencia'] = 'R2'
+    catalogo.loc[[2, 3, 30], 'pPrecoVenda'] = ['105', '105', '-1']  # -1: preço não informado
+    validador = validar(gravar_csv(catalogo))
+
+    # Todas as linhas da referência com preços diferentes, em blocos diferentes
+    assert linhas_com_falha(validador, 'valor_divergente', 'pPreçoVenda') == [0, 1, 20]
+    assert "pPreçoVenda: 1 valores de pReferencia com pPreçoVenda diferente em 3 linhas" in validador.erros
+    assert any("pReferencia 'R1': 100, 120 nas linhas [2, 3, 22]" in log for log in validador.logs)
+
+
+def test_proporcao_com_multiplo_inteiro(validar, catalogo, gravar_csv):
+    catalogo.loc[0, 'pM²/Pallet'] = '4,54'  # 2 x
+    catalogo.loc[1, 'pM²/Pallet'] = '3,5'  # entre 1 x e 2 x
+    catalogo.loc[2, 'pM²/Pallet'] = '1'  # menos que 1 x
+    catalogo.loc[3, 'pM²/Pallet'] = '72,7'  # arredondamento, dentro da tolerância
+    catalogo.loc[4, 'pM²/Pallet'] = '-1'  # não informado
+    catalogo.loc[5, 'pMultiplo'] = '0'  # não informado
+    validador = validar(gravar_csv(catalogo))
+
+    assert linhas_com_falha(validador, 'proporcao_invalida', 'pM²/Pallet') == [1, 2]
+    assert "pM²/Pallet: 2 linhas em que o valor não é múltiplo de pMúltiplo" in validador.erros
+    assert any("Linha 3: 3.5 não é múltiplo de pMúltiplo = 2.27" in log for log in validador.logs)
+
+
+def test_proporcao_exata_sem_multiplo_inteiro(validar, catalogo, gravar_csv, tmp_path, monkeypatch):
+    pasta = tmp_path / 'regras'
+    shutil.copytree(PASTA_REGRAS, pasta)
+    (pasta / 'proporcao_exata.json').write_text(json.dumps({
+        'herda': 'produtos',
+        'consistencia': {'proporcoes': {'pM²/Pallet': {'fatores': ['pMúltiplo', 'pQUANTIDADE NA EMBALAGEM']}}},
+    }), encoding='utf-8')
+    monkeypatch.setattr(regras_validacao, 'PASTA_REGRAS', str(pasta))
+    catalogo['pQUANTIDADE NA EMBALAGEM'] = '6'
+    catalogo['pM²/Pallet'] = '13,62'  # 2,27 x 6
+    catalogo.loc[0, 'pM²/Pallet'] = '27,24'  # 2 x o produto: aceito só com multiplo_inteiro
+    validador = validar(gravar_csv(catalogo), perfil='proporcao_exata')
+
+    assert linhas_com_falha(validador, 'proporcao_invalida', 'pM²/Pallet') == [0]
+    assert any("Linha 2: 27.24 (esperado pMúltiplo × pQUANTIDADE NA EMBALAGEM = 13.62)" in log
+               for log in validador.logs)
+
+
+def test_preco_minimo(validar, catalogo, gravar_csv):
+    catalogo['pMarkup'] = '0,2'  # mínimo: 50 x 1,2 = 60
+    catalogo['pPrecoVenda'] = '70'
+    catalogo.loc[0, 'pPrecoVenda'] = '59,99'
+    catalogo.loc[1, 'pPrecoVenda'] = '59,996'  # meio centavo de folga
+    catalogo.loc[2, 'pMarkup'] = '-1'  # sem markup: o mínimo é o custo
+    catalogo.loc[2, 'pPrecoVenda'] = '55'
+    catalogo.loc[3, 'pCusto'] = '-1'  # custo não informado
+    catalogo.loc[3, 'pPrecoVenda'] = '1'
+    validador = validar(gravar_csv(catalogo))
+
+    assert linhas_com_falha(validador, 'preco_abaixo_minimo', 'pPreçoVenda') == [0]
+    assert any("Linha 2: 59.99 abaixo do mínimo 60.00 (pCusto 50 + 20% de markup)" in log for log in validador.logs)
+
+
+def test_preco_atipico_por_grupo(validar, catalogo, gravar_csv):
+    catalogo.loc[50, 'pPrecoVenda'] = '1000'
+    # Grupo com menos de MINIMO_GRUPO_ATIPICOS linhas: não é conferido
+    catalogo.loc[[60, 61, 62, 63], 'pLinha'] = 'Pequena'
+    catalogo.loc[60, 'pPrecoVenda'] = '5000'
+    validador = validar(gravar_csv(catalogo))
+
+    assert linhas_com_falha(validador, 'valor_atipico', 'pPreçoVenda') == [50]
+    assert linhas_com_falha(validador, 'preco_abaixo_minimo', 'pPreçoVenda') == []
+    assert "pPreçoVenda: 1 valores atípicos para o grupo (pFornecedor, pLinha)" in validador.avisos
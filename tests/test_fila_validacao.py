@@ -0,0 +1,113 @@
+import json
+import os
+import time
+
+import pytest
+
+from conftest import PoolSincrono
+from fila_validacao import CONCLUIDO, ERRO, EXECUTANDO, FilaValidacao
+
+HORA = 3600
+
+
+def _job(pasta, job_id, status, horas, tamanho=10):
+    """Arquivos de um job com status e idade (em horas) dados; tamanho é o da planilha corrigida"""
+    caminhos = [os.path.join(pasta, f"{job_id}.{sufixo}") for sufixo in ('json', 'eventos', 'indice.npz')]
+    with open(caminhos[0], 'w', encoding='utf-8') as f:
+        json.dump({'job_id': job_id, 'arquivo': 'produtos.csv', 'status': status}, f)
+    for caminho in caminhos[1:]:
+        open(caminho, 'w').close()
+    caminhos.append(os.path.join(pasta, f"{job_id}.corrigido.csv"))
+    with open(caminhos[-1], 'wb') as f:
+        f.write(b'x' * tamanho)
+    momento = time.time() - horas * HORA
+    for caminho in caminhos:
+        os.utime(caminho, (momento, momento))
+    return caminhos
+
+
+def test_limpar_remove_os_arquivos_dos_jobs_expirados(tmp_path):
+    fila = FilaValidacao(str(tmp_path), idade_maxima=24 * HORA, idade_minima=HORA)
+    expirado = _job(str(tmp_path), 'a' * 32, CONCLUIDO, 30)
+    recente = _job(str(tmp_path), 'b' * 32, CONCLUIDO, 2)
+    outro = tmp_path / 'leia-me.txt'
+    outro.write_text('não é de job')
+    os.utime(outro, (0, 0))
+
+    fila.limpar()
+    assert not any(os.path.exists(caminho) for caminho in expirado)
+    assert all(os.path.exists(caminho) for caminho in recente)
+    assert outro.exists()
+
+
+def test_limpar_respeita_a_cota_sem_remover_jobs_em_andamento(tmp_path):
+    fila = FilaValidacao(str(tmp_path), tamanho_maximo=250, idade_maxima=24 * HORA, idade_minima=HORA)
+    em_andamento = _job(str(tmp_path), 'a' * 32, EXECUTANDO, 10, tamanho=100)
+    antigo = _job(str(tmp_path), 'b' * 32, CONCLUIDO, 5, tamanho=100)
+    medio = _job(str(tmp_path), 'c' * 32, CONCLUIDO, 3, tamanho=100)
+    novo = _job(str(tmp_path), 'd' * 32, CONCLUIDO, 0, tamanho=100)
+
+    fila.limpar()
+    assert all(os.path.exists(caminho) for caminho in em_andamento + novo)
+    assert not any(os.path.exists(caminho) for caminho in antigo + medio)
+
+
+def _eventos(pasta, job_id, status, eventos):
+    with open(os.path.join(pasta, f"{job_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump({'job_id': job_id, 'arquivo': 'produtos.csv', 'status': status}, f)
+    with open(os.path.join(pasta, f"{job_id}.eventos"), 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(evento) + '\n' for evento in eventos)
+
+
+LOGS = [{'tipo': 'log', 'mensagem': 'um'}, {'tipo': 'log', 'mensagem': 'dois'}]
+
+
+def test_acompanhar_entrega_os_eventos_depois_de_a_partir_de(tmp_path):
+    fila = FilaValidacao(str(tmp_path))
+    _eventos(str(tmp_path), 'a' * 32, CONCLUIDO, LOGS + [{'tipo': 'fim', 'status': CONCLUIDO}])
+    assert [numero for numero, _ in fila.acompanhar('a' * 32, a_partir_de=1, intervalo=0)] == [2, 3]
+
+
+@pytest.mark.parametrize('a_partir_de', [3, 4, 10])
+def test_acompanhar_termina_na_reconexao_depois_do_fim(tmp_path, a_partir_de):
+    fila = FilaValidacao(str(tmp_path))
+    _eventos(str(tmp_path), 'a' * 32, CONCLUIDO, LOGS + [{'tipo': 'fim', 'status': CONCLUIDO}])
+    assert list(fila.acompanhar('a' * 32, a_partir_de=a_partir_de, intervalo=0, pulsacao=0)) == []
+
+
+@pytest.mark.parametrize('a_partir_de, esperado', [(0, [1, 2, 3]), (2, [3]), (3, []), (7, [])])
+def test_acompanhar_job_terminado_sem_evento_de_fim(tmp_path, a_partir_de, esperado):
+    fila = FilaValidacao(str(tmp_path))
+    _eventos(str(tmp_path), 'a' * 32, ERRO, LOGS)
+    eventos = list(fila.acompanhar('a' * 32, a_partir_de=a_partir_de, intervalo=0, pulsacao=0))
+    assert [numero for numero, _ in eventos] == esperado
+    if esperado:
+        assert eventos[-1][1] == {'tipo': 'fim', 'status': ERRO}
+
+
+def test_enviar_limpa_a_pasta_de_jobs(tmp_path, castelli, gravar_csv):
+    fila = FilaValidacao(str(tmp_path / 'jobs'), cache=None, idade_maxima=24 * HORA)
+    expirado = _job(fila.pasta_jobs, 'a' * 32, CONCLUIDO, 30)
+    fila._pool = PoolSincrono()
+    fila.enviar(gravar_csv(castelli))
+    assert not any(os.path.exists(caminho) for caminho in expirado)
+
+
+def test_limpeza_no_maximo_uma_vez_por_intervalo(tmp_path, castelli, gravar_csv, monkeypatch):
+    fila = FilaValidacao(str(tmp_path / 'jobs'), cache=None, intervalo_limpeza=60)
+    fila._pool = PoolSincrono()
+    limpezas = []
+    monkeypatch.setattr(fila, 'limpar', lambda: limpezas.append(1))
+    agora = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: agora[0])
+    caminho = gravar_csv(castelli)
+
+    fila.enviar(caminho)
+    fila.enviar(caminho)
+    agora[0] += 59
+    fila.enviar(caminho)
+    assert len(limpezas) == 1
+    agora[0] += 1
+    fila.enviar(caminho)
+    assert len(limpezas) == 2
+
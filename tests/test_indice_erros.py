@@ -0,0 +1,157 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from validador_gabaritos import IndiceErros, SEVERIDADE_AVISO, SEVERIDADE_ERRO
+
+
+def _indice():
+    """17 linhas em dois blocos (10 + 7): NCM inválido em 3 linhas, com valores; célula vazia em 2, sem valores"""
+    indice = IndiceErros()
+    indice.total_linhas = 17
+    ncm = np.zeros(10, dtype=bool)
+    ncm[[0, 9]] = True
+    indice.registrar('ncm_invalido', 'pNCM', SEVERIDADE_ERRO, 0, ncm,
+                     pd.Series([f'ncm{i}' for i in range(10)]))
+    ncm = np.zeros(7, dtype=bool)
+    ncm[4] = True
+    indice.registrar('ncm_invalido', 'pNCM', SEVERIDADE_ERRO, 10, ncm,
+                     pd.Series([f'ncm{i}' for i in range(10, 17)]))
+    vazia = np.zeros(7, dtype=bool)
+    vazia[[0, 4]] = True
+    indice.registrar('celula_vazia', 'pUN', SEVERIDADE_AVISO, 10, vazia)
+    return indice
+
+
+def test_bitmaps_compactados_por_bloco():
+    indice = _indice()
+    blocos = indice._regras[('ncm_invalido', 'pNCM')]['blocos']
+    tamanho, bits, valores = blocos[0]
+    assert (tamanho, bits.dtype, len(bits)) == (10, np.uint8, 2)  # 10 linhas em 2 bytes
+    assert bits.tolist() == [0b10000000, 0b01000000]
+    assert valores.tolist() == ['ncm0', 'ncm9']  # só as células com problema
+
+
+def test_mascara_total_e_linhas_da_regra():
+    indice = _indice()
+    assert np.flatnonzero(indice.mascara('ncm_invalido', 'pNCM')).tolist() == [0, 9, 14]
+    assert indice.total('ncm_invalido', 'pNCM') == 3
+    assert indice.total('gtin_invalido', 'pCodigoBarras') == 0
+    assert indice.linhas_da_regra('celula_vazia', 'pUN') == [12, 16]
+    # Só regras de erro contam como linha inválida
+    assert np.flatnonzero(indice.mascara_invalidas()).tolist() == [0, 9, 14]
+
+
+def test_bloco_sem_falhas_substitui_o_anterior():
+    indice = _indice()
+    indice.registrar('celula_vazia', 'pUN', SEVERIDADE_AVISO, 10, np.zeros(7, dtype=bool))
+    assert indice.total('celula_vazia', 'pUN') == 0
+    assert indice._regras[('celula_vazia', 'pUN')]['blocos'] == {}
+
+
+def test_falhas_da_linha():
+    indice = _indice()
+    assert indice.falhas_da_linha(16) == [
+        {'regra': 'ncm_invalido', 'coluna': 'pNCM', 'severidade': SEVERIDADE_ERRO, 'valor': 'ncm14'},
+        {'regra': 'celula_vazia', 'coluna': 'pUN', 'severidade': SEVERIDADE_AVISO},
+    ]
+    assert indice.falhas_da_linha(11) == [
+        {'regra': 'ncm_invalido', 'coluna': 'pNCM', 'severidade': SEVERIDADE_ERRO, 'valor': 'ncm9'}]
+    assert indice.falhas_da_linha(3) == []
+
+
+def test_falhas_ordenadas_por_linha_e_filtradas():
+    indice = _indice()
+    linhas, indices, valores, regras = indice.falhas()
+    assert linhas.tolist() == [2, 11, 12, 16, 16]
+    assert [regras[i][0] for i in indices] == ['ncm_invalido', 'ncm_invalido', 'celula_vazia',
+                                               'ncm_invalido', 'celula_vazia']
+    assert valores.tolist() == ['ncm0', 'ncm9', None, 'ncm14', None]
+
+    linhas, _, _, regras = indice.falhas(severidades={SEVERIDADE_AVISO})
+    assert (linhas.tolist(), regras) == ([12, 16], [('celula_vazia', 'pUN', SEVERIDADE_AVISO)])
+    linhas, _, _, regras = indice.falhas(colunas={'pCusto'})
+    assert (linhas.tolist(), regras) == ([], [])
+
+
+def test_posicoes_espalhadas_e_registrar_posicoes():
+    indice = _indice()
+    indice.registrar('ncm_invalido', 'pNCM', SEVERIDADE_ERRO, np.array([3, 5]), np.array([False, True]),
+                     ['ncm3', 'ncm5'])
+    indice.consolidar()
+    assert indice.linhas_da_regra('ncm_invalido', 'pNCM') == [2, 7, 11, 16]
+    assert indice.falhas_da_linha(7)[0]['valor'] == 'ncm5'
+
+    indice.registrar_posicoes('chave_duplicada', 'pCodigo', SEVERIDADE_ERRO, [1, 15], ['A', 'A'])
+    assert indice.linhas_da_regra('chave_duplicada', 'pCodigo') == [3, 17]
+    assert indice.falhas_da_linha(17) == [
+        {'regra': 'chave_duplicada', 'coluna': 'pCodigo', 'severidade': SEVERIDADE_ERRO, 'valor': 'A'}]
+
+
+def test_salvar_e_carregar(tmp_path):
+    indice = _indice()
+    caminho = str(tmp_path / 'indice.npz')
+    indice.salvar(caminho)
+    carregado = IndiceErros.carregar(caminho)
+
+    assert carregado.total_linhas == 17
+    assert carregado.resumo() == indice.resumo()
+    for parte_original, parte_carregada in zip(indice.falhas(), carregado.falhas()):
+        assert list(parte_original) == list(parte_carregada)
+    for linha in range(2, 19):
+        assert carregado.falhas_da_linha(linha) == indice.falhas_da_linha(linha)
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    """Cliente do app com um job concluído ('a' * 32) cujo índice é o de _indice()"""
+    import app as modulo_app
+    from config import config
+    from fila_validacao import CONCLUIDO, FilaValidacao, caminho_indice
+
+    fila = FilaValidacao(str(tmp_path / 'jobs'))
+    job_id = 'a' * 32
+    with open(tmp_path / 'jobs' / f'{job_id}.json', 'w', encoding='utf-8') as f:
+        json.dump({'job_id': job_id, 'arquivo': 'produtos.csv', 'status': CONCLUIDO}, f)
+    _indice().salvar(caminho_indice(fila.pasta_jobs, job_id))
+
+    modulo_app.app.config.from_object(config['development'])
+    monkeypatch.setattr(modulo_app, 'fila', fila)
+    modulo_app.indice_job.cache_clear()
+    yield modulo_app.app.test_client()
+    modulo_app.indice_job.cache_clear()
+
+
+def test_api_erros_paginada(cliente):
+    resposta = cliente.get(f"/jobs/{'a' * 32}/erros?por_pagina=2").get_json()
+    assert (resposta['total'], resposta['total_paginas'], resposta['pagina']) == (5, 3, 1)
+    assert resposta['itens'] == [
+        {'linha': 2, 'coluna': 'pNCM', 'regra': 'ncm_invalido', 'severidade': SEVERIDADE_ERRO, 'valor': 'ncm0'},
+        {'linha': 11, 'coluna': 'pNCM', 'regra': 'ncm_invalido', 'severidade': SEVERIDADE_ERRO, 'valor': 'ncm9'},
+    ]
+
+    ultima = cliente.get(f"/jobs/{'a' * 32}/erros?por_pagina=2&pagina=3").get_json()
+    assert [item['linha'] for item in ultima['itens']] == [16]
+    assert ultima['proxima'] is None
+    seguinte = cliente.get(resposta['proxima']).get_json()
+    assert [item['linha'] for item in seguinte['itens']] == [12, 16]
+
+
+def test_api_erros_filtros_e_validacao(cliente):
+    filtrada = cliente.get(f"/jobs/{'a' * 32}/erros?coluna=pUN,pCusto").get_json()
+    assert [(item['linha'], item['regra']) for item in filtrada['itens']] == [(12, 'celula_vazia'), (16, 'celula_vazia')]
+    assert 'valor' not in filtrada['itens'][0]
+
+    assert cliente.get(f"/jobs/{'a' * 32}/erros?por_pagina=0").status_code == 400
+    assert cliente.get(f"/jobs/{'b' * 32}/erros").status_code == 404
+
+
+def test_api_linha(cliente):
+    resposta = cliente.get(f"/jobs/{'a' * 32}/linhas/16").get_json()
+    assert resposta == {'job_id': 'a' * 32, 'linha': 16, 'falhas': [
+        {'regra': 'ncm_invalido', 'coluna': 'pNCM', 'severidade': SEVERIDADE_ERRO, 'valor': 'ncm14'},
+        {'regra': 'celula_vazia', 'coluna': 'pUN', 'severidade': SEVERIDADE_AVISO},
+    ]}
+    assert cliente.get(f"/jobs/{'a' * 32}/linhas/3").get_json()['falhas'] == []
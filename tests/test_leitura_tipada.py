@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import leitura_tipada
+from leitura_tipada import ler_csv, materializar, tipos_leitura
+from regras_validacao import PlanoValidacao, obter_plano
+
+
+def test_colunas_de_texto_mantem_zeros_a_esquerda(leitor, castelli, gravar_csv):
+    castelli.loc[0, 'pNCM'] = '01012100'
+    castelli.loc[0, 'pCodigoBarras'] = '0012345678905'
+    castelli.loc[1, 'pCodigoBarras'] = '01234565'
+    df = ler_csv(gravar_csv(castelli), ';', 'cp1252', obter_plano('produtos'))
+
+    ncm = materializar(df['pNCM'])
+    gtin = materializar(df['pCodigoBarras'])
+    assert ncm[0] == '01012100'
+    assert gtin[0] == '0012345678905'
+    assert gtin[1] == '01234565'
+
+
+def test_coluna_de_texto_so_com_numeros_continua_texto(leitor, castelli, gravar_csv):
+    castelli['pNCM'] = '69072100'
+    df = ler_csv(gravar_csv(castelli), ';', 'cp1252', obter_plano('produtos'))
+    assert materializar(df['pNCM']).tolist() == ['69072100'] * len(castelli)
+
+
+def test_codigos_e_chaves_sao_lidos_como_texto_sem_declarar_textos(leitor, castelli, gravar_csv):
+    plano = PlanoValidacao('sem_textos', {'colunas': list(castelli.columns), 'ncm': ['pNCM'],
+                                          'unicos': {'pCodigo': [], 'pReferencia': []},
+                                          'gtin': {'pCodigoBarras': []}}, 1)
+    castelli['pNCM'] = '69072100'
+    castelli.loc[0, 'pNCM'] = '01012100'
+    castelli.loc[0, 'pCodigoBarras'] = '01234565'
+    castelli.loc[0, 'pCodigo'] = '007'
+    castelli.loc[0, 'pReferencia'] = '0123'
+    df = ler_csv(gravar_csv(castelli), ';', 'cp1252', plano)
+    colunas = ('pNCM', 'pCodigoBarras', 'pCodigo', 'pReferencia')
+    assert [materializar(df[coluna])[0] for coluna in colunas] == ['01012100', '01234565', '007', '0123']
+
+
+def test_tipos_da_leitura(leitor, castelli):
+    tipos = tipos_leitura(obter_plano('produtos'), castelli.columns)
+    assert tipos['pFornecedor'] == 'category'
+    assert tipos['pNCM'] == (leitura_tipada.TEXTO if leitor == 'arrow' else str)
+
+
+def test_leitor_arrow_igual_ao_leitor_c(castelli, gravar_csv, monkeypatch):
+    pytest.importorskip('pyarrow')
+    castelli.loc[3, 'pCusto'] = ''
+    castelli.loc[4, 'pOrigem CST'] = 'X'
+    castelli.loc[5, 'pNCM'] = '01012100'
+    caminho = gravar_csv(castelli)
+    plano = obter_plano('produtos')
+
+    arrow = ler_csv(caminho, ';', 'cp1252', plano)
+    assert isinstance(arrow['pNCM'].dtype, pd.StringDtype)  # o caminho do Arrow foi usado
+    monkeypatch.setattr(leitura_tipada, 'pyarrow', None)
+    leitor_c = ler_csv(caminho, ';', 'cp1252', plano)
+
+    for coluna in castelli.columns:
+        pd.testing.assert_series_equal(materializar(arrow[coluna]), materializar(leitor_c[coluna]),
+                                       check_dtype=False, obj=coluna)
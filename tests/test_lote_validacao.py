@@ -0,0 +1,133 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from lote_validacao import LoteInvalido, extrair_zip, item_lote, nome_unico, resumir_lote
+
+
+def _zip(caminho, membros, compressao=zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(caminho, 'w', compressao) as zf:
+        for nome, conteudo in membros.items():
+            zf.writestr(nome, conteudo)
+    return str(caminho)
+
+
+def test_zip_bomb_recusado_pelo_tamanho_extraido(tmp_path):
+    # 2 MB de zeros viram poucos KB no zip: vale o tamanho descompactado
+    caminho = _zip(tmp_path / 'bomba.zip', {'zeros.csv': b'0' * (2 * 1024 * 1024)})
+    assert os.path.getsize(caminho) < 64 * 1024
+    with pytest.raises(LoteInvalido, match="passa de 1 MB"):
+        extrair_zip(caminho, str(tmp_path / 'destino'), max_bytes=1024 * 1024)
+    assert not (tmp_path / 'destino').exists()
+
+
+def test_nomes_com_caminho_ficam_no_destino(tmp_path):
+    caminho = _zip(tmp_path / 'lote.zip', {'../../fora.csv': 'a;b\n1;2\n', '/tmp/absoluto.csv': 'a;b\n1;2\n',
+                                           'sub/pasta/dentro.xlsx': b'xlsx'})
+    destino = tmp_path / 'destino'
+    caminhos = extrair_zip(caminho, str(destino))
+
+    assert sorted(os.path.basename(c) for c in caminhos) == ['absoluto.csv', 'dentro.xlsx', 'fora.csv']
+    assert all(os.path.dirname(c) == str(destino) for c in caminhos)
+    assert not (tmp_path / 'fora.csv').exists()
+    assert sorted(os.listdir(destino)) == ['absoluto.csv', 'dentro.xlsx', 'fora.csv']
+
+
+def test_maximo_de_arquivos(tmp_path):
+    caminho = _zip(tmp_path / 'lote.zip', {f'p{i}.csv': 'a\n1\n' for i in range(4)})
+    with pytest.raises(LoteInvalido, match=r"4 planilhas \(máximo 3\)"):
+        extrair_zip(caminho, str(tmp_path / 'destino'), max_arquivos=3)
+    assert len(extrair_zip(caminho, str(tmp_path / 'destino'), max_arquivos=4)) == 4
+
+
+def test_so_planilhas_sao_extraidas(tmp_path):
+    caminho = _zip(tmp_path / 'lote.zip', {'leia-me.txt': 'x', 'sub/': '', '.oculto.csv': 'x', '~$aberto.xlsx': 'x',
+                                           'produtos.CSV': 'a\n1\n'})
+    assert [os.path.basename(c) for c in extrair_zip(caminho, str(tmp_path / 'destino'))] == ['produtos.CSV']
+
+    vazio = _zip(tmp_path / 'vazio.zip', {'leia-me.txt': 'x'})
+    with pytest.raises(LoteInvalido, match="não contém planilhas"):
+        extrair_zip(vazio, str(tmp_path / 'destino'))
+    (tmp_path / 'corrompido.zip').write_bytes(b'PK nada')
+    with pytest.raises(LoteInvalido, match="inválido ou corrompido"):
+        extrair_zip(str(tmp_path / 'corrompido.zip'), str(tmp_path / 'destino'))
+
+
+def test_nomes_repetidos_nao_se_sobrescrevem(tmp_path):
+    caminho = _zip(tmp_path / 'lote.zip', {'a/produtos.csv': 'a\n1\n', 'b/produtos.csv': 'a\n2\n',
+                                           'c/PRODUTOS.csv': 'a\n3\n'})
+    usados = {'produtos.csv'}  # já ocupado por outro arquivo do envio
+    caminhos = extrair_zip(caminho, str(tmp_path / 'destino'), usados=usados)
+
+    assert [os.path.basename(c) for c in caminhos] == ['produtos_2.csv', 'produtos_3.csv', 'PRODUTOS_4.csv']
+    assert [open(c).read() for c in caminhos] == ['a\n1\n', 'a\n2\n', 'a\n3\n']
+    assert nome_unico('produtos.csv', usados) == 'produtos_5.csv'
+
+
+def _resultado(linhas, invalidas, erros, avisos):
+    return {'resumo': {'total_linhas': linhas, 'linhas_invalidas': invalidas,
+                       'percentual_validas': round((linhas - invalidas) / linhas * 100, 2)},
+            'erros': ['erro'] * erros, 'warnings': ['aviso'] * avisos}
+
+
+def test_resumo_combinado_do_lote():
+    itens = [
+        item_lote('a.csv', 'concluido', _resultado(100, 0, 0, 2)),
+        item_lote('b.csv', 'concluido', _resultado(300, 30, 3, 1)),
+        item_lote('c.csv', 'erro', None),
+    ]
+    assert itens[2] == {'arquivo': 'c.csv', 'status': 'erro'}
+    assert resumir_lote(itens) == {
+        'arquivos': 3, 'concluidos': 2, 'falhas': 1, 'validos': 1, 'com_problemas': 1,
+        'total_linhas': 400, 'linhas_validas': 370, 'linhas_invalidas': 30, 'percentual_validas': 92.5,
+        'total_erros': 3, 'total_avisos': 3,
+    }
+    assert resumir_lote([])['percentual_validas'] == 0
+
+
+def _enviar_lote(cliente, arquivos):
+    return cliente.post('/', data={'file': [(io.BytesIO(conteudo), nome) for nome, conteudo in arquivos]},
+                        content_type='multipart/form-data', headers={'Accept': 'application/json'})
+
+
+def test_app_lote_com_arquivos_e_zip(app_teste, castelli, gravar_csv, tmp_path):
+    with open(gravar_csv(castelli), 'rb') as f:
+        conteudo = f.read()
+    zip_lote = _zip(tmp_path / 'lote.zip', {'outra/produtos.csv': conteudo, 'leia-me.txt': 'x'})
+    with open(zip_lote, 'rb') as f:
+        arquivos = [('produtos.csv', conteudo), ('lote.zip', f.read()), ('notas.txt', b'x')]
+
+    resposta = _enviar_lote(app_teste.test_client(), arquivos)
+    assert resposta.status_code == 202
+    lote = resposta.get_json()
+    assert [job['arquivo'] for job in lote['jobs']] == ['produtos.csv', 'produtos_2.csv']
+    assert (lote['status'], lote['terminados']) == ('concluido', 2)
+    assert lote['resumo']['arquivos'] == lote['resumo']['concluidos'] == 2
+    assert lote['resumo']['total_linhas'] == 2 * len(castelli)
+
+    status = app_teste.test_client().get(lote['status_url']).get_json()
+    assert status['resumo'] == lote['resumo']
+    assert app_teste.test_client().get(f"/lotes/{'f' * 32}").status_code == 404
+
+
+def test_app_lote_acima_do_maximo_de_arquivos(app_teste, tmp_path):
+    app_teste.config['LOTE_MAX_ARQUIVOS'] = 2
+    zip_lote = _zip(tmp_path / 'lote.zip', {f'p{i}.csv': 'a\n1\n' for i in range(2)})
+    with open(zip_lote, 'rb') as f:
+        arquivos = [('avulso.csv', b'a\n1\n'), ('lote.zip', f.read())]
+
+    resposta = _enviar_lote(app_teste.test_client(), arquivos)
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {'erro': "O .zip tem 2 planilhas (máximo 1)"}
+    assert os.listdir(os.path.join(app_teste.config['UPLOAD_FOLDER'], 'lotes')) == []
+
+
+def test_app_zip_bomb_recusado(app_teste, tmp_path):
+    app_teste.config['LOTE_MAX_BYTES_EXTRAIDOS'] = 1024 * 1024
+    zip_lote = _zip(tmp_path / 'bomba.zip', {'zeros.csv': b'0' * (2 * 1024 * 1024)})
+    with open(zip_lote, 'rb') as f:
+        resposta = _enviar_lote(app_teste.test_client(), [('bomba.zip', f.read())])
+    assert resposta.status_code == 400
+    assert 'passa de 1 MB' in resposta.get_json()['erro']
@@ -0,0 +1,236 @@
+import json
+import os
+import pstats
+
+import pytest
+
+from metricas import MedidorEtapas, RegistroMetricas, executar_com_cprofile
+from validador_gabaritos import ValidadorProdutos
+
+
+def test_resumo_do_medidor(monkeypatch):
+    import metricas
+    relogio = [100.0]
+    monkeypatch.setattr(metricas.time, 'perf_counter', lambda: relogio[0])
+    monkeypatch.setattr(metricas, 'pico_memoria', lambda: 64 * metricas.MB)
+    medidor = MedidorEtapas()
+    with medidor.etapa('carregar_arquivo') as medida:
+        relogio[0] += 2
+        medida['linhas'] += 1000  # linhas conhecidas só no fim da etapa
+    with medidor.etapa('validar_pNCM', 1000):
+        relogio[0] += 0.5
+    relogio[0] += 0.5
+
+    assert medidor.resumo(1000) == {
+        'segundos': 3.0,
+        'linhas': 1000,
+        'linhas_por_segundo': 333,
+        'pico_memoria_mb': 64.0,
+        'etapas': [
+            {'etapa': 'carregar_arquivo', 'segundos': 2.0, 'linhas': 1000, 'linhas_por_segundo': 500,
+             'pico_memoria_mb': 64.0},
+            {'etapa': 'validar_pNCM', 'segundos': 0.5, 'linhas': 1000, 'linhas_por_segundo': 2000,
+             'pico_memoria_mb': 64.0},
+        ],
+    }
+
+
+def test_etapas_repetidas_se_somam(monkeypatch):
+    import metricas
+    relogio = [0.0]
+    picos = iter([10 * metricas.MB, 30 * metricas.MB, 20 * metricas.MB])
+    monkeypatch.setattr(metricas.time, 'perf_counter', lambda: relogio[0])
+    monkeypatch.setattr(metricas, 'pico_memoria', lambda: next(picos))
+    medidor = MedidorEtapas()
+    for _ in range(3):  # um bloco por vez
+        with medidor.etapa('ler_arquivo', 50):
+            relogio[0] += 1
+
+    etapas = medidor.resumo(150)['etapas']
+    assert etapas == [{'etapa': 'ler_arquivo', 'segundos': 3.0, 'linhas': 150, 'linhas_por_segundo': 50,
+                       'pico_memoria_mb': 30.0}]  # o maior pico entre as repetições
+
+
+def test_etapa_sem_linhas_e_com_excecao():
+    medidor = MedidorEtapas()
+    with pytest.raises(ValueError):
+        with medidor.etapa('falha'):
+            raise ValueError
+    etapa = medidor.resumo(0)['etapas'][0]
+    assert etapa['etapa'] == 'falha' and etapa['segundos'] >= 0  # medida mesmo com a exceção
+    assert etapa['linhas_por_segundo'] is None
+    assert medidor.resumo(0)['linhas_por_segundo'] is None
+
+
+def test_metricas_no_relatorio(validar, castelli, gravar_csv):
+    metricas = validar(gravar_csv(castelli)).gerar_relatorio()['metricas']
+    assert set(metricas) == {'segundos', 'linhas', 'linhas_por_segundo', 'pico_memoria_mb', 'etapas'}
+    assert metricas['linhas'] == len(castelli)
+    nomes = [etapa['etapa'] for etapa in metricas['etapas']]
+    assert 'validar_pNCM' in nomes and 'verificar_estrutura_colunas' in nomes
+    assert nomes[0] in ('carregar_arquivo', 'ler_arquivo')
+    assert next(etapa for etapa in metricas['etapas'] if etapa['etapa'] == 'validar_pNCM')['linhas'] == len(castelli)
+    assert len(nomes) == len(set(nomes))  # os blocos se somam numa etapa só
+
+
+def test_executar_com_cprofile(castelli, gravar_csv, tmp_path):
+    destino = str(tmp_path / 'perfis' / 'job.prof')
+    validador = ValidadorProdutos(gravar_csv(castelli), relatorio_txt=False)
+    resultado = executar_com_cprofile(destino, validador.executar_validacao_completa)
+
+    assert resultado['resumo']['total_linhas'] == len(castelli)
+    funcoes = {funcao for _, _, funcao in pstats.Stats(destino).stats}
+    assert 'executar_validacao_completa' in funcoes
+
+
+def test_cprofile_grava_mesmo_com_excecao(tmp_path):
+    def falhar():
+        raise RuntimeError("falhou")
+
+    destino = str(tmp_path / 'falha.prof')
+    with pytest.raises(RuntimeError):
+        executar_com_cprofile(destino, falhar)
+    assert 'falhar' in {funcao for _, _, funcao in pstats.Stats(destino).stats}
+
+
+def _registro(pasta, intervalo_gravacao=0):
+    """Registro com um contador e um histograma; com intervalo 0, cada mudança é gravada na hora"""
+    registro = RegistroMetricas(intervalo_gravacao)
+    jobs = registro.contador('jobs_total', "Jobs", ('status',))
+    duracao = registro.histograma('duracao_segundos', "Duração", (1, 10))
+    if pasta is not None:
+        registro.pasta = pasta  # como compartilhar(), sem apagar os arquivos dos outros "workers"
+    return registro, jobs, duracao
+
+
+def test_exportar_soma_os_processos_que_compartilham_a_pasta(tmp_path):
+    primeiro, jobs_1, duracao_1 = _registro(None)
+    primeiro.compartilhar(str(tmp_path))
+    segundo, jobs_2, duracao_2 = _registro(str(tmp_path))
+
+    jobs_1.inc(status='concluido')
+    jobs_2.inc(2, status='concluido')
+    jobs_2.inc(status='erro')
+    duracao_1.observar(0.5)
+    duracao_2.observar(5)
+
+    esperado = [
+        'jobs_total{status="concluido"} 3',
+        'jobs_total{status="erro"} 1',
+        'duracao_segundos_bucket{le="1"} 1',
+        'duracao_segundos_bucket{le="10"} 2',
+        'duracao_segundos_bucket{le="+Inf"} 2',
+        'duracao_segundos_sum 5.5',
+        'duracao_segundos_count 2',
+    ]
+    for registro in (primeiro, segundo):
+        amostras = [linha for linha in registro.exportar().splitlines() if not linha.startswith('#')]
+        assert amostras == esperado
+
+
+def test_sem_pasta_cada_processo_exporta_os_proprios_numeros():
+    registro, jobs, _ = _registro(None)
+    jobs.inc(status='concluido')
+    assert 'jobs_total{status="concluido"} 1' in registro.exportar()
+
+
+def test_compartilhar_apaga_as_metricas_da_execucao_anterior(tmp_path):
+    anterior, jobs, _ = _registro(str(tmp_path))
+    jobs.inc(status='concluido')
+    assert os.listdir(tmp_path)
+
+    registro, _, _ = _registro(None)
+    registro.compartilhar(str(tmp_path))
+    assert 'jobs_total{' not in registro.exportar()
+
+
+class _TimerManual:
+    """threading.Timer que só dispara quando o teste manda"""
+    criados = []
+    pendentes = []
+
+    def __init__(self, intervalo, funcao):
+        _TimerManual.criados.append(intervalo)
+        self.funcao = funcao
+        self.daemon = False
+
+    def start(self):
+        _TimerManual.pendentes.append(self)
+
+    @classmethod
+    def disparar(cls):
+        pendentes, cls.pendentes = cls.pendentes, []
+        for timer in pendentes:
+            timer.funcao()
+
+
+def _gravado(registro):
+    with open(registro._arquivo, encoding='utf-8') as f:
+        return json.load(f)['jobs_total']
+
+
+def test_gravacao_no_maximo_uma_vez_por_intervalo(tmp_path, monkeypatch):
+    import metricas
+    relogio = [1000.0]
+    monkeypatch.setattr(metricas.time, 'monotonic', lambda: relogio[0])
+    registro, jobs, _ = _registro(str(tmp_path), intervalo_gravacao=60)
+    monkeypatch.setattr(metricas.threading, 'Timer', _TimerManual)
+    _TimerManual.criados, _TimerManual.pendentes = [], []
+
+    jobs.inc(status='concluido')  # a primeira mudança grava na hora
+    assert _gravado(registro) == [[['concluido'], 1]]
+    jobs.inc(status='concluido')
+    jobs.inc(status='concluido')
+    assert _gravado(registro) == [[['concluido'], 1]]  # dentro do intervalo: só marca como alterado
+    assert _TimerManual.criados == [60]  # um timer só, para o fim do intervalo
+
+    relogio[0] += 60
+    _TimerManual.disparar()  # o timer grava o que ficou pendente
+    assert _gravado(registro) == [[['concluido'], 3]]
+    relogio[0] += 60
+    jobs.inc(status='concluido')
+    assert _gravado(registro) == [[['concluido'], 4]]  # já passou o intervalo desde a última gravação
+    assert len(_TimerManual.criados) == 1
+
+
+def test_metrics_grava_as_mudancas_pendentes(tmp_path):
+    registro, jobs, _ = _registro(str(tmp_path), intervalo_gravacao=3600)
+    outro, _, _ = _registro(str(tmp_path))
+    jobs.inc(status='concluido')
+    jobs.inc(2, status='concluido')
+    assert 'jobs_total{status="concluido"} 1' in outro.exportar()
+
+    assert 'jobs_total{status="concluido"} 3' in registro.exportar()
+    assert _gravado(registro) == [[['concluido'], 3]]
+    assert 'jobs_total{status="concluido"} 3' in outro.exportar()
+
+
+def test_timer_grava_sem_novas_mudancas(tmp_path):
+    registro, jobs, _ = _registro(str(tmp_path), intervalo_gravacao=0.05)
+    jobs.inc(status='concluido')
+    jobs.inc(status='concluido')
+    registro._timer.join(5)
+    assert _gravado(registro) == [[['concluido'], 2]]
+    assert registro._timer is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="sem fork")
+def test_worker_criado_por_fork_comeca_do_zero(tmp_path):
+    registro, jobs, _ = _registro(None)
+    registro.compartilhar(str(tmp_path))
+    jobs.inc(5, status='concluido')  # valor do mestre, antes do fork
+
+    leitura, escrita = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(leitura)
+        jobs.inc(status='concluido')
+        os.write(escrita, registro.exportar().encode())
+        os._exit(0)
+    os.close(escrita)
+    os.waitpid(pid, 0)
+    with os.fdopen(leitura) as f:
+        exportado = f.read()
+    # O mestre (5) e o worker (1), cada um contado uma vez
+    assert 'jobs_total{status="concluido"} 6' in exportado
+    assert 'jobs_total{status="concluido"} 6' in registro.exportar()
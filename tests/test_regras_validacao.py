@@ -0,0 +1,160 @@
+import json
+import os
+
+import pytest
+
+import regras_validacao
+from regras_validacao import (PerfilInvalido, ResolvedorColunas, SIMILARIDADE_MINIMA_COLUNA, normalizar_nome_coluna,
+                              obter_plano)
+
+
+@pytest.fixture
+def regras(tmp_path, monkeypatch):
+    """Pasta de perfis vazia e cache de planos limpo; regras(nome, definicao) grava um perfil"""
+    pasta = tmp_path / 'regras'
+    pasta.mkdir()
+    monkeypatch.setattr(regras_validacao, 'PASTA_REGRAS', str(pasta))
+    monkeypatch.setattr(regras_validacao, '_planos', {})
+
+    def gravar(nome, definicao):
+        caminho = pasta / f'{nome}.json'
+        existia = caminho.exists()
+        anterior = caminho.stat().st_mtime_ns if existia else 0
+        caminho.write_text(json.dumps(definicao), encoding='utf-8')
+        if existia:  # mtime sempre diferente, mesmo em sistemas de arquivos com resolução grosseira
+            os.utime(caminho, ns=(anterior + 10 ** 9, anterior + 10 ** 9))
+        return caminho
+    return gravar
+
+
+BASE = {
+    'descricao': 'base',
+    'colunas': ['pCodigo', 'pNCM', 'pUN'],
+    'numericos': ['pCusto'],
+    'dominios': {'pUN': ['UN', 'CX']},
+}
+
+
+def test_filho_sobrescreve_so_as_chaves_que_declara(regras):
+    regras('base', BASE)
+    regras('filho', {'herda': 'base', 'descricao': 'filho', 'numericos': ['pPrecoVenda']})
+    plano = obter_plano('filho')
+
+    assert plano.descricao == 'filho'
+    assert plano.colunas_esperadas == ['pCodigo', 'pNCM', 'pUN']  # herdadas
+    assert plano.campos_numericos == ['pPrecoVenda']  # a lista é substituída, não somada
+    assert plano.dominios == {'pUN': ['UN', 'CX']}
+
+
+def test_heranca_em_cadeia_na_ordem_avo_pai_filho(regras):
+    regras('avo', BASE)
+    regras('pai', {'herda': 'avo', 'descricao': 'pai', 'dominios': {'pUN': ['UN']}})
+    regras('neto', {'herda': 'pai', 'numericos': []})
+    plano = obter_plano('neto')
+
+    assert (plano.descricao, plano.dominios, plano.campos_numericos) == ('pai', {'pUN': ['UN']}, [])
+    assert plano.colunas_esperadas == BASE['colunas']
+    # O plano depende dos três arquivos
+    assert [os.path.basename(caminho) for caminho, _ in regras_validacao._planos['neto'][0]] == [
+        'avo.json', 'pai.json', 'neto.json']
+
+
+def test_pai_inexistente(regras):
+    regras('orfao', {'herda': 'sumido'})
+    with pytest.raises(PerfilInvalido, match="Perfil de regras não encontrado: sumido"):
+        obter_plano('orfao')
+
+
+def test_heranca_circular(regras):
+    regras('a', {'herda': 'b', 'colunas': ['x']})
+    regras('b', {'herda': 'c'})
+    regras('c', {'herda': 'a'})
+    with pytest.raises(PerfilInvalido, match="Herança circular entre perfis: a -> b -> c -> a"):
+        obter_plano('a')
+    regras('proprio', {'herda': 'proprio', 'colunas': ['x']})
+    with pytest.raises(PerfilInvalido, match="Herança circular"):
+        obter_plano('proprio')
+
+
+def test_perfil_sem_colunas(regras):
+    regras('base', {'descricao': 'sem colunas'})
+    regras('filho', {'herda': 'base', 'colunas': ['pCodigo']})
+    with pytest.raises(PerfilInvalido, match="Perfil base não define 'colunas'"):
+        obter_plano('filho')  # cada perfil da cadeia precisa ser completo
+
+
+def test_plano_em_cache_ate_o_arquivo_mudar(regras):
+    regras('base', BASE)
+    regras('filho', {'herda': 'base'})
+    plano = obter_plano('filho')
+    assert obter_plano('filho') is plano
+
+    regras('filho', {'herda': 'base', 'numericos': ['pPrecoVenda']})
+    recarregado = obter_plano('filho')
+    assert recarregado is not plano
+    assert recarregado.campos_numericos == ['pPrecoVenda']
+    assert recarregado.versao != plano.versao
+
+    # Mudar só o pai também recompila o filho
+    regras('base', dict(BASE, colunas=['pCodigo']))
+    assert obter_plano('filho').colunas_esperadas == ['pCodigo']
+
+
+def test_perfil_removido_depois_de_compilado(regras):
+    caminho = regras('base', BASE)
+    obter_plano('base')
+    caminho.unlink()
+    with pytest.raises(PerfilInvalido, match="não encontrado: base"):
+        obter_plano('base')
+
+
+def _resolver(esperadas, colunas):
+    return ResolvedorColunas(esperadas, [normalizar_nome_coluna(coluna) for coluna in esperadas], colunas)
+
+
+def test_colunas_com_acento_e_maiusculas_diferentes():
+    resolvedor = obter_plano('produtos').resolver(['pMultiplo', 'PPRECOVENDA', 'pM2/Pallet', 'pcodigo', 'pNCM'])
+    assert resolvedor.real('pMúltiplo') == 'pMultiplo'
+    assert resolvedor.real('pPreçoVenda') == 'PPRECOVENDA'
+    assert resolvedor.real('pCodigo') == 'pcodigo'
+    assert resolvedor.real('pNCM') == 'pNCM'
+    assert resolvedor.real('pM²/Pallet') == 'pM2/Pallet'  # NFKD: '²' vira '2'
+    assert ('pMultiplo', 'pMúltiplo') in resolvedor.renomeadas()
+    assert ('pNCM', 'pNCM') not in resolvedor.renomeadas()
+    assert resolvedor.aproximadas == []
+
+
+def test_nome_aproximado_acima_e_abaixo_do_minimo():
+    assert SIMILARIDADE_MINIMA_COLUNA == 0.85
+    resolvedor = _resolver(['pFornecedor', 'pCusto', 'pDescricao'], ['pFornecdor', 'pCust0', 'pDesc'])
+    assert resolvedor.mapa == {'pFornecedor': 'pFornecdor'}
+    assert resolvedor.aproximadas == [('pFornecedor', 'pFornecdor', 0.95)]
+    # 'pcust0' fica em 0,83 e 'pdesc' em 0,67: continuam faltando, não viram outra coluna
+    assert resolvedor.faltando == ['pCusto', 'pDescricao']
+    assert resolvedor.extras == ['pCust0', 'pDesc']
+
+
+def test_duas_colunas_disputando_a_mesma_esperada():
+    # Nome normalizado idêntico ganha de qualquer aproximado
+    resolvedor = _resolver(['pFornecedor'], ['pFornecdor', 'PFORNECEDOR'])
+    assert (resolvedor.mapa, resolvedor.extras) == ({'pFornecedor': 'PFORNECEDOR'}, ['pFornecdor'])
+
+    # Entre aproximados, o mais parecido; o outro sobra como extra
+    resolvedor = _resolver(['pFornecedor'], ['pFornecdor', 'pFornecedore'])
+    assert (resolvedor.mapa, resolvedor.extras) == ({'pFornecedor': 'pFornecedore'}, ['pFornecdor'])
+
+    # Nomes que normalizam igual: vale o primeiro, e cada coluna atende só uma esperada
+    resolvedor = _resolver(['pPreçoVenda'], ['pPrecoVenda', 'PPRECOVENDA'])
+    assert (resolvedor.mapa, resolvedor.extras) == ({'pPreçoVenda': 'pPrecoVenda'}, ['PPRECOVENDA'])
+    resolvedor = _resolver(['pPreçoVenda', 'pPrecoVenda2'], ['pPrecoVenda', 'PPRECOVENDA'])
+    assert resolvedor.mapa == {'pPreçoVenda': 'pPrecoVenda', 'pPrecoVenda2': 'PPRECOVENDA'}
+    assert resolvedor.aproximadas == [('pPrecoVenda2', 'PPRECOVENDA', 0.96)]
+
+
+def test_colunas_extras_e_resolvedor_em_cache():
+    plano = obter_plano('produtos')
+    cabecalho = ['pCodigo', 'Observações', 'pNCM', 'pCodigo_antigo']
+    resolvedor = plano.resolver(cabecalho)
+    assert resolvedor.extras == ['Observações', 'pCodigo_antigo']
+    assert len(resolvedor.faltando) == len(plano.colunas_conhecidas) - 2
+    assert plano.resolver(list(cabecalho)) is resolvedor
@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+
+import tabela_ncm
+from tabela_ncm import TabelaNCM, importar
+
+from conftest import RAIZ
+
+TABELA_DO_REPOSITORIO = os.path.join(RAIZ, 'dados', 'ncm.csv')
+
+
+def test_tabela_do_repositorio():
+    tabela = tabela_ncm.obter_tabela(TABELA_DO_REPOSITORIO)
+    assert tabela is not None and len(tabela) > 10000
+    assert '69072100' in tabela and '01012100' in tabela  # os do Castelli e um com zero à esquerda
+    assert all(len(codigo) == tabela_ncm.TAMANHO_NCM and codigo.isdigit() for codigo in tabela.codigos)
+    assert tabela.sugerir('1012100') == ['01012100']
+
+
+def test_importar_json_do_siscomex(tmp_path):
+    origem = tmp_path / 'ncm.json'
+    origem.write_text('{"Nomenclaturas": [{"Codigo": "01", "Descricao": "Animais vivos"},'
+                      ' {"Codigo": "0101.21.00", "Descricao": "Reprodutores  de raça pura"}]}', encoding='utf-8')
+    destino = str(tmp_path / 'dados' / 'ncm.csv')
+    assert importar(str(origem), destino) == 1
+
+    tabela = tabela_ncm.obter_tabela(destino)
+    assert list(tabela.codigos) == ['01012100']
+    assert tabela.descricao('0101.21.00') == 'Reprodutores de raça pura'
+    assert tabela.descricao('01') == 'Animais vivos'
+
+
+def test_sem_arquivo_nao_ha_tabela(tmp_path):
+    assert tabela_ncm.obter_tabela(str(tmp_path / 'nao_existe.csv')) is None
+
+
+def test_existem_igual_ao_conjunto_de_codigos():
+    tabela = TabelaNCM([(codigo, '') for codigo in ('01012100', '69072100', '69072200', '6907')])
+    codigos = pd.Series(['69072100', '69079999', '01012100', '1012100', '6907', '69072100'], index=range(10, 16))
+    assert tabela.existem(codigos).tolist() == [codigo in tabela for codigo in codigos]
+    assert tabela.existem(codigos.astype('string')).tolist() == [True, False, True, False, False, True]
+    assert tabela.existem(pd.Series([], dtype=object)).tolist() == []
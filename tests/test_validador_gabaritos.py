@@ -0,0 +1,194 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from validador_gabaritos import ValidadorProdutos
+
+# Valores que a inferência de tipos bloco a bloco lia de jeitos diferentes
+VALORES_AMBIGUOS = ['007', '7', '1.000', '1', '0.0', '0', 'True', '', ' ', 'abc', '-1', '1,5', '7.0', '1e3']
+
+
+def linhas_com_falha(validador, regra, coluna):
+    return np.flatnonzero(validador.indice.mascara(regra, coluna)).tolist()
+
+
+def test_gtin_com_zeros_a_esquerda(validar, castelli, gravar_csv):
+    castelli.loc[0, 'pCodigoBarras'] = '0012345678905'  # GTIN-13
+    castelli.loc[1, 'pCodigoBarras'] = '01234565'  # GTIN-8
+    castelli.loc[2, 'pCodigoBarras'] = '0012345678906'  # dígito verificador errado
+    validador = validar(gravar_csv(castelli))
+
+    assert linhas_com_falha(validador, 'gtin_invalido', 'pCodigoBarras') == [2]
+    assert any("'0012345678906' (dígito verificador incorreto)" in log for log in validador.logs)
+
+
+def test_ncm_com_zero_a_esquerda(validar, castelli, gravar_csv, tabela_ncm):
+    castelli['pNCM'] = '69072100'
+    castelli.loc[0, 'pNCM'] = '01012100'
+    castelli.loc[1, 'pNCM'] = '01012199'  # fora da tabela
+    validador = validar(gravar_csv(castelli))
+
+    assert linhas_com_falha(validador, 'ncm_inexistente', 'pNCM') == [1]
+    for regra in ('ncm_invalido', 'ncm_corrigido', 'ncm_tamanho_invalido'):
+        assert linhas_com_falha(validador, regra, 'pNCM') == []
+
+
+def test_sem_tabela_ncm_o_relatorio_avisa(validar, castelli, gravar_csv, monkeypatch, tmp_path):
+    import tabela_ncm
+    monkeypatch.setattr(tabela_ncm, 'TABELA_NCM', str(tmp_path / 'nao_existe.csv'))
+    validador = validar(gravar_csv(castelli))
+
+    assert any('tabela NCM não encontrada' in aviso for aviso in validador.avisos)
+
+
+def _falhas(validador):
+    linhas, indices, valores, regras = validador.indice.falhas()
+    return sorted((int(linha), regras[i][0], regras[i][1], str(valor)) for linha, i, valor in zip(linhas, indices, valores))
+
+
+def _relatorio(validador):
+    relatorio = validador.gerar_relatorio()
+    return (relatorio['resumo']['linhas_invalidas'], relatorio['erros'], relatorio['warnings'],
+            sorted(relatorio['regras'], key=lambda regra: (regra['regra'], regra['coluna'])),
+            relatorio['duplicados'], relatorio['sugestoes_ncm'])
+
+
+def test_validacao_em_blocos_igual_a_completa(leitor, castelli, gravar_csv, tabela_ncm):
+    rng = np.random.default_rng(3)
+    castelli['pNCM'] = '69072100'
+    for coluna in castelli.columns[1:]:
+        for linha in rng.choice(len(castelli), 25, replace=False):
+            castelli.loc[linha, coluna] = VALORES_AMBIGUOS[rng.integers(len(VALORES_AMBIGUOS))]
+    caminho = gravar_csv(castelli)
+
+    completa = ValidadorProdutos(caminho, relatorio_txt=False)
+    completa.executar_validacao_completa()
+    em_blocos = ValidadorProdutos(caminho, relatorio_txt=False)
+    em_blocos.executar_validacao_streaming(5)
+
+    assert _relatorio(em_blocos) == _relatorio(completa)
+    assert _falhas(em_blocos) == _falhas(completa)
+
+
+def test_chaves_comparadas_como_texto(validar, castelli, gravar_csv):
+    castelli['pReferencia'] = [str(i) for i in range(len(castelli))]
+    castelli.loc[0, 'pReferencia'] = '0.0'
+    castelli.loc[1, 'pReferencia'] = '0'
+    castelli.loc[140, 'pReferencia'] = '007'  # a linha 7 tem '7'
+    castelli.loc[141, 'pReferencia'] = '2'  # repetido de verdade
+    validador = validar(gravar_csv(castelli), tamanho_bloco=5)
+
+    assert linhas_com_falha(validador, 'chave_duplicada', 'pReferencia') == [2, 141]
+
+
+def _tipos(df):
+    return {str(coluna).replace('Unnamed: 0', 'pIndice'): str(tipo) for coluna, tipo in df.dtypes.items()}
+
+
+def test_blocos_do_excel_com_os_tipos_da_leitura_completa(castelli, tmp_path):
+    pytest.importorskip('openpyxl')
+    caminho = str(tmp_path / 'produtos.xlsx')
+    castelli.to_excel(caminho, index=False)
+    validador = ValidadorProdutos(caminho, relatorio_txt=False)
+    assert validador.carregar_arquivo()
+
+    blocos = list(validador._ler_blocos('.xlsx', 50))
+    assert len(blocos) == 3
+    for bloco in blocos:
+        assert _tipos(bloco) == _tipos(validador.df)
+
+
+def test_blocos_do_xls_com_os_tipos_da_leitura_completa(castelli, tmp_path, monkeypatch):
+    # Sem xlrd no ambiente de testes: o read_excel devolve o que o xlrd leria (object)
+    caminho = tmp_path / 'produtos.xls'
+    caminho.write_bytes(b'')
+    monkeypatch.setattr(pd, 'read_excel', lambda *args, **kwargs: castelli.astype(object))
+    validador = ValidadorProdutos(str(caminho), relatorio_txt=False)
+    assert validador.carregar_arquivo()
+
+    blocos = list(validador._ler_blocos('.xls', 50))
+    assert len(blocos) == 1
+    assert _tipos(blocos[0]) == _tipos(validador.df)
+    assert str(blocos[0]['pFornecedor'].dtype) == 'category'
+
+
+def _ascii(df):
+    """Cabeçalho e valores sem acentos ('pDescrição' -> 'pDescricao'): o arquivo é ASCII puro"""
+    def sem_acentos(texto):
+        return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    df = df.rename(columns=sem_acentos)
+    return df.apply(lambda coluna: coluna.map(sem_acentos))
+
+
+@pytest.mark.parametrize('encoding, sep, esperado', [
+    ('cp1252', ';', ('cp1252', ';')),
+    ('utf-8', ',', ('utf-8', ',')),
+    ('utf-8-sig', ';', ('utf-8-sig', ';')),
+])
+def test_dialeto_do_csv(castelli, tmp_path, encoding, sep, esperado):
+    caminho = str(tmp_path / 'produtos.csv')
+    castelli.to_csv(caminho, sep=sep, index=False, encoding=encoding)
+    validador = ValidadorProdutos(caminho, relatorio_txt=False)
+    assert validador._detectar_dialeto_csv() == esperado
+
+    assert validador.carregar_arquivo()
+    assert len(validador.df) == len(castelli)
+    assert 'pDescrição' in validador.df.columns  # acentos do cabeçalho lidos certo
+
+
+def test_texto_cp1252_depois_da_amostra(validar, castelli, tmp_path, monkeypatch):
+    import validador_gabaritos
+    monkeypatch.setattr(validador_gabaritos, 'TAMANHO_AMOSTRA_CSV', 4096)
+    castelli = _ascii(castelli)
+    castelli.loc[140, 'pDescricao'] = 'PORCELANATO SÃO JOÃO'
+    caminho = str(tmp_path / 'produtos.csv')
+    castelli.to_csv(caminho, sep=';', index=False, encoding='cp1252')
+    with open(caminho, 'rb') as f:
+        assert f.read().find('Ã'.encode('cp1252')) > 4096  # primeiro byte não ASCII depois da amostra
+    assert ValidadorProdutos(caminho, relatorio_txt=False)._detectar_dialeto_csv() == ('utf-8', ';')
+
+    validador = validar(caminho)
+    completa = ValidadorProdutos(caminho, relatorio_txt=False)
+    completa.executar_validacao_completa()
+    assert completa.df.loc[140, 'pDescricao'] == 'PORCELANATO SÃO JOÃO'
+    assert validador.gerar_relatorio()['resumo']['total_linhas'] == len(castelli)
+    assert _relatorio(validador) == _relatorio(completa)
+    # Nas duas leituras o erro de decodificação só aparece no meio do arquivo: recomeça do zero em cp1252
+    assert "⚠️  Arquivo não é UTF-8 após a amostra - relendo com cp1252" in validador.logs
+
+
+@pytest.mark.parametrize('ext', ['.csv', '.xlsx'])
+def test_planilha_corrigida_revalidada_sem_os_erros_corrigiveis(validar, castelli, tmp_path, tabela_ncm, ext):
+    castelli['pNCM'] = '69072100'
+    castelli.loc[0, 'pNCM'] = '1012100'  # zero à esquerda apagado pelo Excel
+    castelli.loc[1, 'pNCM'] = '6907.21.00'
+    castelli.loc[2, 'pUN'] = ''
+    castelli.loc[3, 'pCusto'] = ''
+    castelli.loc[4, 'pCodigoBarras'] = ''
+    castelli.loc[5, 'pDescrição'] = '  Piso Granilha  '
+    caminho = str(tmp_path / f'produtos{ext}')
+    if ext == '.csv':
+        castelli.to_csv(caminho, sep=';', index=False, encoding='cp1252')
+    else:
+        castelli.to_excel(caminho, index=False)
+    corrigido = str(tmp_path / f'corrigido{ext}')
+
+    relatorio = validar(caminho, arquivo_corrigido=corrigido).gerar_relatorio()
+    assert relatorio['correcoes']['valores_padrao'] == {'pCodigoBarras': 1, 'pUN': 1, 'pCusto': 1}
+    assert relatorio['correcoes']['celulas_normalizadas'] == 3
+    assert relatorio['erros']
+
+    revalidado = validar(corrigido)
+    assert _falhas(revalidado) == []
+    assert revalidado.gerar_relatorio()['erros'] == []
+
+    if ext == '.csv':
+        df = pd.read_csv(corrigido, sep=';', encoding='cp1252', dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(corrigido, dtype=str, keep_default_na=False)
+    assert df['pNCM'].tolist()[:3] == ['01012100', '69072100', '69072100']
+    assert (df.loc[2, 'pUN'], df.loc[3, 'pCusto'], df.loc[4, 'pCodigoBarras']) == ('UN', '-1', 'SEM GTIN')
+    assert df.loc[5, 'pDescricao'] == 'Piso Granilha'  # com o nome de coluna do perfil
+    assert len(df) == len(castelli)
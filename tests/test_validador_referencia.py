@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from leitura_tipada import ler_csv, tipar
+from regras_validacao import obter_plano
+from validador_gabaritos import ValidadorProdutos
+from validador_referencia import ValidadorProdutosReferencia
+
+METODOS = ['validar_colunas_obrigatorias', 'aplicar_valores_padrao', 'validar_pOrigem_CST', 'validar_dominios',
+           'validar_pNCM', 'validar_valores_numericos']
+
+VALORES = ['', ' ', '0', '2', '2.0', '3', 'abc', '1,5', '-1', '007', '6907.21.00', '6907210', '01012100',
+           '+1', '1_000', '1e3', 'inf', 'nan', 'BATATA', '69072100']
+
+
+@pytest.fixture
+def planilha(castelli, gravar_csv):
+    """CSV do Castelli com valores estranhos espalhados pelas colunas"""
+    rng = np.random.default_rng(7)
+    castelli['pNCM'] = '69072100'
+    castelli['pOrigem CST'] = '0'
+    for coluna in castelli.columns[1:]:
+        for linha in rng.choice(len(castelli), 20, replace=False):
+            castelli.loc[linha, coluna] = VALORES[rng.integers(len(VALORES))]
+    castelli.loc[:9, 'pOrigem CST'] = ['0', '2', '', '2', '0', '2', '0', '0', '2', '0']  # primeiro bloco todo número
+    return gravar_csv(castelli)
+
+
+def _executar(classe, df, metodo):
+    validador = classe('planilha.csv', relatorio_txt=False)
+    validador.df = df.copy()
+    getattr(validador, metodo)()
+    return validador
+
+
+def _comparar(df, metodo):
+    vetorizado = _executar(ValidadorProdutos, df, metodo)
+    referencia = _executar(ValidadorProdutosReferencia, df, metodo)
+    assert referencia.erros == vetorizado.erros
+    assert referencia.avisos == vetorizado.avisos
+    assert referencia.logs == vetorizado.logs
+    assert referencia.sugestoes_ncm == vetorizado.sugestoes_ncm
+    pd.testing.assert_frame_equal(referencia.df, vetorizado.df)
+
+
+def _sem_tipos(caminho):
+    df = pd.read_csv(caminho, sep=';', encoding='cp1252')
+    df['pOrigem CST'] = pd.to_numeric(df['pOrigem CST'], errors='coerce')  # coluna float, com NaN
+    df.loc[3, 'pOrigem CST'] = np.inf
+    return df
+
+
+@pytest.mark.parametrize('metodo', METODOS)
+def test_referencia_sem_tipos(metodo, planilha, tabela_ncm):
+    _comparar(_sem_tipos(planilha), metodo)
+
+
+@pytest.mark.parametrize('metodo', METODOS)
+def test_referencia_tipada(metodo, leitor, planilha, tabela_ncm):
+    _comparar(ler_csv(planilha, ';', 'cp1252', obter_plano('produtos')), metodo)
+
+
+@pytest.mark.parametrize('metodo', METODOS)
+def test_referencia_categorias_numericas(metodo, planilha, tabela_ncm):
+    # tipar num DataFrame já inferido: pOrigem CST vira category de floats (0.0, 2.0, inf)
+    df = tipar(_sem_tipos(planilha), obter_plano('produtos'))
+    assert df['pOrigem CST'].cat.categories.dtype == np.float64
+    _comparar(df, metodo)
+
+
+def test_referencia_sem_tabela_ncm(planilha):
+    _comparar(_sem_tipos(planilha), 'validar_pNCM')
+
+
+def test_validacao_completa_da_referencia(planilha, tabela_ncm):
+    vetorizado = ValidadorProdutos(planilha, relatorio_txt=False).executar_validacao_completa()
+    referencia = ValidadorProdutosReferencia(planilha, relatorio_txt=False).executar_validacao_completa()
+    for chave in ('erros', 'warnings', 'duplicados', 'sugestoes_ncm'):
+        assert referencia[chave] == vetorizado[chave], chave
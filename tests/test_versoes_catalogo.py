@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from validador_gabaritos import ValidadorProdutos
+from versoes_catalogo import ImpressaoCatalogo, numerar_chaves
+
+from test_validador_gabaritos import _falhas, _relatorio
+
+
+@pytest.fixture
+def versoes(castelli, gravar_csv):
+    """(v1, v2) do Castelli: v2 muda um preço e dois NCMs, remove a linha 12 e acrescenta um produto"""
+    castelli['pNCM'] = '69072100'
+    castelli.loc[5, 'pNCM'] = '1234'
+    v1 = gravar_csv(castelli, 'v1.csv')
+
+    castelli.loc[3, 'pCusto'] = '99,9'
+    castelli.loc[5, 'pNCM'] = '69072100'  # erro corrigido
+    castelli.loc[8, 'pNCM'] = 'ABC'  # erro novo
+    castelli = castelli.drop(index=10)
+    novo = castelli.iloc[[0]].assign(pReferencia='99999')
+    v2 = gravar_csv(pd.concat([castelli, novo], ignore_index=True), 'v2.csv')
+    return v1, v2
+
+
+def _impressao(validar, caminho, tmp_path):
+    destino = str(tmp_path / 'v1.impressao.npz')
+    validar(caminho, gerar_impressao=True).impressao.salvar(destino)
+    return destino
+
+
+def test_versao_incremental_igual_a_validacao_completa(validar, versoes, tmp_path):
+    v1, v2 = versoes
+    incremental = validar(v2, anterior=_impressao(validar, v1, tmp_path))
+    completa = ValidadorProdutos(v2, relatorio_txt=False)
+    completa.executar_validacao_completa()
+
+    assert _relatorio(incremental) == _relatorio(completa)
+    assert _falhas(incremental) == _falhas(completa)
+    for regra, coluna, _ in completa.indice.regras():
+        assert np.array_equal(incremental.indice.mascara(regra, coluna), completa.indice.mascara(regra, coluna))
+
+
+def test_diferencas_entre_versoes(validar, versoes, tmp_path):
+    v1, v2 = versoes
+    diferencas = validar(v2, anterior=_impressao(validar, v1, tmp_path)).gerar_relatorio()['diferencas']
+
+    contagens = {chave: valor for chave, valor in diferencas.items() if chave != 'produtos'}
+    assert contagens == {'anterior': 'v1.csv', 'linhas_anterior': 145, 'adicionados': 1, 'removidos': 1,
+                         'alterados': 3, 'inalterados': 141, 'precos_alterados': 1,
+                         'linhas_reaproveitadas': 141, 'linhas_validadas': 4}
+    produtos = diferencas['produtos']
+    assert produtos['adicionados'] == [{'linha': 146, 'pCodigo': '-1', 'pReferencia': '99999'}]
+    assert produtos['removidos'] == [{'linha_anterior': 12, 'pCodigo': '-1', 'pReferencia': '70743'}]
+    assert [produto['linha'] for produto in produtos['alterados']] == [5, 7, 10]
+    assert produtos['precos'] == [{'linha': 5, 'pCodigo': '-1', 'pReferencia': '73731', 'coluna': 'pCusto',
+                                   'anterior': 62.9, 'atual': 99.9, 'variacao_percentual': 58.82}]
+
+
+def test_impressao_de_outra_tabela_ncm_nao_e_reaproveitada(validar, versoes, tmp_path, request):
+    v1, v2 = versoes
+    impressao = _impressao(validar, v1, tmp_path)  # sem tabela NCM
+    request.getfixturevalue('tabela_ncm')
+    incremental = validar(v2, anterior=impressao)
+    completa = ValidadorProdutos(v2, relatorio_txt=False)
+    completa.executar_validacao_completa()
+
+    diferencas = incremental.gerar_relatorio()['diferencas']
+    assert (diferencas['linhas_reaproveitadas'], diferencas['linhas_validadas']) == (0, 145)
+    assert diferencas['alterados'] == 3  # a comparação de produtos continua
+    assert _falhas(incremental) == _falhas(completa)
+
+
+def test_impressao_salva_e_carregada(validar, versoes, tmp_path):
+    v1, _ = versoes
+    original = validar(v1, gerar_impressao=True).impressao
+    original.salvar(str(tmp_path / 'v1.impressao.npz'))
+    carregada = ImpressaoCatalogo.carregar(str(tmp_path / 'v1.impressao.npz'))
+
+    assert len(carregada) == len(original) == 145
+    assert np.array_equal(carregada.hashes, original.hashes)
+    assert carregada.metadados == original.metadados
+    posicoes, valores = carregada.falhas('ncm_tamanho_invalido', 'pNCM')
+    assert (posicoes.tolist(), valores.tolist()) == ([5], ['1234'])
+
+
+def test_numerar_chaves_continua_entre_blocos():
+    vistas = {}
+    assert numerar_chaves(['a', 'b', 'a'], vistas).tolist() == ['a', 'b', 'a\x1e1']
+    assert numerar_chaves(['a', 'c'], vistas).tolist() == ['a\x1e2', 'c']
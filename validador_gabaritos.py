@@ -1,35 +1,499 @@
+import io
 import os
+from contextlib import nullcontext
 from datetime import datetime
+import numpy as np
 import pandas as pd
-import unicodedata
-import re
+import csv
+import codecs
+import json
+
+from regras_validacao import obter_plano, normalizar_nome_coluna, PERFIL_PADRAO
+from tabela_ncm import obter_tabela, TAMANHO_NCM
+from planilha_corrigida import EscritorPlanilha
+from leitura_tipada import ler_csv, ler_csv_em_blocos, colunas_csv, tipos_leitura, tipar, materializar
+from metricas import MedidorEtapas
+from versoes_catalogo import (ImpressaoCatalogo, ImpressaoInvalida, obter_anterior, numerar_chaves, hash_linhas,
+                              descrever_chave, SEPARADOR_CHAVE, MAX_PRODUTOS_DIFERENCA)
+
+# Incrementar sempre que uma regra de validação mudar: invalida os relatórios em cache
+VERSAO_REGRAS = 13
+
+# Quantidade de bytes lidos para detectar encoding e separador dos CSVs
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+SEPARADORES_CSV = [';', ',', '\t']
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Linhas por bloco no modo streaming (executar_validacao_streaming)
+TAMANHO_BLOCO_PADRAO = 50000
+
+# GTIN/EAN: tamanhos aceitos e pesos dos 13 primeiros dígitos (código completado com zeros até 14)
+FORMATO_GTIN = r'\d{8}|\d{12,14}'
+PESOS_GTIN = np.array([3, 1] * 6 + [3], dtype=np.int64)
+
+# Consistência entre linhas: valor atípico se o z-score robusto (mediana e MAD) passar
+# do limite, em grupos com pelo menos MINIMO_GRUPO_ATIPICOS valores
+LIMITE_Z_ROBUSTO = 3.5
+MINIMO_GRUPO_ATIPICOS = 5
+# Tolerância relativa das proporções: os valores chegam arredondados em 2 casas
+TOLERANCIA_PROPORCAO = 0.005
+# Regras calculadas no bloco todo, mesmo na validação incremental
+REGRAS_CONSISTENCIA = ('valor_divergente', 'proporcao_invalida', 'preco_abaixo_minimo', 'valor_atipico')
+
+
+def gtin_digito_valido(codigos):
+    """
+    Confere o dígito verificador de GTIN-8/12/13/14 de uma vez para o array
+    inteiro (textos só com dígitos, já no FORMATO_GTIN).
+    """
+    if len(codigos) == 0:
+        return np.zeros(0, dtype=bool)
+    completos = np.char.zfill(np.asarray(codigos, dtype='U14'), 14).astype('S14')
+    digitos = np.frombuffer(completos.tobytes(), dtype=np.uint8).reshape(-1, 14) - ord('0')
+    soma = digitos[:, :13].astype(np.int64) @ PESOS_GTIN
+    return (10 - soma % 10) % 10 == digitos[:, 13]
+
+
+# Códigos NCM distintos com sugestão no relatório, por coluna
+MAX_SUGESTOES_NCM = 100
+
+
+def aquecer_processo(perfil=PERFIL_PADRAO):
+    """Initializer dos pools: carrega o perfil e a tabela NCM antes do primeiro job"""
+    obter_plano(perfil)
+    obter_tabela()
+
+
+def aquecer_validacao(perfis=(PERFIL_PADRAO,)):
+    """
+    Aquecimento de um servidor antes do fork (gunicorn com preload): compila os
+    perfis, carrega a tabela NCM e valida em memória uma planilha de uma linha
+    em CSV e em .xlsx - importa o que o pandas e o openpyxl só importam no
+    primeiro uso e passa uma vez por todas as regras. Os processos criados
+    depois (workers e pools) herdam tudo pronto.
+    """
+    for perfil in perfis:
+        aquecer_processo(perfil)
+    plano = obter_plano(perfis[0])
+    linha = pd.DataFrame([[plano.campos_padrao.get(coluna, 1) for coluna in plano.colunas_esperadas]],
+                         columns=plano.colunas_esperadas)
+    xlsx = io.BytesIO()
+    linha.to_excel(xlsx, index=False, engine='openpyxl')
+    for conteudo, nome in ((linha.to_csv(sep=';', index=False).encode('utf-8'), 'aquecimento.csv'),
+                           (xlsx.getvalue(), 'aquecimento.xlsx')):
+        ValidadorProdutos(conteudo, perfil=perfis[0], relatorio_txt=False, nome_arquivo=nome).executar_validacao_completa()
+
+
+def _na_planilha(inicio, posicoes):
+    """
+    Posições no bloco -> posições na planilha. inicio é a posição da primeira
+    linha de um bloco contínuo ou, na validação incremental, o array com a
+    posição de cada linha do bloco.
+    """
+    if np.ndim(inicio) == 0:
+        return posicoes + inicio
+    return np.asarray(inicio)[posicoes]
+
+
+class Ocorrencias:
+    """Contagem de um tipo de problema, guardando só os primeiros exemplos"""
+
+    def __init__(self, limite):
+        self.total = 0
+        self.exemplos = []
+        self.limite = limite
+        self._ordem = []  # posição na planilha de cada exemplo
+
+    def adicionar(self, posicoes, descrever, inicio=0):
+        """
+        Soma as posições encontradas; descrever(pos) só é chamado para os
+        exemplos guardados. Os exemplos são sempre os das primeiras linhas da
+        planilha (inicio como em _na_planilha), mesmo que os blocos cheguem
+        fora de ordem, como na validação incremental.
+        """
+        self.total += len(posicoes)
+        if not len(posicoes):
+            return
+        ordem = _na_planilha(inicio, np.asarray(posicoes))
+        if len(self._ordem) == self.limite and ordem.min() > self._ordem[-1]:
+            return
+        if not self._ordem or ordem.min() > self._ordem[-1]:
+            candidatos = range(min(len(posicoes), self.limite - len(self._ordem)))  # caso comum: blocos em ordem
+        else:
+            candidatos = np.argsort(ordem, kind='stable')[:self.limite]
+        novos = [(int(ordem[i]), descrever(posicoes[i])) for i in candidatos]
+        if self._ordem and novos and novos[0][0] < self._ordem[-1]:
+            novos = sorted(list(zip(self._ordem, self.exemplos)) + novos, key=lambda par: par[0])[:self.limite]
+            self._ordem, self.exemplos = [o for o, _ in novos], [e for _, e in novos]
+        else:
+            self._ordem.extend(o for o, _ in novos)
+            self.exemplos.extend(e for _, e in novos)
+
+
+# Severidade de cada regra registrada no índice de erros
+SEVERIDADE_ERRO = 'erro'
+SEVERIDADE_AVISO = 'aviso'
+
+
+class IndiceErros:
+    """
+    Índice das linhas que falharam em cada regra.
+
+    Cada regra (regra, coluna) guarda, por bloco de linhas, um bitmap
+    compacto (np.packbits) das linhas com problema e, quando informado, o
+    valor de cada célula com problema. Permite contar linhas inválidas sem
+    dupla contagem (união dos bitmaps de erro), listar todas as linhas de uma
+    regra ou todas as falhas de uma linha sem reler o DataFrame.
+    Posições são 0-based sobre os dados; as linhas da planilha são posição + 2.
+    """
+
+    def __init__(self):
+        self.total_linhas = 0
+        self._regras = {}  # (regra, coluna) -> {'severidade': ..., 'blocos': {inicio: (tamanho, bits, valores)}}
+
+    def registrar(self, regra, coluna, severidade, inicio, mascara, valores=None):
+        """
+        Registra a máscara booleana de um bloco que começa na posição inicio.
+        valores (opcional) é a série do bloco; só as células com problema são guardadas.
+        inicio também pode ser o array de posições de linhas espalhadas (validação
+        incremental): elas só entram nos blocos em consolidar().
+        """
+        entrada = self._regras.setdefault((regra, coluna), {'severidade': severidade, 'blocos': {}})
+        if np.ndim(inicio):
+            if mascara.any():
+                if valores is not None:
+                    valores = pd.Series(valores)[mascara].astype(str).to_numpy(dtype=str)
+                entrada.setdefault('espalhadas', []).append((np.asarray(inicio)[mascara], valores))
+            return
+        if mascara.any():
+            if valores is not None:
+                valores = valores[mascara].astype(str).to_numpy(dtype=str)
+            entrada['blocos'][inicio] = (len(mascara), np.packbits(mascara), valores)
+        else:
+            entrada['blocos'].pop(inicio, None)
+
+    def registrar_posicoes(self, regra, coluna, severidade, posicoes, valores=None):
+        """Registra falhas conhecidas só no fim (ex.: chaves repetidas em blocos diferentes)"""
+        mascara = np.zeros(self.total_linhas, dtype=bool)
+        mascara[posicoes] = True
+        serie = None
+        if valores is not None:
+            serie = pd.Series(np.empty(self.total_linhas, dtype=object))
+            serie.iloc[posicoes] = np.asarray(valores, dtype=object)
+        self._regras.pop((regra, coluna), None)
+        self.registrar(regra, coluna, severidade, 0, mascara, serie)
+
+    def consolidar(self):
+        """Junta as linhas espalhadas de cada regra aos blocos (um bloco da planilha inteira)"""
+        for (regra, coluna), entrada in list(self._regras.items()):
+            espalhadas = entrada.pop('espalhadas', None)
+            if not espalhadas:
+                continue
+            posicoes, valores = self._posicoes_e_valores(regra, coluna)
+            com_valores = any(v is not None for _, _, v in entrada['blocos'].values()) or \
+                any(v is not None for _, v in espalhadas)
+            mascara = np.zeros(self.total_linhas, dtype=bool)
+            todos = np.full(self.total_linhas, '', dtype=object)
+            mascara[posicoes] = True
+            todos[posicoes] = valores
+            for pos, vals in espalhadas:
+                mascara[pos] = True
+                if vals is not None:
+                    todos[pos] = vals
+            entrada['blocos'] = {}
+            self.registrar(regra, coluna, entrada['severidade'], 0, mascara,
+                           pd.Series(todos) if com_valores else None)
+
+    def regras(self, severidade=None):
+        """Lista de (regra, coluna, severidade) registradas"""
+        return [(regra, coluna, entrada['severidade'])
+                for (regra, coluna), entrada in self._regras.items()
+                if severidade is None or entrada['severidade'] == severidade]
+
+    def mascara(self, regra, coluna):
+        """Máscara booleana (total_linhas) das linhas que falharam na regra"""
+        resultado = np.zeros(self.total_linhas, dtype=bool)
+        entrada = self._regras.get((regra, coluna))
+        if entrada is not None:
+            for inicio, (tamanho, bits, _) in entrada['blocos'].items():
+                resultado[inicio:inicio + tamanho] |= np.unpackbits(bits, count=tamanho).astype(bool)
+        return resultado
+
+    def _posicoes_e_valores(self, regra, coluna):
+        """Posições (ordenadas) e valores das células com problema na regra"""
+        posicoes, valores = [], []
+        for inicio, (tamanho, bits, vals) in sorted(self._regras[(regra, coluna)]['blocos'].items()):
+            pos = np.flatnonzero(np.unpackbits(bits, count=tamanho)) + inicio
+            posicoes.append(pos)
+            valores.append(vals if vals is not None else np.full(len(pos), None, dtype=object))
+        if not posicoes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+        return np.concatenate(posicoes), np.concatenate([v.astype(object) for v in valores])
+
+    def mascara_invalidas(self):
+        """União das regras de erro: linhas com pelo menos um erro"""
+        resultado = np.zeros(self.total_linhas, dtype=bool)
+        for regra, coluna, _ in self.regras(SEVERIDADE_ERRO):
+            resultado |= self.mascara(regra, coluna)
+        return resultado
+
+    def total(self, regra, coluna):
+        entrada = self._regras.get((regra, coluna))
+        if entrada is None:
+            return 0
+        return sum(int(np.unpackbits(bits, count=tamanho).sum()) for tamanho, bits, _ in entrada['blocos'].values())
+
+    def linhas_da_regra(self, regra, coluna):
+        """Todas as linhas da planilha que falharam na regra"""
+        return (np.flatnonzero(self.mascara(regra, coluna)) + 2).tolist()
+
+    def falhas_da_linha(self, linha):
+        """Todas as regras em que a linha da planilha falhou"""
+        pos = linha - 2
+        falhas = []
+        for (regra, coluna), entrada in self._regras.items():
+            for inicio, (tamanho, bits, valores) in entrada['blocos'].items():
+                if inicio <= pos < inicio + tamanho:
+                    deslocamento = pos - inicio
+                    if bits[deslocamento // 8] & (0x80 >> (deslocamento % 8)):
+                        falha = {'regra': regra, 'coluna': coluna, 'severidade': entrada['severidade']}
+                        if valores is not None:
+                            # Quantas falhas vêm antes desta no bloco = índice do valor
+                            anteriores = int(np.unpackbits(bits, count=deslocamento).sum())
+                            falha['valor'] = str(valores[anteriores])
+                        falhas.append(falha)
+                    break
+        return falhas
+
+    def falhas(self, regras=None, colunas=None, severidades=None):
+        """
+        Todas as falhas individuais (linha, regra, coluna, severidade, valor),
+        ordenadas por linha, opcionalmente filtradas.
+        Retorna (linhas, indices_regra, valores, lista_regras) em arrays NumPy,
+        para que a paginação fatie sem montar dicts de linhas fora da página.
+        """
+        selecionadas = [(regra, coluna, severidade) for regra, coluna, severidade in self.regras()
+                        if (not regras or regra in regras)
+                        and (not colunas or coluna in colunas)
+                        and (not severidades or severidade in severidades)]
+        posicoes, indices, valores = [], [], []
+        for i, (regra, coluna, _) in enumerate(selecionadas):
+            pos, vals = self._posicoes_e_valores(regra, coluna)
+            posicoes.append(pos)
+            indices.append(np.full(len(pos), i, dtype=np.int32))
+            valores.append(vals)
+        if not posicoes:
+            vazio = np.zeros(0, dtype=np.int64)
+            return vazio, vazio, np.zeros(0, dtype=object), selecionadas
+        posicoes = np.concatenate(posicoes)
+        indices = np.concatenate(indices)
+        valores = np.concatenate(valores)
+        ordem = np.lexsort((indices, posicoes))
+        return posicoes[ordem] + 2, indices[ordem], valores[ordem], selecionadas
+
+    def resumo(self):
+        """Contagem de linhas por regra, para o relatório"""
+        return [{'regra': regra, 'coluna': coluna, 'severidade': severidade, 'linhas': self.total(regra, coluna)}
+                for regra, coluna, severidade in self.regras()]
+
+    def para_arrays(self, prefixo=''):
+        """Arrays do .npz (um bitmap da planilha inteira por regra), com os nomes começando por prefixo"""
+        metadados = {'total_linhas': self.total_linhas, 'regras': []}
+        arrays = {}
+        for i, (regra, coluna, severidade) in enumerate(self.regras()):
+            _, valores = self._posicoes_e_valores(regra, coluna)
+            com_valores = any(v is not None for _, _, v in self._regras[(regra, coluna)]['blocos'].values())
+            metadados['regras'].append({'regra': regra, 'coluna': coluna, 'severidade': severidade,
+                                        'com_valores': com_valores})
+            arrays[f'{prefixo}bits_{i}'] = np.packbits(self.mascara(regra, coluna))
+            if com_valores:
+                arrays[f'{prefixo}valores_{i}'] = valores.astype(str)
+        arrays[f'{prefixo}metadados'] = np.array(json.dumps(metadados, ensure_ascii=False))
+        return arrays
+
+    @classmethod
+    def de_arrays(cls, dados, prefixo=''):
+        """Índice a partir dos arrays de para_arrays (ex.: um np.load aberto)"""
+        indice = cls()
+        metadados = json.loads(str(dados[f'{prefixo}metadados']))
+        indice.total_linhas = metadados['total_linhas']
+        for i, regra in enumerate(metadados['regras']):
+            bits = dados[f'{prefixo}bits_{i}']
+            valores = dados[f'{prefixo}valores_{i}'] if regra['com_valores'] else None
+            entrada = indice._regras.setdefault((regra['regra'], regra['coluna']),
+                                                {'severidade': regra['severidade'], 'blocos': {}})
+            if bits.any():
+                entrada['blocos'][0] = (indice.total_linhas, bits, valores)
+        return indice
+
+    def salvar(self, caminho):
+        """Grava o índice em um .npz"""
+        with open(caminho, 'wb') as f:
+            np.savez_compressed(f, **self.para_arrays())
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho, allow_pickle=False) as dados:
+            return cls.de_arrays(dados)
+
+
+class _VisaoColuna:
+    """Conversões de uma coluna, calculadas uma vez e compartilhadas pelas regras do plano"""
+
+    def __init__(self, serie):
+        # As regras veem a coluna como na leitura sem tipos; em string e category de textos os
+        # textos saem dos valores distintos (cada um convertido uma vez só). Categorias numéricas
+        # são vistas como a coluna numérica (2.0 é '2' em textos_inteiros)
+        self._original = serie
+        self.codificada = isinstance(serie.dtype, pd.StringDtype) or (
+            isinstance(serie.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(serie.cat.categories))
+        self._serie = None
+        self._distintos = None
+        self._na = None
+        self._textos = None
+        self._vazios = None
+        self._textos_inteiros = None
+
+    @property
+    def serie(self):
+        """A coluna materializada (category e string como na leitura sem tipos)"""
+        if self._serie is None:
+            self._serie = materializar(self._original)
+        return self._serie
+
+    def distintos(self):
+        """(códigos, textos distintos sem espaços nas pontas); código -1 nas células vazias (NaN)"""
+        if self._distintos is None:
+            if isinstance(self._original.dtype, pd.CategoricalDtype):
+                codigos, valores = self._original.cat.codes.to_numpy(), self._original.cat.categories
+            else:
+                codigos, valores = pd.factorize(self._original if self.codificada else self.serie)
+            textos = np.array([str(valor).strip() for valor in valores], dtype=object)
+            self._distintos = (codigos, textos)
+        return self._distintos
+
+    @property
+    def na(self):
+        if self._na is None:
+            self._na = self.distintos()[0] < 0 if self.codificada else self.serie.isna().to_numpy()
+        return self._na
+
+    @property
+    def textos(self):
+        """str() de cada célula, sem espaços nas pontas"""
+        if self._textos is None:
+            if self.codificada:
+                codigos, distintos = self.distintos()
+                textos = np.append(distintos, 'nan')  # código -1 (vazio) pega o último, como str(NaN)
+                self._textos = pd.Series(textos[codigos], index=self._original.index, name=self._original.name)
+            else:
+                self._textos = self.serie.astype(str).str.strip()
+        return self._textos
+
+    @property
+    def vazios(self):
+        """Células vazias (NaN ou texto em branco)"""
+        if self._vazios is None:
+            if self.codificada:
+                codigos, distintos = self.distintos()
+                self._vazios = np.append(distintos == '', True)[codigos]
+            else:
+                self._vazios = self.na.copy()
+                if self.serie.dtype == object:
+                    self._vazios |= (self.textos == '').to_numpy()
+        return self._vazios
+
+    @property
+    def textos_inteiros(self):
+        """Como textos, mas floats inteiros (colunas com NaN) saem sem '.0'"""
+        if self._textos_inteiros is None:
+            textos = self.textos
+            if not self.codificada and pd.api.types.is_float_dtype(self.serie):
+                textos = textos.copy()
+                valores = self.serie.to_numpy()
+                inteiros = np.isfinite(valores) & (valores == np.floor(valores))
+                textos[inteiros] = valores[inteiros].astype('int64').astype(str)
+            self._textos_inteiros = textos
+        return self._textos_inteiros
+
 
 class ValidadorProdutos:
-    def __init__(self, arquivo, log_callback=None):
+    def __init__(self, arquivo, log_callback=None, progresso_callback=None, perfil=PERFIL_PADRAO,
+                 relatorio_txt=True, arquivo_corrigido=None, anterior=None, gerar_impressao=False,
+                 nome_arquivo=None):
         """
         Validador específico para planilha de produtos com 30 colunas
         Agora suporta Excel (.xlsx, .xls) e CSV
+        relatorio_txt=False não grava o relatorio_produtos_*.txt no diretório atual
+        arquivo_corrigido: se informado, grava ali a planilha com as correções aplicadas
+        (.csv ou .xlsx, ver planilha_corrigida.extensao_corrigida)
+        anterior: impressão (.npz ou ImpressaoCatalogo) ou planilha da versão anterior do
+        catálogo - só as linhas novas ou alteradas são validadas (ver versoes_catalogo)
+        gerar_impressao=True guarda em self.impressao a impressão desta versão
+        arquivo pode ser também o conteúdo (bytes) ou um arquivo binário aberto (com seek):
+        a validação lê da memória, sem gravar nada em disco. nome_arquivo é o nome original
+        (extensão e relatório) - obrigatório nesses casos, opcional com um caminho
         """
-        self.arquivo = arquivo
+        if isinstance(arquivo, (bytes, bytearray, memoryview)):
+            arquivo = io.BytesIO(arquivo)
+        self._fonte = arquivo  # caminho ou arquivo aberto, de onde os leitores leem
+        self._em_memoria = hasattr(arquivo, 'read')
+        nome = getattr(arquivo, 'name', None) if self._em_memoria else arquivo
+        self.arquivo = nome_arquivo or (nome if isinstance(nome, (str, os.PathLike)) else '')
+        self.relatorio_txt = relatorio_txt
+        self.arquivo_corrigido = arquivo_corrigido
+        self.correcoes = None  # resumo do que foi corrigido (só com arquivo_corrigido)
+        self._dialeto_csv = ('utf-8', ';')  # (encoding, separador) do CSV lido, repetido na planilha corrigida
+        self.anterior = anterior
+        self.gerar_impressao = gerar_impressao
+        self.impressao = None  # ImpressaoCatalogo desta versão (com gerar_impressao ou anterior)
+        self.diferencas = None  # produtos adicionados/removidos/alterados em relação à versão anterior
+        self.medidor = MedidorEtapas()  # tempo, linhas/s e pico de memória de cada etapa
+        self.metricas = None
         self.df = None
+        self.total_linhas = 0
+        self.arquivo_lido = False  # False se o arquivo não pôde ser aberto/lido
+        self.indice = IndiceErros()  # Linhas com problema por regra
         self.erros = []
         self.avisos = []
         self.logs = []  # Lista para armazenar os logs
         self.log_callback = log_callback  # Função de log
+        self.progresso_callback = progresso_callback  # Função de progresso (etapa, percentual)
+        
+        # Regras do perfil (regras/<perfil>.json), compiladas uma vez e reaproveitadas
+        self.plano = obter_plano(perfil)
         
         # Definição das colunas esperadas
-        self.colunas_esperadas = [
-            'pIndice', 'pCodigo', 'pFornecedor', 'pReferencia', 'pCodigoBarras', 'pDescricao',
-            'pDescricaoReduzida', 'pTamanho', 'pColecao', 'pLinha', 'pSegmento',
-            'pGrupo', 'pFamilia', 'pSubFamilia', 'pNCM', 'pOrigem CST', 'pUN',
-            'pMúltiplo', 'pM²/Pallet', 'pQUANTIDADE NA EMBALAGEM', 'pPeso',
-            'pCusto', 'pPercST', 'pPercIPI', 'pPreçoVenda',
-            'pExige Conferencia', 'pMarkup', 'pFrete', 'pCodigoSA',
-            'pDesconto', 'pEmpresa'
-        ]
+        self.colunas_esperadas = list(self.plano.colunas_esperadas)
         
         # Colunas obrigatórias
-        self.colunas_obrigatorias = self.colunas_esperadas
+        self.colunas_obrigatorias = list(self.plano.colunas_obrigatorias)
+        
+        # Valores padrão sugeridos para células vazias
+        self.campos_padrao = dict(self.plano.campos_padrao)
+        
+        # Campos que devem ser numéricos
+        self.campos_numericos = list(self.plano.campos_numericos)
+        
+        # Colunas com lista fechada de valores (ex.: pOrigem CST só aceita 0 ou 2)
+        self.dominios = dict(self.plano.dominios)
+        self.valores_cst = self.dominios.get('pOrigem CST', [])
+        
+        # Colunas de NCM (apenas numéricas, com correção automática)
+        self.colunas_ncm = list(self.plano.colunas_ncm)
+        
+        # Chaves que não podem se repetir e colunas de código de barras (GTIN/EAN)
+        self.unicos = dict(self.plano.unicos)
+        self.colunas_gtin = dict(self.plano.colunas_gtin)
+        self.duplicados = {}  # coluna -> [{'valor': ..., 'linhas': [...]}]
+        
+        # Tabela oficial de NCM (uma por processo; None se o arquivo não existir)
+        self.tabela_ncm = obter_tabela()
+        self.sugestoes_ncm = {}  # coluna -> {código inválido: [códigos válidos próximos]}
     
     def log(self, message):
         """Função para armazenar as mensagens de log"""
@@ -37,11 +501,36 @@ class ValidadorProdutos:
         if self.log_callback:
             self.log_callback(message)
 
+    def progresso(self, etapa, percentual):
+        """Informa o andamento da validação (percentual de 0 a 100)"""
+        if self.progresso_callback:
+            self.progresso_callback(etapa, int(percentual))
+
+    def _existe(self):
+        return self._em_memoria or os.path.exists(self._fonte)
+
+    def _origem(self):
+        """O que passar aos leitores (pandas, openpyxl): o caminho, ou o arquivo aberto desde o início"""
+        if self._em_memoria:
+            self._fonte.seek(0)
+        return self._fonte
+
+    def _abrir(self):
+        """Arquivo binário desde o início, para usar com with (o aberto pelo chamador não é fechado)"""
+        if self._em_memoria:
+            return nullcontext(self._origem())
+        return open(self._fonte, 'rb')
+
+    def _tamanho(self):
+        if self._em_memoria:
+            return self._fonte.seek(0, io.SEEK_END)
+        return os.path.getsize(self._fonte)
+
     def carregar_arquivo(self):
         """Carrega o arquivo (Excel ou CSV) com tratamento robusto"""
         try:
             self.log(f"📂 Tentando carregar arquivo {self.arquivo}...")
-            if not os.path.exists(self.arquivo):
+            if not self._existe():
                 self.log(f"❌ Arquivo não encontrado: {self.arquivo}")
                 return False
                 
@@ -51,68 +540,128 @@ class ValidadorProdutos:
             if ext in ['.xlsx', '.xls']:
                 try:
                     engine = 'openpyxl' if ext == '.xlsx' else 'xlrd'
-                    self.df = pd.read_excel(self.arquivo, engine=engine)
+                    self.df = tipar(pd.read_excel(self._origem(), engine=engine, dtype=object), self.plano)
                     self.log(f"✅ Arquivo Excel carregado com sucesso usando engine {engine}")
                 except Exception as e:
                     self.log(f"❌ Falha ao ler arquivo Excel: {e}")
                     return False
                     
             elif ext == '.csv':
-                encodings = ['utf-8', 'latin1', 'iso-8859-1', 'cp1252']
-                separadores = [';', ',', '\t']
-                
-                for encoding in encodings:
-                    for sep in separadores:
-                        try:
-                            self.df = pd.read_csv(self.arquivo, sep=sep, encoding=encoding)
-                            self.log(f"✅ CSV carregado com sucesso - Separador: '{sep}', Encoding: {encoding}")
-                            break
-                        except:
-                            continue
-                    if self.df is not None:
-                        break
+                encoding, sep = self._detectar_dialeto_csv()
+                self.log(f"🔎 Dialeto detectado - Separador: '{sep}', Encoding: {encoding}")
                 
-                if self.df is None:
-                    self.log("❌ Falha ao ler arquivo CSV - Tentou todos os encodings e separadores")
+                try:
+                    self.df = ler_csv(self._origem(), sep, encoding, self.plano)
+                except UnicodeDecodeError:
+                    # A amostra era UTF-8 válido mas o restante do arquivo não
+                    encoding = 'cp1252'
+                    self.log(f"⚠️  Arquivo não é UTF-8 após a amostra - relendo com {encoding}")
+                    try:
+                        self.df = ler_csv(self._origem(), sep, encoding, self.plano)
+                    except Exception as e:
+                        self.log(f"❌ Falha ao ler arquivo CSV: {e}")
+                        return False
+                except Exception as e:
+                    self.log(f"❌ Falha ao ler arquivo CSV: {e}")
                     return False
+                
+                self._dialeto_csv = (encoding, sep)
+                self.log(f"✅ CSV carregado com sucesso - Separador: '{sep}', Encoding: {encoding}")
             else:
                 self.log(f"❌ Formato de arquivo não suportado: {ext}")
                 return False
 
             # NOVO: Renomear colunas "Unnamed" para "pIndice"
-            if self.df is not None:
-                colunas_renomeadas = []
-                for i, coluna in enumerate(self.df.columns):
-                    if 'Unnamed' in str(coluna):
-                        novo_nome = 'pIndice'
-                        self.df.rename(columns={coluna: novo_nome}, inplace=True)
-                        colunas_renomeadas.append(f"'{coluna}' -> '{novo_nome}'")
-                
-                if colunas_renomeadas:
-                    if len(colunas_renomeadas) == 1:
-                        self.log(f"🔄 Coluna renomeada: {colunas_renomeadas[0]}")
-                    else:
-                        self.log(f"🔄 {len(colunas_renomeadas)} colunas Unnamed renomeadas para pIndice")
+            self._renomear_colunas_unnamed(self.df)
 
-            self.log(f"📊 Total de linhas: {len(self.df)}")
+            self.total_linhas = self.indice.total_linhas = len(self.df)
+            self.log(f"📊 Total de linhas: {self.total_linhas}")
             self.log(f"📋 Colunas encontradas: {list(self.df.columns)}")
+            self.arquivo_lido = True
             return True
             
         except Exception as e:
             self.log(f"❌ Erro ao carregar arquivo: {e}")
             return False
 
-    def verificar_estrutura_colunas(self):
-        """Verifica a estrutura das colunas"""
+    def _renomear_colunas_unnamed(self, df):
+        """Renomeia colunas sem cabeçalho ("Unnamed") para pIndice"""
+        colunas_renomeadas = []
+        for coluna in df.columns:
+            if 'Unnamed' in str(coluna):
+                novo_nome = 'pIndice'
+                df.rename(columns={coluna: novo_nome}, inplace=True)
+                colunas_renomeadas.append(f"'{coluna}' -> '{novo_nome}'")
+        
+        if colunas_renomeadas:
+            if len(colunas_renomeadas) == 1:
+                self.log(f"🔄 Coluna renomeada: {colunas_renomeadas[0]}")
+            else:
+                self.log(f"🔄 {len(colunas_renomeadas)} colunas Unnamed renomeadas para pIndice")
+
+    def _detectar_dialeto_csv(self):
+        """
+        Lê apenas o início do arquivo para descobrir encoding e separador.
+        Retorna (encoding, separador).
+        """
+        with self._abrir() as f:
+            amostra = f.read(TAMANHO_AMOSTRA_CSV)
+        
+        # BOM explícito tem prioridade
+        encoding = None
+        for bom, nome in BOMS:
+            if amostra.startswith(bom):
+                encoding = nome
+                break
+        
+        if encoding is None:
+            try:
+                # final=False: a amostra pode terminar no meio de um caractere multibyte
+                codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+                encoding = 'utf-8'
+            except UnicodeDecodeError:
+                # Planilhas exportadas pelo Excel no Windows (ex.: Castelli) vêm em cp1252;
+                # bytes indefinidos no cp1252 indicam latin1
+                try:
+                    amostra.decode('cp1252')
+                    encoding = 'cp1252'
+                except UnicodeDecodeError:
+                    encoding = 'latin1'
+        
+        texto = amostra.decode(encoding, errors='ignore')
+        if encoding.startswith('utf-8') and texto.startswith('\ufeff'):
+            texto = texto[1:]
+        
+        linhas = [linha for linha in texto.splitlines() if linha.strip()]
+        if len(amostra) == TAMANHO_AMOSTRA_CSV and len(linhas) > 1:
+            linhas = linhas[:-1]  # última linha provavelmente cortada
+        
+        try:
+            sep = csv.Sniffer().sniff('\n'.join(linhas[:50]), delimiters=''.join(SEPARADORES_CSV)).delimiter
+        except csv.Error:
+            # Sniffer não decidiu: usa o separador mais frequente no cabeçalho
+            cabecalho = linhas[0] if linhas else ''
+            sep = max(SEPARADORES_CSV, key=cabecalho.count)
+        
+        return encoding, sep
+
+    def verificar_estrutura_colunas(self, colunas=None):
+        """Verifica a estrutura das colunas (por padrão, as do DataFrame carregado)"""
         self.log("\n🔍 Verificando estrutura das colunas...")
+        if colunas is None:
+            colunas = self.df.columns
         
-        # Normaliza as colunas do arquivo e as colunas esperadas
-        colunas_arquivo = [self.remover_acentos_e_caracteres_especiais(coluna) for coluna in self.df.columns]
-        colunas_esperadas_normalizadas = [self.remover_acentos_e_caracteres_especiais(coluna) for coluna in self.colunas_esperadas]
+        # Casa as colunas do arquivo com as esperadas (nome normalizado ou aproximado)
+        resolvedor = self.plano.resolver(colunas)
+        colunas_faltando = resolvedor.faltando
+        colunas_extras = resolvedor.extras
         
-        # Comparando as colunas com acentos removidos e caracteres especiais
-        colunas_faltando = [coluna for coluna in self.colunas_esperadas if self.remover_acentos_e_caracteres_especiais(coluna) not in colunas_arquivo]
-        colunas_extras = [coluna for coluna in colunas_arquivo if coluna not in colunas_esperadas_normalizadas]
+        for real, esperada in resolvedor.renomeadas():
+            self.log(f"🔀 Coluna '{real}' lida como '{esperada}'")
+        for esperada, real, similaridade in resolvedor.aproximadas:
+            aviso = f"Coluna '{real}' tratada como '{esperada}' (nome aproximado, similaridade {similaridade:.0%})"
+            self.avisos.append(aviso)
+            self.log(f"⚠️  {aviso}")
         
         if colunas_faltando:
             for coluna in colunas_faltando:
@@ -131,181 +680,980 @@ class ValidadorProdutos:
         
         return len(colunas_faltando) == 0
     
-    def validar_colunas_obrigatorias(self):
-        """Valida as colunas obrigatórias (não podem estar vazias)"""
+    def _mascara_vazios(self, serie):
+        """Máscara booleana das células vazias (NaN ou texto em branco)"""
+        return _VisaoColuna(serie).vazios
+
+    def _novos_acumulados(self):
+        """Contadores e exemplos de cada regra, somados bloco a bloco"""
+        return {'vazios': {}, 'dominios': {}, 'ncm': {}, 'numericos': {}, 'unicos': {}, 'gtin': {},
+                'consistencia': {'mesmo_valor': {}, 'proporcoes': {}, 'precos_minimos': {}, 'atipicos': {}}}
+
+    def _validar_bloco(self, df, inicio, acumulados, progresso=None, alteradas=None, completas=(), visoes=None):
+        """
+        Executa o plano compilado sobre um bloco: cada coluna é convertida uma
+        única vez e passa por todas as suas regras em sequência.
+        progresso=(de, ate) informa o andamento coluna a coluna.
+        Na validação incremental, alteradas (máscara) restringe as regras às
+        linhas novas ou alteradas, menos as (coluna, operação) de completas,
+        que dependem do bloco todo; visoes traz as colunas do bloco todo já
+        convertidas pela comparação. As regras de consistência vêm depois,
+        sempre sobre o bloco todo (comparam linhas entre si).
+        """
+        visoes = dict(visoes or {})
+        resolvedor = self.plano.resolver(df.columns)
+        colunas = [(coluna, resolvedor.real(coluna)) for coluna in self.plano.operacoes if resolvedor.real(coluna) is not None]
+        alvos = {True: (df, inicio)}
+        if alteradas is not None:
+            alvos[False] = (df[alteradas].copy(), _na_planilha(inicio, np.flatnonzero(alteradas)))
+        for i, (coluna, real) in enumerate(colunas):
+            convertidas = {True: visoes.get(coluna)}  # visão do bloco todo / das linhas alteradas (False)
+            with self.medidor.etapa(f'validar_{coluna}', len(df)):
+                for operacao in self.plano.operacoes[coluna]:
+                    inteiro = alteradas is None or (coluna, operacao) in completas
+                    alvo, inicio_alvo = alvos[inteiro]
+                    if convertidas.get(inteiro) is None:
+                        convertidas[inteiro] = _VisaoColuna(alvo[real])
+                    getattr(self, f'_coletar_{operacao}')(alvo, convertidas[inteiro], coluna, inicio_alvo, acumulados)
+            if convertidas[True] is not None and coluna in self.plano.colunas_consistencia:
+                visoes[coluna] = convertidas[True]  # reaproveitada pela consistência
+            if progresso:
+                de, ate = progresso
+                self.progresso(f'validar_{coluna}', de + (ate - de) * (i + 1) / len(colunas))
+        if self.plano.tem_consistencia:
+            with self.medidor.etapa('validar_consistencia', len(df)):
+                self._coletar_consistencia(df, inicio, acumulados, visoes)
+
+    def _emitir(self, acumulados):
+        """Gera mensagens, erros e avisos a partir do que foi acumulado"""
+        self._emitir_colunas_obrigatorias(acumulados['vazios'])
+        self._emitir_valores_padrao(acumulados['vazios'])
+        for coluna in self.dominios:
+            if coluna in acumulados['dominios']:
+                self._emitir_dominio(coluna, acumulados['dominios'][coluna])
+        for coluna in self.colunas_ncm:
+            self._emitir_pNCM(coluna, acumulados['ncm'].get(coluna))
+        self._emitir_valores_numericos(acumulados['numericos'])
+        self._emitir_unicos(acumulados['unicos'])
+        for coluna in self.colunas_gtin:
+            if coluna in acumulados['gtin']:
+                self._emitir_gtin(coluna, acumulados['gtin'][coluna])
+        self._emitir_consistencia(acumulados['consistencia'])
+
+    def _coletar_vazio(self, df, visao, coluna, inicio, acumulados):
+        """Acumula as linhas vazias da coluna (até 10 exemplos)"""
+        vazios = visao.vazios
+        if coluna in self.colunas_obrigatorias:
+            self.indice.registrar('celula_vazia', coluna, SEVERIDADE_ERRO, inicio, vazios)
+        if coluna in self.campos_padrao:
+            self.indice.registrar('valor_padrao', coluna, SEVERIDADE_AVISO, inicio, vazios)
+        ocorrencias = acumulados['vazios'].setdefault(coluna, Ocorrencias(10))
+        ocorrencias.adicionar(np.flatnonzero(vazios), lambda pos: int(_na_planilha(inicio, pos)) + 2, inicio)
+
+    def _emitir_colunas_obrigatorias(self, vazios):
         self.log("\n📋 Validando colunas obrigatórias...")
         for coluna in self.colunas_obrigatorias:
-            if coluna not in self.df.columns:
+            if coluna not in vazios:
                 continue
-            linhas_vazias = []
-            for idx, valor in enumerate(self.df[coluna]):
-                if pd.isna(valor) or str(valor).strip() == '':
-                    linhas_vazias.append(idx + 2)
-            if linhas_vazias:
-                erro = f"❌ {coluna}: {len(linhas_vazias)} células vazias (linhas: {linhas_vazias[:10]}{'...' if len(linhas_vazias) > 10 else ''})"
+            ocorrencias = vazios[coluna]
+            if ocorrencias.total:
+                erro = f"❌ {coluna}: {ocorrencias.total} células vazias (linhas: {ocorrencias.exemplos}{'...' if ocorrencias.total > 10 else ''})"
                 self.erros.append(erro)
                 self.log(f"❌ {erro}")
             else:
                 self.log(f"✅ {coluna}: Todas as células preenchidas")
+
+    def _validar_colunas(self, colunas, operacao):
+        """Executa uma única operação do plano nas colunas indicadas de self.df"""
+        acumulados = self._novos_acumulados()
+        resolvedor = self.plano.resolver(self.df.columns)
+        for coluna in colunas:
+            real = resolvedor.real(coluna)
+            if real is not None:
+                getattr(self, f'_coletar_{operacao}')(self.df, _VisaoColuna(self.df[real]), coluna, 0, acumulados)
+        return acumulados
+
+    def validar_colunas_obrigatorias(self):
+        """Valida as colunas obrigatórias (não podem estar vazias)"""
+        acumulados = self._validar_colunas(self.colunas_obrigatorias, 'vazio')
+        self._emitir_colunas_obrigatorias(acumulados['vazios'])
     
-    def aplicar_valores_padrao(self):
-        """Verifica e aplica valores padrão para campos específicos"""
+    def _emitir_valores_padrao(self, vazios):
         self.log("\n🔧 Verificando campos que podem usar valores padrão...")
         
-        campos_padrao = {
-            'pCodigoBarras': 'SEM GTIN',
-            'pTamanho': -1,
-            'pColecao': -1,  # Observação: Já tratado no carregamento
-            'pLinha': -1,
-            'pSegmento': -1,
-            'pGrupo': -1,
-            'pFamilia': -1,
-            'pSubFamilia': -1,
-            'pNCM': '11111111',
-            'pUN': 'UN',
-            'pMúltiplo': 1,
-            'pM²/Pallet': 0,
-            'pQUANTIDADE NA EMBALAGEM': -1,
-            'pPeso': -1,
-            'pCusto': -1,
-            'pPercST': -1,
-            'pPercIPI': -1,
-            'pPreçoVenda': -1,
-            'pExige Conferencia': 'N',
-            'pMarkup': -1,
-            'pFrete': -1,
-            'pDesconto': -1,
-            'pEmpresa': '101'
-        }
-        
-        for coluna, valor_padrao in campos_padrao.items():
-            if coluna not in self.df.columns:
+        for coluna, valor_padrao in self.campos_padrao.items():
+            if coluna not in vazios:
                 continue
             
-            linhas_vazias = []
-            for idx, valor in enumerate(self.df[coluna]):
-                if pd.isna(valor) or str(valor).strip() == '':
-                    linhas_vazias.append(idx + 2)
+            total_vazias = vazios[coluna].total
             
-            if linhas_vazias:
-                sugestao = f"{coluna}: {len(linhas_vazias)} células vazias podem usar valor padrão '{valor_padrao}'"
+            if total_vazias:
+                sugestao = f"{coluna}: {total_vazias} células vazias podem usar valor padrão '{valor_padrao}'"
                 self.avisos.append(sugestao)
                 self.log(f"💡 {sugestao}")
         
         if not self.avisos:
             self.log("✅ Todos os campos com valores padrão estão preenchidos")
+
+    def aplicar_valores_padrao(self):
+        """Verifica e aplica valores padrão para campos específicos"""
+        acumulados = self._validar_colunas(self.campos_padrao, 'vazio')
+        self._emitir_valores_padrao(acumulados['vazios'])
     
-    def validar_pOrigem_CST(self):
-        """Valida a coluna pOrigem CST (deve ser 0 ou 2)"""
-        if 'pOrigem CST' not in self.df.columns:
-            return
-        
-        self.log("\n🌍 Validando pOrigem CST...")
-        valores_invalidos = []
+    def _coletar_dominio(self, df, visao, coluna, inicio, acumulados):
+        """Valores fora do domínio da coluna (ex.: pOrigem CST só aceita 0 ou 2)"""
+        serie = visao.serie
+        vazios = visao.na
+        invalidos = vazios | ~visao.textos_inteiros.isin(self.dominios[coluna]).to_numpy()
+        self.indice.registrar('dominio_invalido', coluna, SEVERIDADE_ERRO, inicio, invalidos, serie)
+        aceitos = ' ou '.join(self.dominios[coluna])
         
-        for idx, valor in enumerate(self.df['pOrigem CST']):
-            if pd.isna(valor):
-                valores_invalidos.append(f"Linha {idx + 2}: valor vazio")
-            elif str(valor).strip() not in ['0', '2']:
-                valores_invalidos.append(f"Linha {idx + 2}: '{valor}' (deve ser 0 ou 2)")
+        # Só as primeiras mensagens são exibidas; não monta as demais
+        def descrever(pos):
+            linha = _na_planilha(inicio, pos) + 2
+            if vazios[pos]:
+                return f"Linha {linha}: valor vazio"
+            return f"Linha {linha}: '{serie.iat[pos]}' (deve ser {aceitos})"
         
-        if valores_invalidos:
-            erro = f"pOrigem CST com valores incorretos: {len(valores_invalidos)} casos"
+        ocorrencias = acumulados['dominios'].setdefault(coluna, Ocorrencias(5))
+        ocorrencias.adicionar(np.flatnonzero(invalidos), descrever, inicio)
+
+    def _emitir_dominio(self, coluna, ocorrencias):
+        aceitos = ' ou '.join(self.dominios[coluna])
+        self.log(f"\n🌍 Validando {coluna}...")
+        if ocorrencias.total:
+            erro = f"{coluna} com valores incorretos: {ocorrencias.total} casos"
             self.erros.append(erro)
             self.log(f"❌ {erro}")
-            for linha in valores_invalidos[:5]:
+            for linha in ocorrencias.exemplos:
                 self.log(f"   {linha}")
-            if len(valores_invalidos) > 5:
-                self.log(f"   ... e mais {len(valores_invalidos) - 5} casos")
+            if ocorrencias.total > 5:
+                self.log(f"   ... e mais {ocorrencias.total - 5} casos")
         else:
-            self.log("✅ pOrigem CST: Todos os valores estão corretos (0 ou 2)")
+            self.log(f"✅ {coluna}: Todos os valores estão corretos ({aceitos})")
+
+    def validar_dominios(self):
+        """Valida as colunas com lista fechada de valores aceitos"""
+        acumulados = self._validar_colunas(self.dominios, 'dominio')
+        for coluna in self.dominios:
+            if coluna in acumulados['dominios']:
+                self._emitir_dominio(coluna, acumulados['dominios'][coluna])
+
+    def validar_pOrigem_CST(self):
+        """Valida a coluna pOrigem CST (deve ser 0 ou 2)"""
+        if self.plano.resolver(self.df.columns).real('pOrigem CST') is None or 'pOrigem CST' not in self.dominios:
+            return
+        
+        acumulados = self._validar_colunas(['pOrigem CST'], 'dominio')
+        self._emitir_dominio('pOrigem CST', acumulados['dominios']['pOrigem CST'])
     
+    def _para_float(self, textos):
+        """
+        Converte textos (já com ',' trocada por '.') para float em lote.
+        Retorna (valores, convertidos) - convertidos indica onde float() aceitou o texto.
+        """
+        valores = pd.to_numeric(textos, errors='coerce')
+        convertidos = valores.notna().to_numpy()
+        # to_numeric é mais restrito que float() ('nan', '1_000'...): confirma só as falhas
+        for pos in np.flatnonzero(~convertidos):
+            try:
+                valores.iat[pos] = float(textos.iat[pos])
+                convertidos[pos] = True
+            except (ValueError, TypeError):
+                pass
+        return valores, convertidos
+
+    def _numeros(self, serie):
+        """Coluna como float64 (NaN onde não há número); cada texto distinto é convertido uma vez só"""
+        if pd.api.types.is_numeric_dtype(serie):
+            return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        codigos, unicos = pd.factorize(serie)
+        textos = pd.Series(unicos, dtype=object).astype(str).str.strip().str.replace(',', '.', regex=False)
+        valores = np.append(self._para_float(textos)[0].to_numpy(dtype=np.float64), np.nan)
+        return valores[codigos]  # código -1 (vazio) pega o último, np.nan
+
+    def _coletar_numerico(self, df, visao, coluna, inicio, acumulados):
+        """Células preenchidas que não são numéricas"""
+        invalidos = np.zeros(len(visao.na), dtype=bool)
+        if visao.codificada or visao.serie.dtype == object:
+            # Cada texto distinto é convertido uma vez só; vazio (código -1) não conta
+            codigos, distintos = visao.distintos()
+            _, convertidos = self._para_float(pd.Series(distintos, dtype=object).str.replace(',', '.', regex=False))
+            invalidos = ~np.append(convertidos, True)[codigos]
+        self.indice.registrar('nao_numerico', coluna, SEVERIDADE_ERRO, inicio, invalidos, visao.serie)
+        contagem = acumulados['numericos']
+        contagem[coluna] = contagem.get(coluna, 0) + int(invalidos.sum())
+
+    def _emitir_valores_numericos(self, contagem):
+        for coluna in self.campos_numericos:
+            total_invalidos = contagem.get(coluna, 0)
+            if total_invalidos:
+                erro = f"{coluna}: {total_invalidos} valores não numéricos"
+                self.erros.append(erro)
+
     def validar_valores_numericos(self):
         """Valida campos que devem ser numéricos"""
-        campos_numericos = [
-            'pTamanho', 'pSegmento', 'pFamilia', 'pSubFamilia', 'pMúltiplo', 
-            'pM²/Pallet', 'pQUANTIDADE NA EMBALAGEM', 'pPercST', 'pPercIPI', 
-            'pPreçoVenda', 'pMarkup', 'pFrete', 'pCodigoSA', 'pDesconto'
-            # Removido 'pNCM' - tem validação específica própria
-        ]
-        for coluna in campos_numericos:
-            if coluna not in self.df.columns:
+        acumulados = self._validar_colunas(self.campos_numericos, 'numerico')
+        self._emitir_valores_numericos(acumulados['numericos'])
+
+    def _coletar_unico(self, df, visao, coluna, inicio, acumulados):
+        """Guarda as chaves preenchidas do bloco; as repetições são agrupadas no fim (_emitir_unicos)"""
+        textos = visao.textos_inteiros
+        considerar = ~visao.vazios & ~textos.isin(self.unicos[coluna]).to_numpy()
+        acumulado = acumulados['unicos'].setdefault(coluna, {'chaves': [], 'posicoes': []})
+        acumulado['chaves'].append(textos[considerar].to_numpy(dtype=object))
+        acumulado['posicoes'].append(_na_planilha(inicio, np.flatnonzero(considerar)))
+
+    def _emitir_unicos(self, unicos):
+        if not unicos:
+            return
+        self.log("\n🔑 Verificando chaves duplicadas...")
+        for coluna in self.unicos:
+            if coluna not in unicos:
                 continue
-            valores_invalidos = []
-            for idx, valor in enumerate(self.df[coluna]):
-                if pd.isna(valor):
+            chaves = pd.Series(np.concatenate(unicos[coluna]['chaves']), dtype=object)
+            posicoes = np.concatenate(unicos[coluna]['posicoes'])
+            
+            # duplicated() usa a tabela hash do pandas: tempo linear no número de linhas
+            repetidas = chaves.duplicated(keep=False).to_numpy()
+            self.indice.registrar_posicoes('chave_duplicada', coluna, SEVERIDADE_ERRO,
+                                           posicoes[repetidas], chaves[repetidas].to_numpy())
+            grupos = pd.Series(posicoes[repetidas] + 2).groupby(chaves[repetidas].to_numpy(), sort=False).agg(list)
+            self.duplicados[coluna] = [{'valor': valor, 'linhas': linhas} for valor, linhas in grupos.items()]
+            
+            if len(grupos):
+                erro = f"{coluna}: {len(grupos)} valores repetidos em {int(repetidas.sum())} linhas"
+                self.erros.append(erro)
+                self.log(f"❌ {erro}")
+                for valor, linhas in list(grupos.items())[:5]:
+                    self.log(f"   • '{valor}' nas linhas {linhas[:10]}{'...' if len(linhas) > 10 else ''}")
+                if len(grupos) > 5:
+                    self.log(f"   • ... e mais {len(grupos) - 5} valores repetidos")
+            else:
+                self.log(f"✅ {coluna}: Nenhum valor repetido")
+
+    def validar_unicidade(self):
+        """Valida as colunas que não podem ter valores repetidos (pCodigo, pReferencia...)"""
+        acumulados = self._validar_colunas(self.unicos, 'unico')
+        self._emitir_unicos(acumulados['unicos'])
+
+    def _coletar_gtin(self, df, visao, coluna, inicio, acumulados):
+        """Códigos de barras fora do formato GTIN ou com dígito verificador errado"""
+        textos = visao.textos_inteiros
+        conferir = ~visao.vazios & ~textos.isin(self.colunas_gtin[coluna]).to_numpy()
+        formato_ok = conferir & textos.str.fullmatch(FORMATO_GTIN).fillna(False).to_numpy(dtype=bool)
+        digito_ok = np.zeros(len(textos), dtype=bool)
+        digito_ok[formato_ok] = gtin_digito_valido(textos[formato_ok].to_numpy(dtype=str))
+        formato_invalido = conferir & ~formato_ok
+        invalidos = formato_invalido | (formato_ok & ~digito_ok)
+        self.indice.registrar('gtin_invalido', coluna, SEVERIDADE_ERRO, inicio, invalidos, textos)
+        
+        def descrever(pos):
+            motivo = "deve ter 8, 12, 13 ou 14 dígitos" if formato_invalido[pos] else "dígito verificador incorreto"
+            return f"Linha {_na_planilha(inicio, pos) + 2}: '{textos.iat[pos]}' ({motivo})"
+        
+        ocorrencias = acumulados['gtin'].setdefault(coluna, Ocorrencias(5))
+        ocorrencias.adicionar(np.flatnonzero(invalidos), descrever, inicio)
+
+    def _emitir_gtin(self, coluna, ocorrencias):
+        self.log(f"\n🏷️  Validando GTIN/EAN de {coluna}...")
+        if ocorrencias.total:
+            erro = f"{coluna}: {ocorrencias.total} códigos de barras com GTIN inválido"
+            self.erros.append(erro)
+            self.log(f"❌ {erro}")
+            for linha in ocorrencias.exemplos:
+                self.log(f"   • {linha}")
+            if ocorrencias.total > 5:
+                self.log(f"   • ... e mais {ocorrencias.total - 5} códigos")
+        else:
+            self.log(f"✅ {coluna}: Todos os códigos de barras são GTIN válidos")
+
+    def validar_gtin(self):
+        """Valida o dígito verificador dos códigos de barras (GTIN-8/12/13/14)"""
+        acumulados = self._validar_colunas(self.colunas_gtin, 'gtin')
+        for coluna in self.colunas_gtin:
+            if coluna in acumulados['gtin']:
+                self._emitir_gtin(coluna, acumulados['gtin'][coluna])
+
+    def _coletar_consistencia(self, df, inicio, acumulados, visoes=None):
+        """
+        Regras de "consistencia" do perfil. As de uma linha só (proporções,
+        preço mínimo) são conferidas no bloco; as que comparam linhas (mesmo
+        valor por chave, valores atípicos) guardam valores e chaves, agrupados
+        no fim (_emitir_consistencia). Zero, negativos e vazios (os -1 de
+        preenchimento) contam como não informados e não são conferidos.
+        visoes: colunas do bloco já convertidas pelas outras regras.
+        """
+        visoes = visoes or {}
+        resolvedor = self.plano.resolver(df.columns)
+        consistencia = acumulados['consistencia']
+        numeros = {}
+        
+        def informados(coluna):
+            """Valores > 0 da coluna (NaN nos demais); None se a coluna não está no arquivo"""
+            if coluna not in numeros:
+                real = resolvedor.real(coluna)
+                if real is None:
+                    numeros[coluna] = None
+                else:
+                    valores = self._numeros(df[real])
+                    numeros[coluna] = np.where(np.isfinite(valores) & (valores > 0), valores, np.nan)
+            return numeros[coluna]
+        
+        def visao(coluna):
+            if coluna not in visoes:
+                visoes[coluna] = _VisaoColuna(df[resolvedor.real(coluna)])
+            return visoes[coluna]
+        
+        linhas = _na_planilha(inicio, np.arange(len(df))) + 2
+        
+        for coluna, regra in self.plano.proporcoes.items():
+            resultado = informados(coluna)
+            fatores = [informados(fator) for fator in regra['fatores']]
+            if resultado is None or any(fator is None for fator in fatores):
+                continue
+            produto = np.prod(fatores, axis=0)
+            # Múltiplo inteiro: compara com o múltiplo mais próximo (no mínimo 1x o produto)
+            vezes = np.maximum(np.rint(resultado / produto), 1) if regra['multiplo_inteiro'] else 1
+            esperado = produto * vezes
+            invalidos = (~np.isnan(resultado) & ~np.isnan(produto)
+                         & ~np.isclose(resultado, esperado, rtol=TOLERANCIA_PROPORCAO, atol=0))
+            self.indice.registrar('proporcao_invalida', coluna, SEVERIDADE_ERRO, inicio, invalidos,
+                                  df[resolvedor.real(coluna)])
+            formula = ' × '.join(regra['fatores'])
+            
+            def descrever(pos, resultado=resultado, produto=produto, formula=formula, regra=regra):
+                if regra['multiplo_inteiro']:
+                    return f"Linha {linhas[pos]}: {resultado[pos]:g} não é múltiplo de {formula} = {produto[pos]:g}"
+                return f"Linha {linhas[pos]}: {resultado[pos]:g} (esperado {formula} = {produto[pos]:g})"
+            
+            consistencia['proporcoes'].setdefault(coluna, Ocorrencias(5)).adicionar(
+                np.flatnonzero(invalidos), descrever, inicio)
+        
+        for coluna, regra in self.plano.precos_minimos.items():
+            preco, custo = informados(coluna), informados(regra['custo'])
+            if preco is None or custo is None:
+                continue
+            markup = informados(regra['markup']) if regra['markup'] else None
+            markup = np.zeros(len(df)) if markup is None else np.nan_to_num(markup)  # sem markup: o custo
+            if regra['markup_percentual']:
+                markup = markup / 100
+            minimo = custo * (1 + markup)
+            # Meio centavo de folga: o preço chega arredondado em 2 casas
+            abaixo = ~np.isnan(preco) & ~np.isnan(custo) & (preco < minimo - 0.005)
+            self.indice.registrar('preco_abaixo_minimo', coluna, SEVERIDADE_ERRO, inicio, abaixo,
+                                  df[resolvedor.real(coluna)])
+            
+            def descrever(pos, preco=preco, custo=custo, markup=markup, minimo=minimo, regra=regra):
+                detalhe = f"{regra['custo']} {custo[pos]:g}"
+                if markup[pos]:
+                    detalhe += f" + {markup[pos] * 100:g}% de markup"
+                return f"Linha {linhas[pos]}: {preco[pos]:g} abaixo do mínimo {minimo[pos]:.2f} ({detalhe})"
+            
+            consistencia['precos_minimos'].setdefault(coluna, Ocorrencias(5)).adicionar(
+                np.flatnonzero(abaixo), descrever, inicio)
+        
+        for chave, colunas in self.plano.mesmo_valor.items():
+            if resolvedor.real(chave) is None:
+                continue
+            textos = visao(chave).textos_inteiros
+            considerar = ~visao(chave).vazios & ~textos.isin(self.unicos.get(chave, [])).to_numpy()
+            for coluna in colunas:
+                valores = informados(coluna)
+                if valores is None:
                     continue
-                try:
-                    valor_str = str(valor).replace(',', '.')
-                    float(valor_str)
-                except (ValueError, TypeError):
-                    valores_invalidos.append(f"Linha {idx + 2}: '{valor}' (não é numérico)")
-            if valores_invalidos:
-                erro = f"{coluna}: {len(valores_invalidos)} valores não numéricos"
+                usar = considerar & ~np.isnan(valores)
+                acumulado = consistencia['mesmo_valor'].setdefault(
+                    (chave, coluna), {'chaves': [], 'valores': [], 'posicoes': []})
+                acumulado['chaves'].append(textos.to_numpy(dtype=object)[usar])
+                acumulado['valores'].append(valores[usar])
+                acumulado['posicoes'].append(_na_planilha(inicio, np.flatnonzero(usar)))
+        
+        for coluna, grupos in self.plano.atipicos.items():
+            valores = informados(coluna)
+            if valores is None or any(resolvedor.real(grupo) is None for grupo in grupos):
+                continue
+            usar = ~np.isnan(valores)
+            acumulado = consistencia['atipicos'].setdefault(
+                coluna, {'grupos': [[] for _ in grupos], 'valores': [], 'posicoes': []})
+            for partes, grupo in zip(acumulado['grupos'], grupos):
+                partes.append(visao(grupo).textos_inteiros.to_numpy(dtype=object)[usar])
+            acumulado['valores'].append(valores[usar])
+            acumulado['posicoes'].append(_na_planilha(inicio, np.flatnonzero(usar)))
+
+    def _emitir_consistencia(self, consistencia):
+        if not any(consistencia.values()):
+            return
+        self.log("\n🔗 Verificando consistência entre colunas e entre linhas...")
+        
+        for coluna, regra in self.plano.proporcoes.items():
+            if coluna not in consistencia['proporcoes']:
+                continue
+            ocorrencias = consistencia['proporcoes'][coluna]
+            formula = ' × '.join(regra['fatores'])
+            if ocorrencias.total:
+                relacao = f"múltiplo de {formula}" if regra['multiplo_inteiro'] else f"igual a {formula}"
+                erro = f"{coluna}: {ocorrencias.total} linhas em que o valor não é {relacao}"
+                self.erros.append(erro)
+                self.log(f"❌ {erro}")
+                for exemplo in ocorrencias.exemplos:
+                    self.log(f"   • {exemplo}")
+            else:
+                self.log(f"✅ {coluna}: Proporção com {formula} correta")
+        
+        for coluna, regra in self.plano.precos_minimos.items():
+            if coluna not in consistencia['precos_minimos']:
+                continue
+            ocorrencias = consistencia['precos_minimos'][coluna]
+            if ocorrencias.total:
+                erro = f"{coluna}: {ocorrencias.total} preços abaixo de {regra['custo']} + markup"
+                self.erros.append(erro)
+                self.log(f"❌ {erro}")
+                for exemplo in ocorrencias.exemplos:
+                    self.log(f"   • {exemplo}")
+            else:
+                self.log(f"✅ {coluna}: Nenhum preço abaixo de {regra['custo']} + markup")
+        
+        for (chave, coluna), acumulado in consistencia['mesmo_valor'].items():
+            chaves = np.concatenate(acumulado['chaves'])
+            valores = np.concatenate(acumulado['valores'])
+            posicoes = np.concatenate(acumulado['posicoes'])
+            # Agrupa pelo código da chave (tabela hash): tempo linear no número de linhas
+            por_chave = pd.Series(valores).groupby(pd.factorize(chaves)[0])
+            divergentes = (por_chave.transform('min') != por_chave.transform('max')).to_numpy()
+            self.indice.registrar_posicoes('valor_divergente', coluna, SEVERIDADE_ERRO,
+                                           posicoes[divergentes], valores[divergentes])
+            grupos = pd.DataFrame({'linha': posicoes[divergentes] + 2, 'valor': valores[divergentes]}).groupby(
+                chaves[divergentes], sort=False).agg(list)
+            if len(grupos):
+                erro = f"{coluna}: {len(grupos)} valores de {chave} com {coluna} diferente em {int(divergentes.sum())} linhas"
                 self.erros.append(erro)
+                self.log(f"❌ {erro}")
+                for valor, grupo in list(grupos.iterrows())[:5]:
+                    distintos = ', '.join(f"{v:g}" for v in dict.fromkeys(grupo['valor']))
+                    linhas = grupo['linha']
+                    self.log(f"   • {chave} '{valor}': {distintos} nas linhas {linhas[:10]}{'...' if len(linhas) > 10 else ''}")
+                if len(grupos) > 5:
+                    self.log(f"   • ... e mais {len(grupos) - 5} valores de {chave}")
+            else:
+                self.log(f"✅ {coluna}: Mesmo valor em todas as linhas de cada {chave}")
+        
+        for coluna, grupos in self.plano.atipicos.items():
+            acumulado = consistencia['atipicos'].get(coluna)
+            if acumulado is None:
+                continue
+            valores = np.concatenate(acumulado['valores'])
+            posicoes = np.concatenate(acumulado['posicoes'])
+            textos = [np.concatenate(partes) for partes in acumulado['grupos']]
+            # Código do grupo combinando os códigos de cada coluna (refatorado para não estourar)
+            codigos = np.zeros(len(valores), dtype=np.int64)
+            for grupo in textos:
+                codigos_coluna, distintos = pd.factorize(grupo)
+                codigos = pd.factorize(codigos * len(distintos) + codigos_coluna)[0]
+            # Mediana por grupo é seleção (não ordenação): tempo linear, duas vezes
+            por_grupo = pd.Series(valores).groupby(codigos)
+            mediana = por_grupo.transform('median').to_numpy()
+            desvio = np.abs(valores - mediana)
+            mad = pd.Series(desvio).groupby(codigos).transform('median').to_numpy()
+            tamanho = por_grupo.transform('size').to_numpy()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = 0.6745 * desvio / mad  # z-score robusto (Iglewicz e Hoaglin)
+            atipicos = (tamanho >= MINIMO_GRUPO_ATIPICOS) & (mad > 0) & (z > LIMITE_Z_ROBUSTO)
+            self.indice.registrar_posicoes('valor_atipico', coluna, SEVERIDADE_AVISO,
+                                           posicoes[atipicos], valores[atipicos])
+            
+            def descrever(pos):
+                grupo = ' / '.join(str(texto[pos]) for texto in textos)
+                return (f"Linha {posicoes[pos] + 2}: {valores[pos]:g} (mediana de '{grupo}': {mediana[pos]:g},"
+                        f" z = {z[pos]:.1f})")
+            
+            ocorrencias = Ocorrencias(5)
+            ocorrencias.adicionar(np.flatnonzero(atipicos), descrever, posicoes)
+            if ocorrencias.total:
+                aviso = f"{coluna}: {ocorrencias.total} valores atípicos para o grupo ({', '.join(grupos)})"
+                self.avisos.append(aviso)
+                self.log(f"⚠️  {aviso}")
+                for exemplo in ocorrencias.exemplos:
+                    self.log(f"   • {exemplo}")
+            else:
+                self.log(f"✅ {coluna}: Nenhum valor atípico por {', '.join(grupos)}")
+
+    def validar_consistencia(self):
+        """Valida as regras entre colunas e entre linhas (mesmo preço por referência, proporções, preço mínimo...)"""
+        if not self.plano.tem_consistencia:
+            return
+        acumulados = self._novos_acumulados()
+        self._coletar_consistencia(self.df, 0, acumulados)
+        self._emitir_consistencia(acumulados['consistencia'])
 
     def remover_acentos_e_caracteres_especiais(self, texto):
         """Função para remover acentos e caracteres especiais de um texto"""
-        nfkd = unicodedata.normalize('NFKD', texto)
-        texto_sem_acentos = ''.join([c for c in nfkd if not unicodedata.combining(c)])
-        texto_limpo = re.sub(r'[^a-zA-Z0-9]', '', texto_sem_acentos)
-        return texto_limpo.lower()  # Faz tudo minúsculo para comparação
+        return normalizar_nome_coluna(texto)  # Tudo minúsculo para comparação
 
-    def validar_pNCM(self):
-        """Validação específica para coluna pNCM - deve ser apenas numérica"""
-        if 'pNCM' not in self.df.columns:
-            self.avisos.append("⚠️ Coluna pNCM não encontrada")
+    def _coletar_ncm(self, df, visao, coluna, inicio, acumulados):
+        """Valida e corrige uma coluna de NCM do bloco (altera o próprio df)"""
+        serie = visao.serie
+        real = serie.name  # nome da coluna no arquivo (pode diferir do esperado)
+        preenchidos = ~visao.na
+        textos = visao.textos
+        
+        # Códigos só com dígitos (ignorando . e ,) já estão corretos
+        so_digitos = textos.str.replace('.', '', regex=False).str.replace(',', '', regex=False).str.isdigit().to_numpy()
+        candidatos = preenchidos & ~so_digitos
+        
+        # Verificar se contém texto (como "BATATAS")
+        com_texto = candidatos & textos.str.contains(r'[^\W\d_]', regex=True).to_numpy()
+        restantes = candidatos & ~com_texto
+        
+        # Tentar converter números com vírgula/ponto
+        numeros = pd.Series(np.nan, index=serie.index)
+        numeros[restantes], _ = self._para_float(textos[restantes].str.replace(',', '.', regex=False))
+        formato_invalido = restantes & ~np.isfinite(numeros.to_numpy())
+        inteiros = restantes & ~formato_invalido & (numeros == np.floor(numeros)).to_numpy()
+        
+        invalidos = com_texto | formato_invalido
+        self.indice.registrar('ncm_invalido', coluna, SEVERIDADE_ERRO, inicio, invalidos, textos)
+        self.indice.registrar('ncm_corrigido', coluna, SEVERIDADE_AVISO, inicio, inteiros, textos)
+        
+        def descrever(pos):
+            motivo = "contém texto - deve ser apenas numérico" if com_texto[pos] else "formato inválido"
+            return f"Linha {_na_planilha(inicio, pos) + 2}: '{textos.iat[pos]}' ({motivo})"
+        
+        acumulado = self._acumulado_ncm(acumulados, coluna)
+        acumulado['invalidos'].adicionar(np.flatnonzero(invalidos), descrever, inicio)
+        acumulado['corrigidos'] += int(invalidos.sum() + inteiros.sum())
+        
+        # Códigos numéricos: 8 dígitos e existência na tabela oficial
+        codigos = visao.textos_inteiros.str.replace('.', '', regex=False).str.replace(',', '', regex=False)
+        conferir = preenchidos & ~invalidos & codigos.str.isdigit().to_numpy()
+        tamanho_errado = conferir & (codigos.str.len() != TAMANHO_NCM).to_numpy()
+        inexistentes = np.zeros(len(serie), dtype=bool)
+        if self.tabela_ncm is not None:
+            completos = conferir & ~tamanho_errado
+            inexistentes[completos] = ~self.tabela_ncm.existem(codigos[completos])
+        self.indice.registrar('ncm_tamanho_invalido', coluna, SEVERIDADE_ERRO, inicio, tamanho_errado, codigos)
+        self.indice.registrar('ncm_inexistente', coluna, SEVERIDADE_ERRO, inicio, inexistentes, codigos)
+        
+        sugestoes = acumulado['sugestoes']
+        self._sugerir_ncm(sugestoes, codigos[tamanho_errado | inexistentes])
+        
+        def descrever_codigo(motivo):
+            def descrever(pos):
+                codigo = codigos.iat[pos]
+                sugestao = sugestoes.get(codigo)
+                detalhe = f"; sugestões: {', '.join(sugestao)}" if sugestao else ""
+                return f"Linha {_na_planilha(inicio, pos) + 2}: '{textos.iat[pos]}' ({motivo(codigo)}{detalhe})"
+            return descrever
+        
+        acumulado['tamanho'].adicionar(np.flatnonzero(tamanho_errado),
+                                       descrever_codigo(lambda codigo: f"NCM deve ter {TAMANHO_NCM} dígitos, tem {len(codigo)}"), inicio)
+        acumulado['inexistentes'].adicionar(np.flatnonzero(inexistentes),
+                                            descrever_codigo(lambda codigo: "não existe na tabela NCM"), inicio)
+        
+        # Aplica as correções de uma vez só na coluna
+        if (inteiros.any() or invalidos.any()) and df[real].dtype != object:
+            df[real] = serie.astype(object)
+        if inteiros.any():
+            df.loc[inteiros, real] = [int(n) for n in numeros[inteiros]]
+        if invalidos.any():
+            df.loc[invalidos, real] = ''
+
+    def _acumulado_ncm(self, acumulados, coluna):
+        return acumulados['ncm'].setdefault(coluna, {'invalidos': Ocorrencias(5), 'corrigidos': 0,
+                                                     'tamanho': Ocorrencias(5), 'inexistentes': Ocorrencias(5),
+                                                     'sugestoes': {}})
+
+    def _sugerir_ncm(self, sugestoes, codigos):
+        """Sugestões da tabela NCM para os códigos ainda sem sugestão (até MAX_SUGESTOES_NCM por coluna)"""
+        if self.tabela_ncm is None:
+            return
+        for codigo in pd.unique(codigos):
+            if len(sugestoes) >= MAX_SUGESTOES_NCM:
+                break
+            if codigo not in sugestoes:
+                sugestoes[codigo] = self.tabela_ncm.sugerir(codigo)
+
+    def _emitir_pNCM(self, coluna, acumulado):
+        if acumulado is None:
+            self.avisos.append(f"⚠️ Coluna {coluna} não encontrada")
             return
         
-        self.log("🔍 Validando coluna pNCM...")
-        valores_invalidos = []
-        valores_corrigidos = 0
+        self.log(f"🔍 Validando coluna {coluna}...")
+        invalidos = acumulado['invalidos']
+        valores_corrigidos = acumulado['corrigidos']
         
-        for idx, valor in enumerate(self.df['pNCM']):
-            if pd.isna(valor):
-                continue
-                
-            valor_original = str(valor).strip()
-            
-            # Verificar se contém texto (como "BATATAS")
-            if not valor_original.replace('.', '').replace(',', '').isdigit():
-                # Se contém letras ou caracteres especiais
-                if any(c.isalpha() for c in valor_original):
-                    valores_invalidos.append(f"Linha {idx + 2}: '{valor_original}' (contém texto - deve ser apenas numérico)")
-                    # Opcional: substituir por valor padrão ou deixar vazio
-                    self.df.at[idx, 'pNCM'] = ''  # ou pd.NA
-                    valores_corrigidos += 1
-                else:
-                    # Tentar converter números com vírgula/ponto
-                    try:
-                        valor_numerico = float(valor_original.replace(',', '.'))
-                        # Converter para inteiro se for NCM (geralmente são códigos inteiros)
-                        if valor_numerico == int(valor_numerico):
-                            self.df.at[idx, 'pNCM'] = int(valor_numerico)
-                            valores_corrigidos += 1
-                    except (ValueError, TypeError):
-                        valores_invalidos.append(f"Linha {idx + 2}: '{valor_original}' (formato inválido)")
-                        self.df.at[idx, 'pNCM'] = ''
-                        valores_corrigidos += 1
-        
-        if valores_invalidos:
-            erro = f"pNCM: {len(valores_invalidos)} valores com texto/formato inválido encontrados"
+        if invalidos.total:
+            erro = f"{coluna}: {invalidos.total} valores com texto/formato inválido encontrados"
             self.erros.append(erro)
             self.log(f"❌ {erro}")
             
             # Log detalhado dos primeiros 5 erros
-            for i, erro_detalhe in enumerate(valores_invalidos[:5]):
+            for erro_detalhe in invalidos.exemplos:
                 self.log(f"   • {erro_detalhe}")
             
-            if len(valores_invalidos) > 5:
-                self.log(f"   • ... e mais {len(valores_invalidos) - 5} erros")
+            if invalidos.total > 5:
+                self.log(f"   • ... e mais {invalidos.total - 5} erros")
+        
+        for chave, descricao in (('tamanho', f"códigos sem {TAMANHO_NCM} dígitos"),
+                                 ('inexistentes', "códigos que não existem na tabela NCM")):
+            ocorrencias = acumulado[chave]
+            if ocorrencias.total:
+                erro = f"{coluna}: {ocorrencias.total} {descricao}"
+                self.erros.append(erro)
+                self.log(f"❌ {erro}")
+                for erro_detalhe in ocorrencias.exemplos:
+                    self.log(f"   • {erro_detalhe}")
+                if ocorrencias.total > 5:
+                    self.log(f"   • ... e mais {ocorrencias.total - 5} erros")
+        if self.tabela_ncm is None:
+            aviso = f"⚠️ {coluna}: tabela NCM não encontrada - códigos não conferidos com a tabela oficial"
+            self.avisos.append(aviso)
+            self.log(aviso)
+        if acumulado['sugestoes']:
+            self.sugestoes_ncm[coluna] = acumulado['sugestoes']
         
         if valores_corrigidos > 0:
-            self.avisos.append(f"⚠️ pNCM: {valores_corrigidos} valores foram limpos/corrigidos")
-            self.log(f"🔧 {valores_corrigidos} valores na coluna pNCM foram corrigidos")
+            self.avisos.append(f"⚠️ {coluna}: {valores_corrigidos} valores foram limpos/corrigidos")
+            self.log(f"🔧 {valores_corrigidos} valores na coluna {coluna} foram corrigidos")
         
-        if not valores_invalidos:
-            self.log("✅ Coluna pNCM validada - todos os valores são numéricos")
+        if not invalidos.total and not acumulado['tamanho'].total and not acumulado['inexistentes'].total:
+            self.log(f"✅ Coluna {coluna} validada - todos os valores são numéricos")
+
+    def validar_pNCM(self):
+        """Validação específica para coluna pNCM - deve ser apenas numérica"""
+        acumulados = self._validar_colunas(self.colunas_ncm, 'ncm')
+        for coluna in self.colunas_ncm:
+            self._emitir_pNCM(coluna, acumulados['ncm'].get(coluna))
+
+    def _iniciar_comparacao(self, colunas):
+        """
+        Estado da comparação com a versão anterior (e da impressão desta versão)
+        para o cabeçalho colunas, ou None se nenhuma das duas foi pedida.
+        """
+        if not self.gerar_impressao and self.anterior is None:
+            return None
+        resolvedor = self.plano.resolver(colunas)
+        ignorar = self.plano.ignorar_na_comparacao
+        comparacao = {
+            'metadados': {
+                'arquivo': os.path.basename(self.arquivo),
+                'perfil': self.plano.nome,
+                'versao_perfil': self.plano.versao,
+                'versao_regras': VERSAO_REGRAS,
+                'versao_ncm': self.tabela_ncm.versao if self.tabela_ncm is not None else None,
+                'colunas': [coluna for coluna in self.colunas_esperadas
+                            if coluna not in ignorar and resolvedor.real(coluna) is not None],
+                'chave': [coluna for coluna in self.plano.chave_produto if resolvedor.real(coluna) is not None],
+                'criado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            },
+            'precos': [coluna for coluna in self.plano.colunas_preco if resolvedor.real(coluna) is not None],
+            'vistas': {},
+            'partes': {'chaves': [], 'hashes': [], 'precos': []},
+            'anterior': None,
+            'reaproveitar': False,
+            'revalidadas': 0,
+            'adicionados': Ocorrencias(MAX_PRODUTOS_DIFERENCA),
+            'alterados': Ocorrencias(MAX_PRODUTOS_DIFERENCA),
+            'precos_alterados': Ocorrencias(MAX_PRODUTOS_DIFERENCA),
+            # Linhas reaproveitadas: unicidade (depende das outras linhas) e colunas fora do hash rodam no bloco todo
+            'completas': {(coluna, op) for coluna, ops in self.plano.operacoes.items()
+                          for op in ops if op == 'unico' or coluna in ignorar},
+        }
+        
+        if self.anterior is not None:
+            try:
+                # Resolvida uma vez só (a releitura em cp1252 chama de novo)
+                self.anterior = obter_anterior(self.anterior, self.plano.nome, self.log)
+            except ImpressaoInvalida as e:
+                self.log(f"⚠️  {e} - sem comparação com a versão anterior")
+                self.anterior = None
+        anterior = self.anterior
+        if anterior is not None:
+            anterior.casadas[:] = False
+            motivo = anterior.incompatibilidade(comparacao['metadados'])
+            if motivo:
+                self.log(f"⚠️  Versão anterior validada com outro(a) {motivo} - todas as linhas serão validadas")
+            elif self.arquivo_corrigido:
+                self.log("ℹ️  Planilha corrigida solicitada - todas as linhas serão validadas e corrigidas")
+            comparacao['anterior'] = anterior
+            comparacao['reaproveitar'] = motivo is None and not self.arquivo_corrigido
+            self.log(f"🔁 Comparando com a versão anterior: {anterior.metadados.get('arquivo')} ({len(anterior)} linhas)")
+        return comparacao
+
+    def _validar_bloco_comparando(self, df, inicio, acumulados, comparacao, progresso=None):
+        """
+        Como _validar_bloco, mas casa cada linha com a versão anterior pela chave
+        do produto e só valida as linhas novas ou alteradas; as demais herdam as
+        falhas guardadas na impressão anterior.
+        """
+        with self.medidor.etapa('comparar_versoes', len(df)):
+            resolvedor = self.plano.resolver(df.columns)
+            metadados = comparacao['metadados']
+            hashes = hash_linhas({coluna: df[resolvedor.real(coluna)] for coluna in metadados['colunas']})
+            visoes = {coluna: _VisaoColuna(df[resolvedor.real(coluna)]) for coluna in metadados['chave']}
+            textos = {coluna: visao.textos_inteiros for coluna, visao in visoes.items()}
+            chaves = pd.Series('', index=df.index, dtype=object)
+            for i, coluna in enumerate(metadados['chave']):
+                chaves = textos[coluna] if i == 0 else chaves + SEPARADOR_CHAVE + textos[coluna]
+            chaves = numerar_chaves(chaves.to_numpy(dtype=object), comparacao['vistas'])
+            precos = {}
+            for coluna in comparacao['precos']:
+                precos[coluna] = self._numeros(df[resolvedor.real(coluna)])
+            partes = comparacao['partes']
+            partes['chaves'].append(chaves)
+            partes['hashes'].append(hashes)
+            partes['precos'].append(precos)
+        
+        anterior = comparacao['anterior']
+        if anterior is None:
+            self._validar_bloco(df, inicio, acumulados, progresso, visoes=visoes)
+            return
+        
+        with self.medidor.etapa('comparar_versoes'):
+            posicoes_anteriores = anterior.posicoes(chaves)
+            casadas = posicoes_anteriores >= 0
+            iguais = casadas & (anterior.hashes[np.maximum(posicoes_anteriores, 0)] == hashes)
+            linhas = _na_planilha(inicio, np.arange(len(df))) + 2
+            colunas_chave = metadados['chave']
+            
+            comparacao['adicionados'].adicionar(
+                np.flatnonzero(~casadas), lambda pos: {'linha': int(linhas[pos]), **descrever_chave(chaves[pos], colunas_chave)}, inicio)
+            comparacao['alterados'].adicionar(
+                np.flatnonzero(casadas & ~iguais),
+                lambda pos: {'linha': int(linhas[pos]), 'linha_anterior': int(posicoes_anteriores[pos]) + 2,
+                             **descrever_chave(chaves[pos], colunas_chave)}, inicio)
+            for coluna, atuais in precos.items():
+                if coluna not in anterior.precos:
+                    continue
+                anteriores = anterior.precos[coluna][np.maximum(posicoes_anteriores, 0)]
+                mudou = casadas & ~iguais & (anteriores != atuais) & ~(np.isnan(anteriores) & np.isnan(atuais))
+                
+                def descrever(pos, coluna=coluna, anteriores=anteriores, atuais=atuais):
+                    preco = {'linha': int(linhas[pos]), **descrever_chave(chaves[pos], colunas_chave), 'coluna': coluna,
+                             'anterior': None if np.isnan(anteriores[pos]) else float(anteriores[pos]),
+                             'atual': None if np.isnan(atuais[pos]) else float(atuais[pos])}
+                    if preco['anterior'] is not None and preco['anterior'] > 0 and preco['atual'] is not None:
+                        preco['variacao_percentual'] = round((preco['atual'] / preco['anterior'] - 1) * 100, 2)
+                    return preco
+                
+                comparacao['precos_alterados'].adicionar(np.flatnonzero(mudou), descrever, inicio)
+        
+        reaproveitar = iguais if comparacao['reaproveitar'] else np.zeros(len(df), dtype=bool)
+        comparacao['revalidadas'] += int((~reaproveitar).sum())
+        if not reaproveitar.any():
+            self._validar_bloco(df, inicio, acumulados, progresso, visoes=visoes)
+            return
+        
+        self._validar_bloco(df, inicio, acumulados, progresso, alteradas=~reaproveitar,
+                            completas=comparacao['completas'], visoes=visoes)
+        with self.medidor.etapa('reaproveitar_falhas', int(reaproveitar.sum())):
+            self._reaproveitar(anterior, posicoes_anteriores[reaproveitar],
+                               _na_planilha(inicio, np.flatnonzero(reaproveitar)), acumulados)
+
+    def _reaproveitar(self, anterior, antigas, novas, acumulados):
+        """
+        Copia do índice anterior as falhas das linhas inalteradas (posições
+        antigas -> novas) e as soma aos contadores e exemplos de cada regra.
+        """
+        ignorar = self.plano.ignorar_na_comparacao
+        for regra, coluna, severidade in anterior.indice.regras():
+            if regra == 'chave_duplicada' or regra in REGRAS_CONSISTENCIA or coluna in ignorar:
+                continue  # recalculadas no arquivo todo
+            posicoes_falhas, valores_falhas = anterior.falhas(regra, coluna)
+            falhou = np.zeros(len(anterior), dtype=bool)
+            falhou[posicoes_falhas] = True
+            falhou = falhou[antigas]
+            # Daqui em diante só as linhas que falharam: posição na planilha nova e valor guardado
+            espalhadas = novas[falhou]
+            linhas = espalhadas + 2
+            valores = valores_falhas[np.searchsorted(posicoes_falhas, antigas[falhou])]
+            com_valores = len(valores_falhas) > 0 and valores_falhas[0] is not None
+            self.indice.registrar(regra, coluna, severidade, espalhadas, np.ones(len(espalhadas), dtype=bool),
+                                  valores if com_valores else None)
+            
+            posicoes = np.arange(len(espalhadas))
+            if regra == 'celula_vazia' or (regra == 'valor_padrao' and coluna not in self.colunas_obrigatorias):
+                acumulados['vazios'].setdefault(coluna, Ocorrencias(10)).adicionar(posicoes, lambda pos: int(linhas[pos]), espalhadas)
+            elif regra == 'nao_numerico':
+                acumulados['numericos'][coluna] = acumulados['numericos'].get(coluna, 0) + len(posicoes)
+            elif regra == 'dominio_invalido':
+                aceitos = ' ou '.join(self.dominios[coluna])
+                acumulados['dominios'].setdefault(coluna, Ocorrencias(5)).adicionar(
+                    posicoes, lambda pos: f"Linha {linhas[pos]}: valor vazio" if valores[pos] == 'nan'
+                    else f"Linha {linhas[pos]}: '{valores[pos]}' (deve ser {aceitos})", espalhadas)
+            elif regra == 'gtin_invalido':
+                formato_ok = pd.Series(valores, dtype=object).str.fullmatch(FORMATO_GTIN).fillna(False).to_numpy(dtype=bool)
+                acumulados['gtin'].setdefault(coluna, Ocorrencias(5)).adicionar(
+                    posicoes, lambda pos: f"Linha {linhas[pos]}: '{valores[pos]}' "
+                    f"({'dígito verificador incorreto' if formato_ok[pos] else 'deve ter 8, 12, 13 ou 14 dígitos'})", espalhadas)
+            elif regra.startswith('ncm_'):
+                acumulado = self._acumulado_ncm(acumulados, coluna)
+                if regra in ('ncm_invalido', 'ncm_corrigido'):
+                    acumulado['corrigidos'] += len(posicoes)
+                if regra == 'ncm_invalido':
+                    com_texto = pd.Series(valores, dtype=object).str.contains(r'[^\W\d_]', regex=True).fillna(False).to_numpy(dtype=bool)
+                    acumulado['invalidos'].adicionar(
+                        posicoes, lambda pos: f"Linha {linhas[pos]}: '{valores[pos]}' "
+                        f"({'contém texto - deve ser apenas numérico' if com_texto[pos] else 'formato inválido'})", espalhadas)
+                elif regra in ('ncm_tamanho_invalido', 'ncm_inexistente'):
+                    sugestoes = acumulado['sugestoes']
+                    self._sugerir_ncm(sugestoes, valores)
+                    
+                    def descrever(pos, regra=regra, sugestoes=sugestoes):
+                        codigo = valores[pos]
+                        motivo = (f"NCM deve ter {TAMANHO_NCM} dígitos, tem {len(codigo)}" if regra == 'ncm_tamanho_invalido'
+                                  else "não existe na tabela NCM")
+                        detalhe = f"; sugestões: {', '.join(sugestoes[codigo])}" if sugestoes.get(codigo) else ""
+                        return f"Linha {linhas[pos]}: '{codigo}' ({motivo}{detalhe})"
+                    
+                    acumulado['tamanho' if regra == 'ncm_tamanho_invalido' else 'inexistentes'].adicionar(posicoes, descrever, espalhadas)
+
+    def _concluir_comparacao(self, comparacao):
+        """Monta a impressão desta versão e o resumo das diferenças para a anterior"""
+        if comparacao is None:
+            return
+        partes = comparacao['partes']
+        precos = {coluna: np.concatenate([bloco[coluna] for bloco in partes['precos']]) if partes['precos'] else []
+                  for coluna in comparacao['precos']}
+        self.impressao = ImpressaoCatalogo(
+            np.concatenate(partes['chaves']) if partes['chaves'] else [],
+            np.concatenate(partes['hashes']) if partes['hashes'] else [],
+            precos, self.indice, comparacao['metadados'])
+        
+        anterior = comparacao['anterior']
+        if anterior is None:
+            return
+        colunas_chave = comparacao['metadados']['chave']
+        removidos = Ocorrencias(MAX_PRODUTOS_DIFERENCA)
+        removidos.adicionar(np.flatnonzero(~anterior.casadas),
+                            lambda pos: {'linha_anterior': int(pos) + 2, **descrever_chave(anterior.chaves[pos], colunas_chave)})
+        adicionados, alterados, precos_alterados = (comparacao['adicionados'], comparacao['alterados'],
+                                                   comparacao['precos_alterados'])
+        reaproveitadas = self.total_linhas - comparacao['revalidadas']
+        self.diferencas = {
+            'anterior': anterior.metadados.get('arquivo'),
+            'linhas_anterior': len(anterior),
+            'adicionados': adicionados.total,
+            'removidos': removidos.total,
+            'alterados': alterados.total,
+            'inalterados': self.total_linhas - adicionados.total - alterados.total,
+            'precos_alterados': precos_alterados.total,
+            'linhas_reaproveitadas': reaproveitadas,
+            'linhas_validadas': comparacao['revalidadas'],
+            'produtos': {
+                'adicionados': adicionados.exemplos,
+                'removidos': removidos.exemplos,
+                'alterados': alterados.exemplos,
+                'precos': precos_alterados.exemplos,
+            },
+        }
+        
+        self.log(f"\n🔁 Diferenças para a versão anterior ({self.diferencas['anterior']}):")
+        self.log(f"   ➕ {adicionados.total} produtos novos")
+        self.log(f"   ➖ {removidos.total} produtos removidos")
+        self.log(f"   ✏️  {alterados.total} produtos alterados ({precos_alterados.total} mudanças de preço)")
+        for preco in precos_alterados.exemplos[:5]:
+            self.log(f"   • Linha {preco['linha']}: {preco['coluna']} {preco['anterior']} -> {preco['atual']}")
+        if reaproveitadas:
+            self.log(f"   ♻️  {reaproveitadas} linhas inalteradas reaproveitadas, {comparacao['revalidadas']} validadas")
+
+    def _corrigir_bloco(self, df, contagem):
+        """
+        Cópia corrigida de um bloco já validado (as correções de NCM de
+        _coletar_ncm já estão no df): textos sem espaços nas pontas, inteiros
+        sem '.0', NCM só com dígitos (com o zero à esquerda que o Excel apagou,
+        se a tabela confirmar), células vazias com o valor padrão e colunas com
+        os nomes esperados. Cada correção é uma operação na coluna inteira.
+        """
+        resolvedor = self.plano.resolver(df.columns)
+        corrigido = df.copy()
+        
+        for real in corrigido.columns:
+            serie = materializar(corrigido[real])
+            if serie.dtype != corrigido[real].dtype:
+                corrigido[real] = serie  # category/string: a planilha sai como na leitura sem tipos
+            # Colunas inteiras com células vazias são lidas como float: voltam a ser inteiros
+            # (não conta como correção - o '.0' não estava no arquivo)
+            if pd.api.types.is_float_dtype(serie):
+                valores = serie.to_numpy()
+                inteiros = np.isfinite(valores) & (valores == np.floor(valores))
+                if inteiros.any():
+                    saida = serie.to_numpy(dtype=object)
+                    saida[inteiros] = valores[inteiros].astype('int64').tolist()
+                    corrigido[real] = saida
+                continue
+            if serie.dtype != object:
+                continue
+            try:
+                limpos = serie.str.strip().fillna(serie)  # não-textos (números, NaN) ficam como estão
+            except AttributeError:
+                continue  # coluna sem nenhum texto
+            contagem['normalizados'] += int((serie.notna() & (limpos != serie)).sum())
+            corrigido[real] = limpos
+        
+        for coluna in self.colunas_ncm:
+            real = resolvedor.real(coluna)
+            if real is None:
+                continue
+            visao = _VisaoColuna(corrigido[real])
+            textos = visao.textos_inteiros
+            digitos = textos.str.replace('.', '', regex=False).str.replace(',', '', regex=False)
+            so_digitos = ~visao.vazios & digitos.str.isdigit().to_numpy()
+            if self.tabela_ncm is not None:
+                curtos = so_digitos & (digitos.str.len() == TAMANHO_NCM - 1).to_numpy()
+                completados = digitos[curtos].str.zfill(TAMANHO_NCM)
+                digitos[curtos] = completados.where(self.tabela_ncm.existem(completados), digitos[curtos])
+            mudou = so_digitos & (digitos != visao.textos).to_numpy()
+            if mudou.any():
+                corrigido[real] = corrigido[real].astype(object)
+                corrigido.loc[mudou, real] = digitos[mudou]
+                contagem['normalizados'] += int(mudou.sum())
+        
+        for coluna, valor_padrao in self.campos_padrao.items():
+            real = resolvedor.real(coluna)
+            if real is None:
+                continue
+            vazios = _VisaoColuna(corrigido[real]).vazios
+            if vazios.any():
+                if corrigido[real].dtype != object:
+                    corrigido[real] = corrigido[real].astype(object)
+                corrigido.loc[vazios, real] = valor_padrao
+                contagem['valores_padrao'][coluna] = contagem['valores_padrao'].get(coluna, 0) + int(vazios.sum())
+        
+        return corrigido.rename(columns={real: esperada for real, esperada in resolvedor.renomeadas()})
+
+    def _novo_escritor(self):
+        encoding, sep = self._dialeto_csv
+        return EscritorPlanilha(self.arquivo_corrigido, sep=sep, encoding=encoding)
+
+    def _novas_correcoes(self):
+        return {'valores_padrao': {}, 'normalizados': 0}
+
+    def _gravar_corrigido(self, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+        """Grava self.df corrigido, um bloco por vez (a cópia corrigida nunca é do arquivo inteiro)"""
+        escritor = self._novo_escritor()
+        contagem = self._novas_correcoes()
+        try:
+            for inicio in range(0, max(len(self.df), 1), tamanho_bloco):
+                escritor.escrever(self._corrigir_bloco(self.df.iloc[inicio:inicio + tamanho_bloco], contagem))
+            escritor.fechar()
+        except Exception:
+            escritor.descartar()
+            raise
+        self._emitir_correcoes(contagem)
+
+    def _emitir_correcoes(self, contagem):
+        preenchidas = sum(contagem['valores_padrao'].values())
+        self.correcoes = {
+            'arquivo': os.path.basename(self.arquivo_corrigido),
+            'valores_padrao': {coluna: contagem['valores_padrao'][coluna]
+                               for coluna in self.campos_padrao if coluna in contagem['valores_padrao']},
+            'celulas_preenchidas': preenchidas,
+            'celulas_normalizadas': contagem['normalizados'],
+        }
+        self.log(f"\n🛠️  Planilha corrigida salva em: {self.arquivo_corrigido}")
+        self.log(f"   • {preenchidas} células vazias preenchidas com o valor padrão")
+        self.log(f"   • {contagem['normalizados']} valores normalizados (espaços nas pontas, NCM)")
 
     def gerar_relatorio_final(self):
         """Gera um relatório final completo da validação"""
@@ -314,7 +1662,7 @@ class ValidadorProdutos:
         self.log("="*80)
         
         self.log(f"📁 Arquivo: {os.path.basename(self.arquivo)}")
-        self.log(f"📊 Total de linhas: {len(self.df) if self.df is not None else 0}")
+        self.log(f"📊 Total de linhas: {self.total_linhas}")
         self.log(f"📋 Colunas esperadas: {len(self.colunas_esperadas)}")
         self.log(f"❌ Total de erros: {len(self.erros)}")
         self.log(f"⚠️  Total de avisos: {len(self.avisos)}")
@@ -322,14 +1670,24 @@ class ValidadorProdutos:
         status = "🎉 ARQUIVO VÁLIDO" if len(self.erros) == 0 else "❌ ARQUIVO COM PROBLEMAS"
         self.log(f"\n{status}")
         
-        nome_relatorio = f"relatorio_produtos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        self.metricas = self.medidor.resumo(self.total_linhas)
+        pico = f", pico de memória {self.metricas['pico_memoria_mb']} MB" if self.metricas['pico_memoria_mb'] else ""
+        self.log(f"⏱️  Tempo de validação: {self.metricas['segundos']:.2f}s"
+                 f" ({self.metricas['linhas_por_segundo'] or 0} linhas/s{pico})")
+        
+        if not self.relatorio_txt:
+            return len(self.erros) == 0
+        
+        # O nome do arquivo entra no relatório: arquivos de um lote terminam no mesmo segundo
+        nome_base = os.path.splitext(os.path.basename(self.arquivo))[0]
+        nome_relatorio = f"relatorio_produtos_{nome_base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
         
         with open(nome_relatorio, 'w', encoding='utf-8') as f:
             f.write("RELATÓRIO DE VALIDAÇÃO - PLANILHA DE PRODUTOS\n")
             f.write("="*60 + "\n\n")
             f.write(f"Arquivo: {self.arquivo}\n")
             f.write(f"Data da validação: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-            f.write(f"Total de linhas: {len(self.df) if self.df is not None else 0}\n")
+            f.write(f"Total de linhas: {self.total_linhas}\n")
             f.write(f"Total de erros: {len(self.erros)}\n")
             f.write(f"Total de avisos: {len(self.avisos)}\n\n")
             
@@ -342,6 +1700,13 @@ class ValidadorProdutos:
                 f.write("AVISOS E SUGESTÕES:\n")
                 for aviso in self.avisos:
                     f.write(f"{aviso}\n")
+            
+            f.write("\nDESEMPENHO POR ETAPA:\n")
+            for etapa in self.metricas['etapas']:
+                linhas_s = f", {etapa['linhas_por_segundo']} linhas/s" if etapa['linhas_por_segundo'] else ""
+                pico = f", pico {etapa['pico_memoria_mb']} MB" if etapa['pico_memoria_mb'] else ""
+                f.write(f"{etapa['etapa']}: {etapa['segundos']:.3f}s{linhas_s}{pico}\n")
+            f.write(f"Total: {self.metricas['segundos']:.3f}s\n")
 
         self.log(f"\n💾 Relatório detalhado salvo em: {nome_relatorio}")
         return len(self.erros) == 0
@@ -349,26 +1714,10 @@ class ValidadorProdutos:
     # NOVO MÉTODO ADICIONADO PARA COMPATIBILIDADE COM APP.PY
     def gerar_relatorio(self):
         """Gera relatório no formato esperado pelo app.py"""
-        import re
-        total_linhas = len(self.df) if self.df is not None else 0
-        
-        # Contar linhas inválidas de forma mais precisa
-        linhas_invalidas = 0
-        
-        # Contar erros que mencionam linhas específicas
-        for erro in self.erros:
-            if 'Linha' in erro:
-                linhas_invalidas += 1
-            elif 'pNCM:' in erro and 'valores com texto/formato inválido' in erro:
-                # Extrair número de linhas inválidas do erro de pNCM
-                match = re.search(r'pNCM: (\d+) valores', erro)
-                if match:
-                    linhas_invalidas += int(match.group(1))
-            elif 'pOrigem CST com valores incorretos:' in erro:
-                # Extrair número de linhas inválidas do erro de pOrigem CST
-                match = re.search(r'valores incorretos: (\d+) casos', erro)
-                if match:
-                    linhas_invalidas += int(match.group(1))
+        total_linhas = self.total_linhas
+        
+        # Linha inválida = falhou em pelo menos uma regra de erro (sem dupla contagem)
+        linhas_invalidas = int(self.indice.mascara_invalidas().sum())
         
         linhas_validas = total_linhas - linhas_invalidas
         
@@ -379,10 +1728,17 @@ class ValidadorProdutos:
                 'linhas_validas': linhas_validas,
                 'linhas_invalidas': linhas_invalidas,
                 'percentual_validas': round((linhas_validas / total_linhas) * 100, 2) if total_linhas > 0 else 0,
+                'arquivo_lido': self.arquivo_lido,
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             },
             'erros': self.erros,
             'warnings': self.avisos,
+            'regras': self.indice.resumo(),
+            'duplicados': self.duplicados,
+            'sugestoes_ncm': self.sugestoes_ncm,
+            'correcoes': self.correcoes,
+            'diferencas': self.diferencas,
+            'metricas': self.metricas or self.medidor.resumo(total_linhas),
             'logs': self.logs
         }
         
@@ -391,20 +1747,212 @@ class ValidadorProdutos:
     def executar_validacao_completa(self):
         """Executa todas as validações em sequência"""
         # Carrega o arquivo
-        if not self.carregar_arquivo():
+        self.progresso('carregar_arquivo', 0)
+        with self.medidor.etapa('carregar_arquivo') as medida:
+            carregado = self.carregar_arquivo()
+            medida['linhas'] += self.total_linhas
+        if not carregado:
+            self.progresso('concluido', 100)
             return self.gerar_relatorio()  # Retorna relatório mesmo com erro
+        self.progresso('carregar_arquivo', 30)
         
-        # Executa todas as validações
-        estrutura_ok = self.verificar_estrutura_colunas()
+        # Executa todas as validações: um passe por coluna com todas as regras dela
+        with self.medidor.etapa('verificar_estrutura_colunas'):
+            estrutura_ok = self.verificar_estrutura_colunas()
+        self.progresso('verificar_estrutura_colunas', 35)
         if estrutura_ok:
-            self.validar_colunas_obrigatorias()
-            self.aplicar_valores_padrao()
-            self.validar_pOrigem_CST()
-            self.validar_pNCM()  # Nova validação específica
-            self.validar_valores_numericos()
+            acumulados = self._novos_acumulados()
+            comparacao = self._iniciar_comparacao(self.df.columns)
+            if comparacao is None:
+                self._validar_bloco(self.df, 0, acumulados, progresso=(35, 95))
+            else:
+                self._validar_bloco_comparando(self.df, 0, acumulados, comparacao, progresso=(35, 95))
+            with self.medidor.etapa('emitir_mensagens'):
+                self.indice.consolidar()
+                self._emitir(acumulados)
+                self._concluir_comparacao(comparacao)
+            if self.arquivo_corrigido:
+                with self.medidor.etapa('planilha_corrigida', self.total_linhas):
+                    self._gravar_corrigido()
         
         # Gera o relatório final (seu método original)
         self.gerar_relatorio_final()
+        self.progresso('concluido', 100)
         
         # Retorna o relatório no formato esperado pelo app.py
         return self.gerar_relatorio()
+
+    def _ler_blocos(self, ext, tamanho_bloco, encoding_forcado=None):
+        """Gera DataFrames de até tamanho_bloco linhas sem carregar o arquivo inteiro"""
+        if ext == '.csv':
+            encoding, sep = self._detectar_dialeto_csv()
+            encoding = encoding_forcado or encoding
+            self._dialeto_csv = (encoding, sep)
+            self.log(f"🔎 Dialeto detectado - Separador: '{sep}', Encoding: {encoding}")
+            tamanho = self._tamanho() or 1
+            tipos = tipos_leitura(self.plano, colunas_csv(self._origem(), sep, encoding))
+            with self._abrir() as f:
+                for bloco in ler_csv_em_blocos(f, sep, encoding, tipos, tamanho_bloco):
+                    self._fracao_lida = f.tell() / tamanho
+                    yield bloco
+        elif ext == '.xlsx':
+            yield from self._ler_blocos_xlsx(tamanho_bloco)
+        else:
+            # xlrd não lê sob demanda: carrega inteiro e processa como um bloco só
+            self.log("⚠️  Arquivos .xls não suportam leitura em blocos - carregando inteiro")
+            yield tipar(pd.read_excel(self._origem(), engine='xlrd', dtype=object), self.plano)
+
+    def _ler_blocos_xlsx(self, tamanho_bloco):
+        """
+        Lê a primeira planilha linha a linha (openpyxl read_only). Os blocos
+        têm os valores das células, como no read_excel com dtype=object, e os
+        tipos do perfil (tipar), como na leitura completa.
+        """
+        from openpyxl import load_workbook
+        
+        def montar(bloco):
+            df = pd.DataFrame(bloco, columns=colunas, dtype=object)
+            return tipar(df.where(df.notna(), np.nan), self.plano)  # células vazias (None) viram NaN
+        
+        wb = load_workbook(self._origem(), read_only=True, data_only=True)
+        try:
+            planilha = wb.worksheets[0]
+            total_estimado = planilha.max_row or 0  # dimensão declarada no arquivo, pode faltar
+            linhas = planilha.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is None:
+                return
+            colunas = [valor if valor is not None else f'Unnamed: {i}' for i, valor in enumerate(cabecalho)]
+            
+            bloco = []
+            lidas = 0
+            vazias = []  # linhas em branco só entram se houver dados depois (como no read_excel)
+            for linha in linhas:
+                linha = (tuple(linha) + (None,) * len(colunas))[:len(colunas)]
+                if all(valor is None for valor in linha):
+                    vazias.append(linha)
+                    continue
+                bloco.extend(vazias)
+                vazias = []
+                bloco.append(linha)
+                if len(bloco) >= tamanho_bloco:
+                    lidas += len(bloco)
+                    if total_estimado:
+                        self._fracao_lida = min(lidas / total_estimado, 1)
+                    yield montar(bloco)
+                    bloco = []
+            if bloco:
+                self._fracao_lida = 1
+                yield montar(bloco)
+        finally:
+            wb.close()
+
+    def _validar_em_blocos(self, ext, tamanho_bloco, encoding_forcado=None):
+        """Passa cada bloco por todas as verificações, guardando só contadores e exemplos"""
+        self._fracao_lida = 0
+        self.indice = IndiceErros()
+        blocos = self._ler_blocos(ext, tamanho_bloco, encoding_forcado)
+        primeiro = self._proximo_bloco(blocos)
+        if primeiro is None:
+            self.log("❌ Arquivo sem dados")
+            return False
+        
+        self._renomear_colunas_unnamed(primeiro)
+        colunas = primeiro.columns
+        self.log(f"📋 Colunas encontradas: {list(colunas)}")
+        
+        with self.medidor.etapa('verificar_estrutura_colunas'):
+            estrutura_ok = self.verificar_estrutura_colunas(colunas)
+        acumulados = self._novos_acumulados()
+        
+        # Cada bloco validado é corrigido e anexado à planilha corrigida em seguida
+        escritor = self._novo_escritor() if estrutura_ok and self.arquivo_corrigido else None
+        correcoes = self._novas_correcoes()
+        comparacao = self._iniciar_comparacao(colunas) if estrutura_ok else None
+        
+        self.total_linhas = 0
+        bloco = primeiro
+        try:
+            while bloco is not None:
+                bloco.columns = colunas
+                if comparacao is not None:
+                    self._validar_bloco_comparando(bloco, self.total_linhas, acumulados, comparacao)
+                elif estrutura_ok:
+                    self._validar_bloco(bloco, self.total_linhas, acumulados)
+                if escritor is not None:
+                    with self.medidor.etapa('planilha_corrigida', len(bloco)):
+                        escritor.escrever(self._corrigir_bloco(bloco, correcoes))
+                self.total_linhas += len(bloco)
+                self.indice.total_linhas = self.total_linhas
+                self.progresso('validar_blocos', 5 + 85 * self._fracao_lida)
+                bloco = self._proximo_bloco(blocos)
+            if escritor is not None:
+                with self.medidor.etapa('planilha_corrigida'):
+                    escritor.fechar()
+        except Exception:
+            if escritor is not None:
+                escritor.descartar()
+            raise
+        
+        self.log(f"📊 Total de linhas: {self.total_linhas}")
+        self.progresso('validar_blocos', 90)
+        
+        if estrutura_ok:
+            with self.medidor.etapa('emitir_mensagens'):
+                self.indice.consolidar()
+                self._emitir(acumulados)
+                self._concluir_comparacao(comparacao)
+                if escritor is not None:
+                    self._emitir_correcoes(correcoes)
+        self.arquivo_lido = True
+        return True
+
+    def _proximo_bloco(self, blocos):
+        """next(blocos), medido como leitura do arquivo"""
+        with self.medidor.etapa('ler_arquivo') as medida:
+            bloco = next(blocos, None)
+            if bloco is not None:
+                medida['linhas'] += len(bloco)
+        return bloco
+
+    def executar_validacao_streaming(self, tamanho_bloco=TAMANHO_BLOCO_PADRAO):
+        """
+        Executa todas as validações lendo o arquivo em blocos de tamanho_bloco linhas.
+        O arquivo nunca fica inteiro em memória (self.df continua None) e o
+        relatório retornado é o mesmo de executar_validacao_completa.
+        """
+        self.log(f"📂 Tentando carregar arquivo {self.arquivo} em blocos de {tamanho_bloco} linhas...")
+        if not self._existe():
+            self.log(f"❌ Arquivo não encontrado: {self.arquivo}")
+            return self.gerar_relatorio()
+        
+        _, ext = os.path.splitext(self.arquivo)
+        ext = ext.lower()
+        if ext not in ['.csv', '.xlsx', '.xls']:
+            self.log(f"❌ Formato de arquivo não suportado: {ext}")
+            return self.gerar_relatorio()
+        
+        self.progresso('carregar_arquivo', 0)
+        erros, avisos = len(self.erros), len(self.avisos)
+        try:
+            ok = self._validar_em_blocos(ext, tamanho_bloco)
+        except UnicodeDecodeError:
+            # A amostra era UTF-8 válido mas o restante do arquivo não: recomeça em cp1252
+            del self.erros[erros:], self.avisos[avisos:]
+            self.log("⚠️  Arquivo não é UTF-8 após a amostra - relendo com cp1252")
+            try:
+                ok = self._validar_em_blocos(ext, tamanho_bloco, encoding_forcado='cp1252')
+            except Exception as e:
+                self.log(f"❌ Erro ao carregar arquivo: {e}")
+                ok = False
+        except Exception as e:
+            self.log(f"❌ Erro ao carregar arquivo: {e}")
+            ok = False
+        
+        if not ok:
+            self.progresso('concluido', 100)
+            return self.gerar_relatorio()
+        
+        self.gerar_relatorio_final()
+        self.progresso('concluido', 100)
+        return self.gerar_relatorio()
@@ -0,0 +1,244 @@
+"""
+Implementação de referência (linha a linha) das validações de produtos.
+
+Mantida apenas para conferir a equivalência das versões vetorizadas de
+ValidadorProdutos: as mensagens e as listas de linhas devem ser idênticas
+(tests/test_validador_referencia.py). Cobre as regras de célula - colunas
+obrigatórias, valores padrão, domínios, NCM e numéricos; unicidade, GTIN e
+consistência vêm da classe vetorizada. Não usar em produção - é lenta em
+arquivos grandes.
+"""
+import math
+
+import pandas as pd
+
+from leitura_tipada import materializar
+from tabela_ncm import TAMANHO_NCM
+from validador_gabaritos import ValidadorProdutos
+
+
+class ValidadorProdutosReferencia(ValidadorProdutos):
+    """Validador com as verificações originais, célula por célula"""
+
+    def _coluna(self, coluna):
+        """(nome real, valores como na leitura sem tipos, coluna é float) ou None se a coluna não está no arquivo"""
+        real = self.plano.resolver(self.df.columns).real(coluna)
+        if real is None:
+            return None
+        serie = materializar(self.df[real])
+        return real, serie, pd.api.types.is_float_dtype(serie)
+
+    @staticmethod
+    def _texto_inteiro(valor, coluna_float):
+        """str() da célula sem espaços; em colunas float (com NaN), 0.0 é lido como '0'"""
+        if coluna_float and math.isfinite(valor) and valor == int(valor):
+            return str(int(valor))
+        return str(valor).strip()
+
+    @staticmethod
+    def _vazio(valor):
+        return pd.isna(valor) or (isinstance(valor, str) and valor.strip() == '')
+
+    def validar_colunas_obrigatorias(self):
+        """Valida as colunas obrigatórias (não podem estar vazias)"""
+        self.log("\n📋 Validando colunas obrigatórias...")
+        for coluna in self.colunas_obrigatorias:
+            lida = self._coluna(coluna)
+            if lida is None:
+                continue
+            linhas_vazias = [idx + 2 for idx, valor in enumerate(lida[1]) if self._vazio(valor)]
+            if linhas_vazias:
+                erro = f"❌ {coluna}: {len(linhas_vazias)} células vazias (linhas: {linhas_vazias[:10]}{'...' if len(linhas_vazias) > 10 else ''})"
+                self.erros.append(erro)
+                self.log(f"❌ {erro}")
+            else:
+                self.log(f"✅ {coluna}: Todas as células preenchidas")
+
+    def aplicar_valores_padrao(self):
+        """Verifica e aplica valores padrão para campos específicos"""
+        self.log("\n🔧 Verificando campos que podem usar valores padrão...")
+
+        for coluna, valor_padrao in self.campos_padrao.items():
+            lida = self._coluna(coluna)
+            if lida is None:
+                continue
+
+            total_vazias = sum(1 for valor in lida[1] if self._vazio(valor))
+            if total_vazias:
+                sugestao = f"{coluna}: {total_vazias} células vazias podem usar valor padrão '{valor_padrao}'"
+                self.avisos.append(sugestao)
+                self.log(f"💡 {sugestao}")
+
+        if not self.avisos:
+            self.log("✅ Todos os campos com valores padrão estão preenchidos")
+
+    def _validar_dominio(self, coluna):
+        lida = self._coluna(coluna)
+        if lida is None:
+            return
+        _, serie, coluna_float = lida
+        aceitos = ' ou '.join(self.dominios[coluna])
+
+        self.log(f"\n🌍 Validando {coluna}...")
+        valores_invalidos = []
+        for idx, valor in enumerate(serie):
+            if pd.isna(valor):
+                valores_invalidos.append(f"Linha {idx + 2}: valor vazio")
+            elif self._texto_inteiro(valor, coluna_float) not in self.dominios[coluna]:
+                valores_invalidos.append(f"Linha {idx + 2}: '{valor}' (deve ser {aceitos})")
+
+        if valores_invalidos:
+            erro = f"{coluna} com valores incorretos: {len(valores_invalidos)} casos"
+            self.erros.append(erro)
+            self.log(f"❌ {erro}")
+            for linha in valores_invalidos[:5]:
+                self.log(f"   {linha}")
+            if len(valores_invalidos) > 5:
+                self.log(f"   ... e mais {len(valores_invalidos) - 5} casos")
+        else:
+            self.log(f"✅ {coluna}: Todos os valores estão corretos ({aceitos})")
+
+    def validar_dominios(self):
+        """Valida as colunas com lista fechada de valores aceitos"""
+        for coluna in self.dominios:
+            self._validar_dominio(coluna)
+
+    def validar_pOrigem_CST(self):
+        """Valida a coluna pOrigem CST (deve ser 0 ou 2)"""
+        if 'pOrigem CST' in self.dominios:
+            self._validar_dominio('pOrigem CST')
+
+    def validar_valores_numericos(self):
+        """Valida campos que devem ser numéricos"""
+        for coluna in self.campos_numericos:
+            lida = self._coluna(coluna)
+            if lida is None:
+                continue
+            valores_invalidos = []
+            for idx, valor in enumerate(lida[1]):
+                if pd.isna(valor):
+                    continue
+                try:
+                    valor_str = str(valor).replace(',', '.')
+                    float(valor_str)
+                except (ValueError, TypeError):
+                    valores_invalidos.append(f"Linha {idx + 2}: '{valor}' (não é numérico)")
+            if valores_invalidos:
+                erro = f"{coluna}: {len(valores_invalidos)} valores não numéricos"
+                self.erros.append(erro)
+
+    def validar_pNCM(self):
+        """Validação específica para as colunas de NCM - devem ser apenas numéricas"""
+        for coluna in self.colunas_ncm:
+            self._validar_ncm(coluna)
+
+    def _validar_ncm(self, coluna):
+        lida = self._coluna(coluna)
+        if lida is None:
+            self.avisos.append(f"⚠️ Coluna {coluna} não encontrada")
+            return
+        real, serie, coluna_float = lida
+
+        self.log(f"🔍 Validando coluna {coluna}...")
+        valores_invalidos = []
+        valores_corrigidos = 0
+        correcoes = {}
+        codigos = []  # (linha, texto, código) dos códigos numéricos, conferidos depois
+
+        for idx, valor in enumerate(serie):
+            if pd.isna(valor):
+                continue
+
+            valor_original = str(valor).strip()
+
+            if not valor_original.replace('.', '').replace(',', '').isdigit():
+                if any(c.isalpha() for c in valor_original):
+                    valores_invalidos.append(f"Linha {idx + 2}: '{valor_original}' (contém texto - deve ser apenas numérico)")
+                    correcoes[idx] = ''
+                    valores_corrigidos += 1
+                    continue
+                try:
+                    valor_numerico = float(valor_original.replace(',', '.'))
+                    if not math.isfinite(valor_numerico):
+                        raise ValueError(valor_original)
+                except (ValueError, TypeError):
+                    valores_invalidos.append(f"Linha {idx + 2}: '{valor_original}' (formato inválido)")
+                    correcoes[idx] = ''
+                    valores_corrigidos += 1
+                    continue
+                if valor_numerico == int(valor_numerico):
+                    correcoes[idx] = int(valor_numerico)
+                    valores_corrigidos += 1
+
+            codigo = self._texto_inteiro(valor, coluna_float).replace('.', '').replace(',', '')
+            if codigo.isdigit():
+                codigos.append((idx + 2, valor_original, codigo))
+
+        tamanho_errado = [(linha, texto, codigo) for linha, texto, codigo in codigos if len(codigo) != TAMANHO_NCM]
+        inexistentes = [] if self.tabela_ncm is None else [
+            (linha, texto, codigo) for linha, texto, codigo in codigos
+            if len(codigo) == TAMANHO_NCM and codigo not in self.tabela_ncm]
+        sugestoes = {}
+        self._sugerir_ncm(sugestoes, [codigo for _, _, codigo in sorted(tamanho_errado + inexistentes)])
+
+        if correcoes:
+            if self.df[real].dtype != object:
+                self.df[real] = serie.astype(object)
+            for idx, corrigido in correcoes.items():
+                self.df.at[self.df.index[idx], real] = corrigido
+
+        if valores_invalidos:
+            erro = f"{coluna}: {len(valores_invalidos)} valores com texto/formato inválido encontrados"
+            self.erros.append(erro)
+            self.log(f"❌ {erro}")
+
+            for erro_detalhe in valores_invalidos[:5]:
+                self.log(f"   • {erro_detalhe}")
+
+            if len(valores_invalidos) > 5:
+                self.log(f"   • ... e mais {len(valores_invalidos) - 5} erros")
+
+        for encontrados, descricao, motivo in (
+                (tamanho_errado, f"códigos sem {TAMANHO_NCM} dígitos",
+                 lambda codigo: f"NCM deve ter {TAMANHO_NCM} dígitos, tem {len(codigo)}"),
+                (inexistentes, "códigos que não existem na tabela NCM", lambda codigo: "não existe na tabela NCM")):
+            if not encontrados:
+                continue
+            erro = f"{coluna}: {len(encontrados)} {descricao}"
+            self.erros.append(erro)
+            self.log(f"❌ {erro}")
+            for linha, texto, codigo in encontrados[:5]:
+                detalhe = f"; sugestões: {', '.join(sugestoes[codigo])}" if sugestoes.get(codigo) else ""
+                self.log(f"   • Linha {linha}: '{texto}' ({motivo(codigo)}{detalhe})")
+            if len(encontrados) > 5:
+                self.log(f"   • ... e mais {len(encontrados) - 5} erros")
+
+        if self.tabela_ncm is None:
+            aviso = f"⚠️ {coluna}: tabela NCM não encontrada - códigos não conferidos com a tabela oficial"
+            self.avisos.append(aviso)
+            self.log(aviso)
+        if sugestoes:
+            self.sugestoes_ncm[coluna] = sugestoes
+
+        if valores_corrigidos > 0:
+            self.avisos.append(f"⚠️ {coluna}: {valores_corrigidos} valores foram limpos/corrigidos")
+            self.log(f"🔧 {valores_corrigidos} valores na coluna {coluna} foram corrigidos")
+
+        if not valores_invalidos and not tamanho_errado and not inexistentes:
+            self.log(f"✅ Coluna {coluna} validada - todos os valores são numéricos")
+
+    def executar_validacao_completa(self):
+        """A sequência da validação completa, com as verificações célula por célula desta classe"""
+        if not self.carregar_arquivo():
+            return self.gerar_relatorio()
+        if self.verificar_estrutura_colunas():
+            self.validar_colunas_obrigatorias()
+            self.aplicar_valores_padrao()
+            self.validar_dominios()
+            self.validar_pNCM()
+            self.validar_valores_numericos()
+            self.validar_unicidade()
+            self.validar_gtin()
+            self.validar_consistencia()
+        self.gerar_relatorio_final()
+        return self.gerar_relatorio()
@@ -0,0 +1,198 @@
+"""
+Comparação entre versões do catálogo de um fornecedor (validação incremental).
+
+Cada validação pode deixar uma impressão digital do catálogo
+(ImpressaoCatalogo): a chave de cada produto (perfil, "comparacao.chave" -
+pCodigo + pReferencia), um hash de 64 bits do conteúdo de cada linha, os
+preços ("comparacao.precos") e o índice de erros por linha. Na versão
+seguinte, as linhas com a mesma chave e o mesmo hash reaproveitam as falhas
+guardadas; só as linhas novas ou alteradas passam pelas regras. As regras
+que dependem das outras linhas (chaves repetidas) sempre rodam no arquivo
+todo.
+
+A impressão só é reaproveitada se foi gerada com o mesmo código de regras,
+o mesmo perfil e a mesma tabela NCM (ver incompatibilidade); senão a
+comparação de produtos continua, mas todas as linhas são validadas.
+
+    python versoes_catalogo.py Castelli_v1_08.2025.csv --salvar castelli_v1.impressao.npz
+    python cli_validacao.py Castelli_v2_09.2025.csv --anterior castelli_v1.impressao.npz
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Separadores dentro da chave do produto: entre colunas e antes do número da ocorrência
+SEPARADOR_CHAVE = '\x1f'
+SEPARADOR_OCORRENCIA = '\x1e'
+
+# Produtos listados por categoria (adicionados, removidos...) no relatório; as contagens são sempre completas
+MAX_PRODUTOS_DIFERENCA = 1000
+
+
+class ImpressaoInvalida(ValueError):
+    """Arquivo de impressão corrompido ou de outro formato"""
+
+
+def numerar_chaves(chaves, vistas):
+    """
+    Torna as chaves únicas numerando as repetições ('a', 'a' -> 'a', 'a\\x1e1'),
+    na ordem do arquivo. vistas (chave -> ocorrências) leva a contagem de um
+    bloco para o seguinte.
+    """
+    serie = pd.Series(chaves, dtype=object)
+    codigos, unicas = pd.factorize(serie)
+    ocorrencia = np.zeros(len(serie), dtype=np.int64)
+    if len(unicas) < len(serie):
+        ocorrencia += pd.Series(codigos).groupby(codigos, sort=False).cumcount().to_numpy()
+    anteriores = np.zeros(len(unicas), dtype=np.int64)
+    if vistas:
+        anteriores = np.fromiter((vistas.get(chave, 0) for chave in unicas), dtype=np.int64, count=len(unicas))
+        ocorrencia += anteriores[codigos]
+    vistas.update(zip(unicas, (anteriores + np.bincount(codigos, minlength=len(unicas))).tolist()))
+    repetidas = ocorrencia > 0
+    if repetidas.any():
+        serie = serie.copy()
+        serie[repetidas] = serie[repetidas] + SEPARADOR_OCORRENCIA + ocorrencia[repetidas].astype(str)
+    return serie.to_numpy(dtype=object)
+
+
+def hash_linhas(colunas):
+    """
+    Hash de 64 bits do conteúdo de cada linha (colunas: nome -> Series do
+    bloco), sobre o texto de cada célula como a validação o vê - o mesmo
+    hash para a célula category, string ou object, lida inteira ou em blocos.
+    Cada valor distinto da coluna é convertido uma vez só.
+    """
+    from validador_gabaritos import _VisaoColuna
+
+    categorias = {}
+    for nome, serie in colunas.items():
+        codigos, unicos = pd.factorize(serie)
+        textos = _VisaoColuna(pd.Series(unicos, dtype=serie.dtype)).textos_inteiros
+        codigos_texto, textos_unicos = pd.factorize(textos)  # valores distintos com o mesmo texto
+        codigos = np.where(codigos >= 0, codigos_texto[np.maximum(codigos, 0)], -1) if len(unicos) else codigos
+        categorias[nome] = pd.Categorical.from_codes(codigos, categories=textos_unicos)
+    # hash_pandas_object combina as colunas de cada linha num uint64, sem laço em Python
+    return pd.util.hash_pandas_object(pd.DataFrame(categorias), index=False).to_numpy()
+
+
+def descrever_chave(chave, colunas):
+    """Chave numerada -> {coluna: valor} (sem o número da ocorrência)"""
+    return dict(zip(colunas, str(chave).split(SEPARADOR_OCORRENCIA)[0].split(SEPARADOR_CHAVE)))
+
+
+class ImpressaoCatalogo:
+    """Chaves, hashes de linha, preços e índice de erros de uma versão validada do catálogo"""
+
+    def __init__(self, chaves, hashes, precos, indice, metadados):
+        self.chaves = np.asarray(chaves, dtype=object)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.precos = {coluna: np.asarray(valores, dtype=np.float64) for coluna, valores in precos.items()}
+        self.indice = indice
+        self.metadados = metadados
+        self._posicoes = None
+        self._falhas = {}
+        self.casadas = np.zeros(len(self.chaves), dtype=bool)  # linhas encontradas na versão nova
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def incompatibilidade(self, metadados):
+        """Motivo para não reaproveitar as falhas guardadas, ou None se a impressão vale para metadados"""
+        for campo, descricao in (('versao_regras', 'código das regras'), ('perfil', 'perfil'),
+                                 ('versao_perfil', 'versão do perfil'), ('versao_ncm', 'tabela NCM'),
+                                 ('colunas', 'conjunto de colunas'), ('chave', 'chave de produto')):
+            if self.metadados.get(campo) != metadados.get(campo):
+                return descricao
+        return None
+
+    def posicoes(self, chaves):
+        """Posição de cada chave nesta versão (-1 se não existir), marcando as encontradas"""
+        if self._posicoes is None:
+            self._posicoes = pd.Index(self.chaves)
+        posicoes = self._posicoes.get_indexer(pd.Index(chaves, dtype=object))
+        self.casadas[posicoes[posicoes >= 0]] = True
+        return posicoes
+
+    def falhas(self, regra, coluna):
+        """(posições ordenadas, valores) das linhas que falharam na regra, calculadas uma vez"""
+        if (regra, coluna) not in self._falhas:
+            self._falhas[(regra, coluna)] = self.indice._posicoes_e_valores(regra, coluna)
+        return self._falhas[(regra, coluna)]
+
+    def salvar(self, caminho):
+        arrays = self.indice.para_arrays(prefixo='indice_')
+        arrays['chaves'] = self.chaves.astype(str)
+        arrays['hashes'] = self.hashes
+        for i, valores in enumerate(self.precos.values()):
+            arrays[f'preco_{i}'] = valores
+        metadados = dict(self.metadados, precos=list(self.precos))
+        arrays['metadados'] = np.array(json.dumps(metadados, ensure_ascii=False))
+        with open(caminho, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def carregar(cls, caminho):
+        from validador_gabaritos import IndiceErros
+
+        try:
+            with np.load(caminho, allow_pickle=False) as dados:
+                metadados = json.loads(str(dados['metadados']))
+                precos = {coluna: dados[f'preco_{i}'] for i, coluna in enumerate(metadados.pop('precos'))}
+                return cls(dados['chaves'].astype(object), dados['hashes'], precos,
+                           IndiceErros.de_arrays(dados, prefixo='indice_'), metadados)
+        except (OSError, ValueError, KeyError) as e:
+            raise ImpressaoInvalida(f"Impressão de catálogo inválida ({caminho}): {e}")
+
+
+def obter_anterior(anterior, perfil, log=None):
+    """
+    ImpressaoCatalogo da versão anterior: a própria impressão, um .npz salvo
+    ou uma planilha (validada agora, inteira, para gerar a impressão).
+    """
+    if anterior is None or isinstance(anterior, ImpressaoCatalogo):
+        return anterior
+    if os.path.splitext(anterior)[1].lower() == '.npz':
+        return ImpressaoCatalogo.carregar(anterior)
+
+    from validador_gabaritos import ValidadorProdutos
+
+    if log:
+        log(f"📂 Validando a versão anterior {os.path.basename(anterior)} para comparação...")
+    validador = ValidadorProdutos(anterior, perfil=perfil, relatorio_txt=False, gerar_impressao=True)
+    validador.executar_validacao_streaming()
+    if validador.impressao is None:
+        raise ImpressaoInvalida(f"Não foi possível validar a versão anterior: {anterior}")
+    return validador.impressao
+
+
+def main(argv=None):
+    from regras_validacao import PERFIL_PADRAO
+
+    parser = argparse.ArgumentParser(description="Grava a impressão de uma versão do catálogo para validações incrementais")
+    parser.add_argument('arquivo', help="Planilha (.csv/.xlsx/.xls) da versão atual")
+    parser.add_argument('--salvar', help="Arquivo .npz da impressão (padrão: <arquivo>.impressao.npz)")
+    parser.add_argument('--perfil', default=os.environ.get('PERFIL_PADRAO', PERFIL_PADRAO), help="Perfil de regras (regras/<perfil>.json)")
+    parser.add_argument('--anterior', help="Impressão (.npz) ou planilha da versão anterior, para validar só o que mudou")
+    args = parser.parse_args(argv)
+
+    from validador_gabaritos import ValidadorProdutos
+
+    destino = args.salvar or f"{os.path.splitext(args.arquivo)[0]}.impressao.npz"
+    validador = ValidadorProdutos(args.arquivo, log_callback=print, perfil=args.perfil, relatorio_txt=False,
+                                  anterior=args.anterior, gerar_impressao=True)
+    validador.executar_validacao_streaming()
+    if validador.impressao is None:
+        print(f"❌ Não foi possível validar {args.arquivo}")
+        return 2
+    validador.impressao.salvar(destino)
+    print(f"💾 Impressão de {len(validador.impressao)} linhas salva em: {destino}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())